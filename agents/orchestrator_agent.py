@@ -1,8 +1,12 @@
 import os
 import sys
 import re
-from datetime import datetime
-from typing import Dict, List
+import asyncio
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List
 from uuid import uuid4
 from dotenv import load_dotenv
 from uagents import Agent, Context, Protocol, Model
@@ -25,6 +29,13 @@ from services.optimizer_service import OptimizerService
 from services.evaluation_service import EvaluationService
 from services.formatting_service import FormattingService
 from services.optimizer_milp import OptimizerMILP
+from services.job_service import BATCH, INTERACTIVE, JobService
+from services.result_cache import ResultCache, approx_nbytes, scenario_fingerprint
+from services.single_flight import SingleFlight
+from services.whatif_service import WhatIfService
+from services.depot_planner import DepotScopedPlanner
+from services.rolling_planner import RollingHorizonPlanner
+from services.telemetry_stream import TelemetryStream
 from services.metta_adapter import MeTTaAdapter
 
 load_dotenv()
@@ -41,6 +52,31 @@ USE_MAILBOX = os.getenv("USE_MAILBOX", "false").lower() in ("1", "true", "yes")
 USE_METTA = os.getenv("USE_METTA", "false").lower() in ("1", "true", "yes")
 BACKEND_DEFAULT = os.getenv("BACKEND", "greedy").lower()
 PRIVATE_MODE = os.getenv("PRIVATE_MODE", "false").lower() in ("1", "true", "yes")
+MILP_WARM_START = os.getenv("MILP_WARM_START", "false").lower() in ("1", "true", "yes")
+MILP_TIME_LIMIT_S = float(os.getenv("MILP_TIME_LIMIT_S", "0")) or None
+MILP_DECOMPOSE = os.getenv("MILP_DECOMPOSE", "false").lower() in ("1", "true", "yes")
+MILP_WORKERS = int(os.getenv("MILP_WORKERS", "0")) or None
+MILP_POOL_CHARGERS = os.getenv("MILP_POOL_CHARGERS", "false").lower() in ("1", "true", "yes")
+MILP_INCREMENTAL = os.getenv("MILP_INCREMENTAL", "true").lower() in ("1", "true", "yes")
+MILP_WINDOW_HOURS = int(os.getenv("MILP_WINDOW_HOURS", "0")) or None
+MILP_WINDOW_OVERLAP_HOURS = int(os.getenv("MILP_WINDOW_OVERLAP_HOURS", "6"))
+SLOT_MINUTES = int(os.getenv("SLOT_MINUTES", "60"))
+FRONTIER_POINTS = int(os.getenv("FRONTIER_POINTS", "5"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+RESULT_CACHE_ENTRIES = int(os.getenv("RESULT_CACHE_ENTRIES", "64"))
+RESULT_CACHE_TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", "900"))
+RESULT_CACHE_MB = float(os.getenv("RESULT_CACHE_MB", "64"))
+WHATIF_BATCH_MAX = int(os.getenv("WHATIF_BATCH_MAX", "200"))
+ROLLING_HORIZON = os.getenv("ROLLING_HORIZON", "false").lower() in ("1", "true", "yes")
+ROLLING_CADENCE_S = float(os.getenv("ROLLING_CADENCE_S", "300"))
+ROLLING_HOUR_S = float(os.getenv("ROLLING_HOUR_S", "3600"))
+TELEMETRY_STREAM_PATH = os.getenv("TELEMETRY_STREAM_PATH", "")
+TELEMETRY_STREAM_BATCH = int(os.getenv("TELEMETRY_STREAM_BATCH", "500"))
+TELEMETRY_STREAM_MAX_DELAY_S = float(os.getenv("TELEMETRY_STREAM_MAX_DELAY_S", "0.25"))
+TELEMETRY_STREAM_QUEUE = int(os.getenv("TELEMETRY_STREAM_QUEUE", "10000"))
+TARIFF = os.getenv("TARIFF", "tou")
+DAY_AHEAD_PRICES_PATH = os.getenv("DAY_AHEAD_PRICES_PATH", "")
+DEPOT_SCOPED_RESOLVE = os.getenv("DEPOT_SCOPED_RESOLVE", "true").lower() in ("1", "true", "yes")
 
 # Metadata to help Agentverse discovery/classification (non-sensitive)
 AGENT_METADATA = {
@@ -68,20 +104,61 @@ def create_text_chat(text: str) -> ChatMessage:
 
 
 telemetry = TelemetryService()
-prices = PriceService()
+prices = PriceService(tariff=TARIFF)
+if DAY_AHEAD_PRICES_PATH:
+    # registered as tariff "day_ahead"; select it with TARIFF=day_ahead
+    prices.load_day_ahead(DAY_AHEAD_PRICES_PATH)
 metta = MeTTaAdapter(metta_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), "kg", "metta_rules.metta"))
 kg = KGService(metta=metta)
 optimizer = OptimizerService(kg=kg, telemetry=telemetry, prices=prices)
 eval_service = EvaluationService()
 formatter = FormattingService()
-milp_optimizer = OptimizerMILP(kg=kg, telemetry=telemetry, prices=prices)
+milp_optimizer = OptimizerMILP(
+    kg=kg,
+    telemetry=telemetry,
+    prices=prices,
+    warm_start=MILP_WARM_START,
+    time_limit_seconds=MILP_TIME_LIMIT_S,
+    decompose=MILP_DECOMPOSE,
+    workers=MILP_WORKERS,
+    pooled=MILP_POOL_CHARGERS,
+    incremental=MILP_INCREMENTAL,
+    window_hours=MILP_WINDOW_HOURS,
+    overlap_hours=MILP_WINDOW_OVERLAP_HOURS,
+)
+# fork the depot solver workers now, before the job, stream and event-loop threads exist
+milp_optimizer.start_pool()
+# all solver work runs here, off the event loop; chat and /optimize are interactive, submitted jobs batch
+jobs = JobService(max_workers=JOB_WORKERS)
+# solved scenarios (schedule + KPIs + preview), keyed by a fingerprint of every input that shapes them
+result_cache = ResultCache(
+    max_entries=RESULT_CACHE_ENTRIES, ttl_seconds=RESULT_CACHE_TTL_S, max_bytes=int(RESULT_CACHE_MB * 1024 * 1024)
+)
+# after a what-if edit, re-solve only the depots it touched and splice them into the previous plan
+planner = DepotScopedPlanner(eval_service)
+# receding-horizon mode: hours since agent start are executed and frozen, only the window ahead is re-planned
+rolling = RollingHorizonPlanner(
+    kg, telemetry, prices, optimizer, milp_optimizer, eval_service, horizon_hours=HORIZON_HOURS, slot_minutes=SLOT_MINUTES
+)
+rolling_epoch = time.time()
+# streamed telemetry events are applied in batches and marked for the rolling planner
+stream = TelemetryStream(
+    telemetry,
+    batch_size=TELEMETRY_STREAM_BATCH,
+    max_delay_s=TELEMETRY_STREAM_MAX_DELAY_S,
+    queue_size=TELEMETRY_STREAM_QUEUE,
+    apply=lambda batch: rolling.ingest(rolling_hour(), batch),
+)
+if TELEMETRY_STREAM_PATH:
+    stream.follow(TELEMETRY_STREAM_PATH)
+whatif = WhatIfService(kg, telemetry, prices, optimizer, milp_optimizer, eval_service, slot_minutes=SLOT_MINUTES)
+# identical cache misses arriving while a solve is running (chat or REST) share that solve
+inflight = SingleFlight()
 
 
-# simple conversational state
-last_schedule = None
-last_kpis = None
-last_horizon = None
-last_objective = None
+# last run per scenario ({"schedule", "kpis", "horizon", "objective"}); chat senders pick their scenario
+last_runs: Dict[str, Dict[str, Any]] = {}
+chat_scenarios: Dict[str, str] = {}
 
 # runtime defaults (mutable without restarting)
 current_default_horizon = HORIZON_HOURS
@@ -89,12 +166,200 @@ current_default_objective = OBJECTIVE_DEFAULT if OBJECTIVE_DEFAULT in ("cost", "
 current_backend = BACKEND_DEFAULT if BACKEND_DEFAULT in ("greedy", "milp") else "greedy"
 
 
+def remember_run(scenario: str, schedule, kpis: Dict, hz: int, obj: str) -> None:
+    last_runs[scenario] = {"schedule": schedule, "kpis": kpis, "horizon": hz, "objective": obj}
+
+
+def scenario_suffix(scenario: str | None) -> str:
+    return f" in scenario '{scenario}'" if scenario and scenario != kg.DEFAULT_SCENARIO else ""
+
+
+def last_schedule_for(scenario: str):
+    run = last_runs.get(scenario)
+    return run["schedule"] if run else None
+
+
+def solve(
+    hz: int,
+    obj: str,
+    backend: str,
+    request_text: str = "",
+    scenario: str | None = None,
+    fleet: List[Dict] | None = None,
+    price_curve: List[float] | None = None,
+    depots: List[str] | None = None,
+    **milp_options,
+):
+    """Blocking solve on the chosen backend and scenario; only ever called from job threads."""
+    view = kg.scenario(scenario)
+    inputs = {"fleet": fleet, "price_curve": price_curve, "depots": depots, "slot_minutes": SLOT_MINUTES}
+    if backend == "milp":
+        return milp_optimizer.optimize(horizon_hours=hz, objective=obj, kg=view, **inputs, **milp_options)
+    return optimizer.optimize(horizon_hours=hz, request_text=request_text, objective=obj, kg=view, **inputs)
+
+
+def solve_scored(
+    hz: int,
+    obj: str,
+    backend: str,
+    request_text: str = "",
+    scenario: str | None = None,
+    price_curve: List[float] | None = None,
+    **milp_options,
+):
+    """Blocking solve plus KPIs, re-solving only the depots touched since the same request last ran."""
+    kg_index = kg.scenario(scenario).compiled()
+    fleet = telemetry.get_fleet_state()["vehicles"]
+    price_curve = price_curve if price_curve is not None else prices.get_prices(hz, SLOT_MINUTES)
+
+    def run(depots):
+        return solve(hz, obj, backend, request_text, scenario, fleet=fleet, price_curve=price_curve, depots=depots, **milp_options)
+
+    if not DEPOT_SCOPED_RESOLVE:
+        schedule = run(None)
+        return schedule, eval_service.compute_kpis(schedule, price_curve)
+    options = effective_milp_options(milp_options) if backend == "milp" else {}
+    key = (scenario or kg.DEFAULT_SCENARIO, hz, obj, backend, tuple(sorted(options.items())))
+    # the MILP peak objective couples depots through the common peak; everything else is per depot
+    separable = backend != "milp" or obj == "cost"
+    return planner.plan(key, run, kg_index, fleet, price_curve, separable)
+
+
+def frontier_points(hz: int, points: int, scenario: str | None = None, start: datetime | None = None):
+    """Cost-vs-peak sweep (always on the MILP backend); returns (peak cap, KPIs) per point."""
+    price_curve = prices.get_prices(hz, SLOT_MINUTES, start=start)
+    schedules = milp_optimizer.frontier(
+        hz, points=points, kg=kg.scenario(scenario), slot_minutes=SLOT_MINUTES, price_curve=price_curve
+    )
+    return [(s.stats["peak_cap_kw"], eval_service.compute_kpis(s, price_curve)) for s in schedules]
+
+
+async def run_compare(
+    hz: int,
+    request_text: str,
+    scenario: str | None = None,
+    priority: int = INTERACTIVE,
+    price_curve: List[float] | None = None,
+):
+    """Solve the cost and peak legs concurrently, off the event loop; returns (cost, peak) schedules."""
+    price_curve = price_curve if price_curve is not None else prices.get_prices(hz, SLOT_MINUTES)
+    backend = current_backend
+    return await asyncio.gather(
+        jobs.run(solve, hz, "cost", backend, request_text, scenario, price_curve=price_curve, priority=priority, kind="optimize"),
+        jobs.run(solve, hz, "peak", backend, request_text, scenario, price_curve=price_curve, priority=priority, kind="optimize"),
+    )
+
+
+def effective_milp_options(options: Dict | None) -> Dict:
+    """MILP options as the solve applies them: unset (None) ones take the optimizer's env defaults."""
+    given = {name: value for name, value in (options or {}).items() if value is not None}
+    return {
+        "warm_start": milp_optimizer.warm_start,
+        "decompose": milp_optimizer.decompose,
+        "pooled": milp_optimizer.pooled,
+        "time_limit_s": milp_optimizer.time_limit_seconds,
+        **given,
+    }
+
+
+def scenario_key(
+    kind: str, hz: int, obj: str, backend: str, price_curve: List[float], scenario: str | None, options: Dict | None = None
+) -> str:
+    """Fingerprint of a request; scenarios in the same KG state share results."""
+    fleet_state = telemetry.fleet_store().fingerprint()
+    # requests that leave an option unset and ones that set it to its default share a key
+    options = effective_milp_options(options) if backend == "milp" else {}
+    kg_state = kg.scenario(scenario).compiled().fingerprint()
+    return scenario_fingerprint(kind, hz, obj, backend, price_curve, kg_state, fleet_state, options)
+
+
+async def optimize_cached(
+    hz: int,
+    obj: str,
+    backend: str,
+    request_text: str,
+    scenario: str | None = None,
+    start: datetime | None = None,
+    **milp_options,
+):
+    """
+    Solve (or reuse) one scenario; returns (schedule, kpis, preview lines). ``start`` is the
+    request's pinned time: the cache key, the solve and the KPIs all use its one price curve.
+    Callers get their own copies, so editing the result never touches the cached entry.
+    """
+    price_curve = prices.get_prices(hz, SLOT_MINUTES, start=start)
+    key = scenario_key("optimize", hz, obj, backend, price_curve, scenario, milp_options)
+
+    async def compute():
+        schedule, kpis = await jobs.run(
+            solve_scored, hz, obj, backend, request_text, scenario, price_curve, kind="optimize", **milp_options
+        )
+        preview = formatter.format_schedule_preview(schedule, max_vehicles=5, max_hours=12)
+        result = (schedule, kpis, preview)
+        result_cache.put(key, result, schedule.nbytes + approx_nbytes(kpis) + approx_nbytes(preview))
+        return result
+
+    entry = result_cache.get(key)
+    if entry is None:
+        entry = await inflight.run(key, compute)
+    schedule, kpis, preview = entry
+    return schedule.copy(), dict(kpis), list(preview)
+
+
+async def compare_cached(hz: int, request_text: str, scenario: str | None = None, start: datetime | None = None):
+    """KPIs of both compare legs, reused while the scenario is unchanged; returns (cost, peak) KPIs."""
+    price_curve = prices.get_prices(hz, SLOT_MINUTES, start=start)
+    key = scenario_key("compare", hz, "", current_backend, price_curve, scenario)
+
+    async def compute():
+        sched_cost, sched_peak = await run_compare(hz, request_text, scenario, price_curve=price_curve)
+        result = tuple(eval_service.compute_kpis_list([sched_cost, sched_peak], price_curve))
+        result_cache.put(key, result, approx_nbytes(result))
+        return result
+
+    entry = result_cache.get(key)
+    if entry is None:
+        entry = await inflight.run(key, compute)
+    return tuple(dict(kpis) for kpis in entry)
+
+
+async def run_frontier(
+    hz: int, points: int, scenario: str | None = None, priority: int = INTERACTIVE, start: datetime | None = None
+):
+    return await jobs.run(frontier_points, hz, points, scenario, start, priority=priority, kind="frontier")
+
+
+def run_job(kind: str, hz: int, obj: str, backend: str, points: int, scenario: str | None = None) -> Dict[str, Any]:
+    """Body of a submitted job; returns a JSON-serializable result. Its legs share the prices of the job's start."""
+    start = datetime.now(timezone.utc)
+    price_curve = prices.get_prices(hz, SLOT_MINUTES, start=start)
+    if kind == "compare":
+        # the peak leg on a helper thread, side by side with the cost leg (as run_compare does)
+        with ThreadPoolExecutor(max_workers=1) as helper:
+            peak_leg = helper.submit(solve, hz, "peak", backend, "job compare", scenario, price_curve=price_curve)
+            sched_cost = solve(hz, "cost", backend, "job compare", scenario, price_curve=price_curve)
+            sched_peak = peak_leg.result()
+        kpis_cost, kpis_peak = eval_service.compute_kpis_list([sched_cost, sched_peak], price_curve)
+        return {"cost": kpis_cost, "peak": kpis_peak, "text": formatter.format_compare(kpis_cost, kpis_peak)}
+    if kind == "frontier":
+        return {"points": [{"peak_cap_kw": float(cap), "kpis": kpis} for cap, kpis in frontier_points(hz, points, scenario, start)]}
+    schedule = solve(hz, obj, backend, f"job {kind} {hz}h {obj}", scenario, price_curve=price_curve)
+    return {
+        "kpis": eval_service.compute_kpis(schedule, price_curve),
+        "schedule": schedule.to_dict(),
+        "solver_stats": schedule.stats,
+    }
+
+
 def parse_intent(text: str) -> dict:
     t = (text or "").lower().strip()
     if not t or t in {"hi", "hello", "hey"}:
         return {"type": "greet"}
     if "help" in t or "commands" in t:
         return {"type": "help"}
+    m = re.match(r"use\s+scenario\s+([\w:.-]+)", t)
+    if m:
+        return {"type": "use_scenario", "scenario": m.group(1)}
     if "status" in t:
         return {"type": "status"}
     if "preview" in t:
@@ -110,6 +375,12 @@ def parse_intent(text: str) -> dict:
     if "explain" in t or "why" in t:
         m = re.search(r"explain\s+(v\w+)", t)
         return {"type": "explain", "vehicle": m.group(1) if m else None}
+    if "frontier" in t or "pareto" in t or "trade-off" in t or "tradeoff" in t:
+        # e.g. "frontier 24h 7 points"
+        m = re.search(r"(\d+)\s*h", t)
+        hz = int(m.group(1)) if m else None
+        m = re.search(r"(\d+)\s*points?", t)
+        return {"type": "frontier", "horizon": hz, "points": int(m.group(1)) if m else None}
     if "compare" in t and "cost" in t and "peak" in t:
         # e.g. "compare cost vs peak"
         m = re.search(r"(\d+)\s*h", t)
@@ -163,6 +434,8 @@ def parse_intent(text: str) -> dict:
 @chat_proto.on_message(ChatMessage)
 async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
     await ctx.send(sender, ChatAcknowledgement(timestamp=datetime.utcnow(), acknowledged_msg_id=msg.msg_id))
+    # one price curve per message, whatever runs it triggers
+    prices_start = datetime.now(timezone.utc)
 
     horizon = current_default_horizon
     request_texts = []
@@ -179,6 +452,9 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
             continue
 
     request = " ".join(request_texts)
+    scenario = chat_scenarios.get(sender, kg.DEFAULT_SCENARIO)
+    view = kg.scenario(scenario)
+    last_schedule = last_schedule_for(scenario)
 
     if saw_start and not request.strip():
         await ctx.send(sender, create_text_chat("Hi! I'm the EV Fleet Charge Optimizer.\n" + formatter.format_help()))
@@ -190,18 +466,16 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
         await ctx.send(sender, create_text_chat(text))
         return
 
+    if intent["type"] == "use_scenario":
+        chat_scenarios[sender] = intent["scenario"]
+        kg.scenario(intent["scenario"])
+        await ctx.send(sender, create_text_chat(f"Using scenario '{intent['scenario']}'. What-ifs and runs now apply to it only."))
+        return
+
     if intent["type"] == "compare":
         hz = intent.get("horizon") or current_default_horizon
         try:
-            price_curve = prices.get_prices(hz)
-            if current_backend == "milp":
-                sched_cost = milp_optimizer.optimize(horizon_hours=hz, objective="cost")
-                sched_peak = milp_optimizer.optimize(horizon_hours=hz, objective="peak")
-            else:
-                sched_cost = optimizer.optimize(horizon_hours=hz, request_text=request, objective="cost")
-                sched_peak = optimizer.optimize(horizon_hours=hz, request_text=request, objective="peak")
-            kpis_cost = eval_service.compute_kpis(schedule=sched_cost, price_curve=price_curve)
-            kpis_peak = eval_service.compute_kpis(schedule=sched_peak, price_curve=price_curve)
+            kpis_cost, kpis_peak = await compare_cached(hz, request, scenario, prices_start)
         except Exception as e:
             await ctx.send(sender, create_text_chat(f"Error while comparing: {e}"))
             return
@@ -209,22 +483,33 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
         await ctx.send(sender, create_text_chat(text))
         return
 
+    if intent["type"] == "frontier":
+        hz = intent.get("horizon") or current_default_horizon
+        try:
+            points = await run_frontier(hz, intent.get("points") or FRONTIER_POINTS, scenario, start=prices_start)
+        except Exception as e:
+            await ctx.send(sender, create_text_chat(f"Error while computing the frontier: {e}"))
+            return
+        await ctx.send(sender, create_text_chat(formatter.format_frontier(points)))
+        return
+
     if intent["type"] == "status":
         status_lines = [
             "EV Fleet Charge Optimizer",
             f"Default horizon: {current_default_horizon}h",
             f"Default objective: {current_default_objective}",
             f"Backend: {current_backend}",
+            f"Scenario: {scenario}",
             (metta.info()),
             ("Private mode: on" if PRIVATE_MODE else "Private mode: off"),
         ]
-        if last_schedule and last_kpis:
+        if last_schedule is not None:
             status_lines.append("Last run available. Try 'preview' or 'explain'.")
         await ctx.send(sender, create_text_chat("\n".join(status_lines)))
         return
 
     if intent["type"] == "preview":
-        if not last_schedule:
+        if last_schedule is None:
             await ctx.send(sender, create_text_chat("No schedule yet. Say 'optimize 24h' to create one."))
             return
         preview = formatter.format_schedule_preview(
@@ -237,13 +522,13 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
         return
 
     if intent["type"] == "explain":
-        if not last_schedule:
+        if last_schedule is None:
             await ctx.send(sender, create_text_chat("No schedule yet. Say 'optimize 24h' first."))
             return
         if intent.get("vehicle"):
             text = formatter.format_vehicle_detail(last_schedule, intent["vehicle"], max_hours=24)
         else:
-            exps = last_schedule.get("explanations", [])
+            exps = last_schedule.explanations
             text = "Top decisions:\n" + "\n".join(f"- {e}" for e in exps[:10])
         await ctx.send(sender, create_text_chat(text))
         return
@@ -279,7 +564,7 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
         depot = intent.get("depot")
         kw = intent.get("kw")
         try:
-            kg.set_site_peak_limit_kw(depot, kw)
+            view.set_site_peak_limit_kw(depot, kw)
         except Exception as e:
             await ctx.send(sender, create_text_chat(f"Failed to set peak: {e}"))
             return
@@ -291,7 +576,7 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
         start = intent.get("start")
         end = intent.get("end")
         try:
-            kg.add_blackout(depot, int(start), int(end))
+            view.add_blackout(depot, int(start), int(end))
         except Exception as e:
             await ctx.send(sender, create_text_chat(f"Failed to add blackout: {e}"))
             return
@@ -299,12 +584,12 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
         return
 
     if intent["type"] == "clear_blackouts":
-        kg.clear_blackouts(intent.get("depot"))
+        view.clear_blackouts(intent.get("depot"))
         await ctx.send(sender, create_text_chat("Cleared blackouts" + (f" for {intent.get('depot')}" if intent.get('depot') else "")))
         return
 
     if intent["type"] == "clear_peak":
-        kg.clear_site_peak_override(intent.get("depot"))
+        view.clear_site_peak_override(intent.get("depot"))
         await ctx.send(sender, create_text_chat("Cleared site peak override" + (f" for {intent.get('depot')}" if intent.get('depot') else "")))
         return
 
@@ -315,29 +600,14 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
             objective = intent["objective"]
 
         try:
-            price_curve = prices.get_prices(horizon)
-            if current_backend == "milp":
-                schedule = milp_optimizer.optimize(horizon_hours=horizon, objective=objective)
-            else:
-                schedule = optimizer.optimize(horizon_hours=horizon, request_text=request, objective=objective)
-            kpis = eval_service.compute_kpis(schedule=schedule, price_curve=price_curve)
+            schedule, kpis, preview_lines = await optimize_cached(horizon, objective, current_backend, request, scenario, prices_start)
         except Exception as e:
             await ctx.send(sender, create_text_chat(f"Error while optimizing: {e}"))
             return
 
-        preview_lines = formatter.format_schedule_preview(schedule, max_vehicles=5, max_hours=12)
-        text = formatter.format_summary(kpis, horizon, objective, schedule.get("explanations", []), preview_lines)
+        text = formatter.format_summary(kpis, horizon, objective, schedule.explanations, preview_lines)
 
-        last_run = {
-            "schedule": schedule,
-            "kpis": kpis,
-            "horizon": horizon,
-            "objective": objective,
-        }
-        globals()["last_schedule"] = last_run["schedule"]
-        globals()["last_kpis"] = last_run["kpis"]
-        globals()["last_horizon"] = last_run["horizon"]
-        globals()["last_objective"] = last_run["objective"]
+        remember_run(scenario, schedule, kpis, horizon, objective)
 
         await ctx.send(sender, create_text_chat(text))
         return
@@ -358,12 +628,19 @@ class KPI(Model):
     total_cost: float
     peak_kw: float
     on_time_pct: float
+    load_factor: float = 0.0
+    energy_shortfall_kwh: float = 0.0
+    per_depot_peak_kw: Dict[str, float] = {}
 
 
 class OptimizeRequest(Model):
     horizon: int | None = None
     objective: str | None = None
     backend: str | None = None
+    warm_start: bool | None = None
+    decompose: bool | None = None
+    pooled: bool | None = None
+    scenario: str | None = None
 
 
 class OptimizeResponse(Model):
@@ -377,17 +654,63 @@ class OptimizeResponse(Model):
     per_vehicle: Dict[str, Dict[str, float]]
     price_curve: List[float]
     remaining_kwh: Dict[str, float]
+    solver_stats: Dict[str, float] = {}
+    chargers: Dict[str, Dict[str, str]] = {}
     message: str | None = None
 
 
 class CompareRequest(Model):
     horizon: int | None = None
+    scenario: str | None = None
 
 
 class CompareResponse(Model):
     text: str
 
 
+class FrontierRequest(Model):
+    horizon: int | None = None
+    points: int | None = None
+    scenario: str | None = None
+
+
+class FrontierPoint(Model):
+    peak_cap_kw: float
+    kpis: KPI
+
+
+class FrontierResponse(Model):
+    horizon: int
+    points: List[FrontierPoint]
+    message: str | None = None
+
+
+class JobSubmitRequest(Model):
+    kind: str = "optimize"  # optimize | compare | frontier
+    horizon: int | None = None
+    objective: str | None = None
+    backend: str | None = None
+    points: int | None = None
+    priority: str = "batch"  # batch | interactive
+    scenario: str | None = None
+
+
+class JobRequest(Model):
+    job_id: str
+
+
+class JobResponse(Model):
+    job_id: str
+    kind: str = ""
+    priority: str = ""
+    status: str
+    submitted_at: float | None = None
+    started_at: float | None = None
+    finished_at: float | None = None
+    result: Dict[str, Any] = {}
+    message: str | None = None
+
+
 class StatusResponse(Model):
     horizon_default: int
     objective_default: str
@@ -395,62 +718,151 @@ class StatusResponse(Model):
     metta: str
     private_mode: bool
     has_last_run: bool
+    scenarios: List[str] = []
+    jobs: Dict[str, int] = {}
+    cache: Dict[str, float] = {}
+    coalescing: Dict[str, float] = {}
+    depot_resolves: Dict[str, float] = {}
+    slot_minutes: int = 60
+    telemetry: Dict[str, float] = {}
+    tariff: str = "tou"
+    price_curves: Dict[str, float] = {}
 
 
 class SitePeakRequest(Model):
     depot: str
     kw: int
+    scenario: str | None = None
 
 
 class BlackoutRequest(Model):
     depot: str
     start: int
     end: int
+    scenario: str | None = None
+
+
+class ScenarioRequest(Model):
+    scenario: str
+
+
+class BlackoutWindow(Model):
+    depot: str
+    start: int
+    end: int
+
+
+class WhatIfVariant(Model):
+    name: str | None = None
+    horizon: int | None = None
+    objective: str | None = None
+    site_peak_kw: Dict[str, float] = {}
+    blackouts: List[BlackoutWindow] = []
+    clear_blackouts: bool = False
+
+
+class WhatIfBatchRequest(Model):
+    variants: List[WhatIfVariant]
+    horizon: int | None = None
+    objective: str | None = None
+    backend: str | None = None
+    scenario: str | None = None  # KG view the deltas apply to
+    baseline: bool = True
+
+
+class WhatIfRow(Model):
+    name: str
+    horizon: int
+    objective: str
+    kpis: KPI | None = None
+    error: str | None = None
+
+
+class WhatIfBatchResponse(Model):
+    rows: List[WhatIfRow]
+    table: List[str] = []
+    message: str | None = None
 
 
 class MessageResponse(Model):
     message: str
 
 
+class VehicleUpdate(Model):
+    id: str
+    soc: float | None = None
+    required_kwh: float | None = None
+    departure_hour: int | None = None
+
+
+class VehicleRecord(Model):
+    id: str
+    battery_kwh: float
+    soc0: float
+    min_soc: float
+    depot_id: str
+    connector: str
+    max_kw: float
+    departure_hour: int
+    required_kwh: float
+
+
+class TelemetryDeltaRequest(Model):
+    updates: List[VehicleUpdate] = []
+    arrivals: List[VehicleRecord] = []
+    departures: List[str] = []
+
+
+class TelemetryEventsRequest(Model):
+    # {"type": "update" | "arrival" | "departure", "id": ..., fields...}, as in the JSONL feed
+    events: List[Dict[str, Any]]
+
+
+class RollingReplanRequest(Model):
+    objective: str | None = None
+    backend: str | None = None
+
+
+class RollingResponse(Model):
+    enabled: bool
+    hour: int
+    window_start: int | None = None
+    horizon: int
+    replans: int
+    kpis: KPI | None = None
+    preview: List[str] = []
+    message: str | None = None
+
+
 @agent.on_rest_post("/optimize", OptimizeRequest, OptimizeResponse)
 async def api_optimize(ctx: Context, req: OptimizeRequest) -> OptimizeResponse:
     hz = req.horizon or current_default_horizon
     obj = req.objective or current_default_objective
     be = req.backend or current_backend
     try:
-        price_curve = prices.get_prices(hz)
-        if be == "milp":
-            schedule = milp_optimizer.optimize(horizon_hours=hz, objective=obj)
-        else:
-            schedule = optimizer.optimize(horizon_hours=hz, request_text=f"api optimize {hz}h {obj}", objective=obj)
-        kpis = eval_service.compute_kpis(schedule=schedule, price_curve=price_curve)
+        requested = {"warm_start": req.warm_start, "decompose": req.decompose, "pooled": req.pooled} if be == "milp" else {}
+        milp_options = {name: value for name, value in requested.items() if value is not None}
+        schedule, kpis, preview_lines = await optimize_cached(
+            hz, obj, be, f"api optimize {hz}h {obj}", req.scenario, datetime.now(timezone.utc), **milp_options
+        )
     except Exception as e:
         return OptimizeResponse(horizon=hz, objective=obj, backend=be, kpis=KPI(total_cost=0.0, peak_kw=0.0, on_time_pct=0.0), preview=[], explanations=[], message=f"error: {e}", per_depot={}, per_vehicle={}, price_curve=[], remaining_kwh={})
 
-    preview_lines = formatter.format_schedule_preview(schedule, max_vehicles=5, max_hours=12)
-    # store last run
-    globals()["last_schedule"] = schedule
-    globals()["last_kpis"] = kpis
-    globals()["last_horizon"] = hz
-    globals()["last_objective"] = obj
-
-    def normalize_keys(input_dict: Dict[str, Dict[int, float]]) -> Dict[str, Dict[str, float]]:
-        normalized: Dict[str, Dict[str, float]] = {}
-        for outer_key, inner in input_dict.items():
-            normalized[outer_key] = {str(hour): float(val) for hour, val in inner.items()}
-        return normalized
+    remember_run(req.scenario or kg.DEFAULT_SCENARIO, schedule, kpis, hz, obj)
 
     return OptimizeResponse(
         horizon=hz,
         objective=obj,
         backend=be,
-        kpis=KPI(total_cost=kpis["total_cost"], peak_kw=kpis["peak_kw"], on_time_pct=kpis["on_time_pct"]),
+        kpis=KPI(**kpis),
         preview=preview_lines,
-        explanations=schedule.get("explanations", [])[:10],
-        per_depot=normalize_keys(schedule.get("per_depot", {})),
-        per_vehicle=normalize_keys(schedule.get("per_vehicle", {})),
-        price_curve=[float(x) for x in price_curve],
-        remaining_kwh={str(k): float(v) for k, v in schedule.get("remaining_kwh", {}).items()},
+        explanations=schedule.explanations[:10],
+        per_depot=schedule.per_depot_dict(str_hours=True),
+        per_vehicle=schedule.per_vehicle_dict(str_hours=True),
+        price_curve=[float(x) for x in schedule.price_curve],
+        remaining_kwh=schedule.remaining_dict(),
+        solver_stats=schedule.stats,
+        chargers={v_id: {str(h): c_id for h, c_id in hours.items()} for v_id, hours in schedule.chargers.items()},
         message=None,
     )
 
@@ -459,21 +871,26 @@ async def api_optimize(ctx: Context, req: OptimizeRequest) -> OptimizeResponse:
 async def api_compare(ctx: Context, req: CompareRequest) -> CompareResponse:
     hz = req.horizon or current_default_horizon
     try:
-        price_curve = prices.get_prices(hz)
-        if current_backend == "milp":
-            sched_cost = milp_optimizer.optimize(horizon_hours=hz, objective="cost")
-            sched_peak = milp_optimizer.optimize(horizon_hours=hz, objective="peak")
-        else:
-            sched_cost = optimizer.optimize(horizon_hours=hz, request_text="api compare", objective="cost")
-            sched_peak = optimizer.optimize(horizon_hours=hz, request_text="api compare", objective="peak")
-        kpis_cost = eval_service.compute_kpis(schedule=sched_cost, price_curve=price_curve)
-        kpis_peak = eval_service.compute_kpis(schedule=sched_peak, price_curve=price_curve)
+        kpis_cost, kpis_peak = await compare_cached(hz, "api compare", req.scenario, datetime.now(timezone.utc))
     except Exception as e:
         return CompareResponse(text=f"error: {e}")
     text = formatter.format_compare(kpis_cost, kpis_peak)
     return CompareResponse(text=text)
 
 
+@agent.on_rest_post("/frontier", FrontierRequest, FrontierResponse)
+async def api_frontier(ctx: Context, req: FrontierRequest) -> FrontierResponse:
+    hz = req.horizon or current_default_horizon
+    try:
+        points = await run_frontier(hz, req.points or FRONTIER_POINTS, req.scenario, start=datetime.now(timezone.utc))
+    except Exception as e:
+        return FrontierResponse(horizon=hz, points=[], message=f"error: {e}")
+    return FrontierResponse(
+        horizon=hz,
+        points=[FrontierPoint(peak_cap_kw=float(cap), kpis=KPI(**kpis)) for cap, kpis in points],
+    )
+
+
 @agent.on_rest_get("/status", StatusResponse)
 async def api_status(ctx: Context) -> StatusResponse:
     return StatusResponse(
@@ -482,15 +899,69 @@ async def api_status(ctx: Context) -> StatusResponse:
         backend=current_backend,
         metta=metta.info(),
         private_mode=PRIVATE_MODE,
-        has_last_run=bool(last_schedule and last_kpis),
+        has_last_run=kg.DEFAULT_SCENARIO in last_runs,
+        scenarios=kg.scenario_names(),
+        jobs=jobs.stats(),
+        cache=result_cache.stats(),
+        coalescing=inflight.stats(),
+        depot_resolves=planner.stats(),
+        slot_minutes=SLOT_MINUTES,
+        telemetry=stream.stats(),
+        tariff=prices.tariff,
+        price_curves=prices.stats(),
     )
 
 
+def job_response(job, message: str | None = None) -> JobResponse:
+    info = job.info()
+    return JobResponse(
+        job_id=info["job_id"],
+        kind=info["kind"],
+        priority=info["priority"],
+        status=info["status"],
+        submitted_at=info["submitted_at"],
+        started_at=info["started_at"],
+        finished_at=info["finished_at"],
+        result=job.result or {},
+        message=message or info["error"],
+    )
+
+
+@agent.on_rest_post("/jobs/submit", JobSubmitRequest, JobResponse)
+async def api_job_submit(ctx: Context, req: JobSubmitRequest) -> JobResponse:
+    if req.kind not in ("optimize", "compare", "frontier"):
+        return JobResponse(job_id="", status="rejected", message=f"unknown job kind '{req.kind}'")
+    hz = req.horizon or current_default_horizon
+    obj = req.objective or current_default_objective
+    be = req.backend or current_backend
+    priority = INTERACTIVE if req.priority == "interactive" else BATCH
+    points = req.points or FRONTIER_POINTS
+    job = jobs.submit(run_job, req.kind, hz, obj, be, points, req.scenario, priority=priority, kind=req.kind)
+    return job_response(job)
+
+
+@agent.on_rest_post("/jobs/poll", JobRequest, JobResponse)
+async def api_job_poll(ctx: Context, req: JobRequest) -> JobResponse:
+    job = jobs.get(req.job_id)
+    if job is None:
+        return JobResponse(job_id=req.job_id, status="unknown", message="no such job")
+    return job_response(job)
+
+
+@agent.on_rest_post("/jobs/cancel", JobRequest, JobResponse)
+async def api_job_cancel(ctx: Context, req: JobRequest) -> JobResponse:
+    job = jobs.get(req.job_id)
+    if job is None:
+        return JobResponse(job_id=req.job_id, status="unknown", message="no such job")
+    cancelled = jobs.cancel(req.job_id)
+    return job_response(job, message=None if cancelled else f"job already {job.status}")
+
+
 @agent.on_rest_post("/whatif/site_peak", SitePeakRequest, MessageResponse)
 async def api_site_peak(ctx: Context, req: SitePeakRequest) -> MessageResponse:
     try:
-        kg.set_site_peak_limit_kw(req.depot, int(req.kw))
-        return MessageResponse(message=f"Set site peak for {req.depot} to {req.kw}kW")
+        kg.scenario(req.scenario).set_site_peak_limit_kw(req.depot, int(req.kw))
+        return MessageResponse(message=f"Set site peak for {req.depot} to {req.kw}kW{scenario_suffix(req.scenario)}")
     except Exception as e:
         return MessageResponse(message=f"error: {e}")
 
@@ -498,10 +969,132 @@ async def api_site_peak(ctx: Context, req: SitePeakRequest) -> MessageResponse:
 @agent.on_rest_post("/whatif/blackout", BlackoutRequest, MessageResponse)
 async def api_blackout(ctx: Context, req: BlackoutRequest) -> MessageResponse:
     try:
-        kg.add_blackout(req.depot, int(req.start), int(req.end))
-        return MessageResponse(message=f"Added blackout for {req.depot} {req.start}-{req.end}h")
+        kg.scenario(req.scenario).add_blackout(req.depot, int(req.start), int(req.end))
+        return MessageResponse(message=f"Added blackout for {req.depot} {req.start}-{req.end}h{scenario_suffix(req.scenario)}")
+    except Exception as e:
+        return MessageResponse(message=f"error: {e}")
+
+
+@agent.on_rest_post("/whatif/batch", WhatIfBatchRequest, WhatIfBatchResponse)
+async def api_whatif_batch(ctx: Context, req: WhatIfBatchRequest) -> WhatIfBatchResponse:
+    if len(req.variants) > WHATIF_BATCH_MAX:
+        return WhatIfBatchResponse(rows=[], message=f"error: at most {WHATIF_BATCH_MAX} variants per batch")
+    variants = [
+        {
+            "name": v.name,
+            "horizon": v.horizon,
+            "objective": v.objective,
+            "site_peak_kw": v.site_peak_kw,
+            "blackouts": [(b.depot, b.start, b.end) for b in v.blackouts],
+            "clear_blackouts": v.clear_blackouts,
+        }
+        for v in req.variants
+    ]
+    hz = req.horizon or current_default_horizon
+    obj = req.objective or current_default_objective
+    be = req.backend or current_backend
+    try:
+        rows = await jobs.run(
+            whatif.evaluate, variants, hz, obj, be, kg.scenario(req.scenario), req.baseline, datetime.now(timezone.utc),
+            priority=BATCH, kind="whatif",
+        )
+    except Exception as e:
+        return WhatIfBatchResponse(rows=[], message=f"error: {e}")
+    return WhatIfBatchResponse(
+        rows=[WhatIfRow(**{**row, "kpis": KPI(**row["kpis"]) if row["kpis"] else None}) for row in rows],
+        table=formatter.format_whatif_table(rows),
+    )
+
+
+def rolling_hour() -> int:
+    """Hours elapsed on the rolling-horizon axis (``ROLLING_HOUR_S`` seconds each)."""
+    return int((time.time() - rolling_epoch) // ROLLING_HOUR_S)
+
+
+def rolling_response(message: str | None = None) -> RollingResponse:
+    plan = rolling.plan
+    return RollingResponse(
+        enabled=ROLLING_HORIZON,
+        hour=rolling_hour(),
+        window_start=rolling.plan_start if plan is not None else None,
+        horizon=rolling.horizon_hours,
+        replans=rolling.replans,
+        kpis=KPI(**rolling.kpis) if rolling.kpis else None,
+        preview=formatter.format_schedule_preview(plan, max_vehicles=5, max_hours=12) if plan is not None else [],
+        message=message,
+    )
+
+
+if ROLLING_HORIZON:
+
+    @agent.on_interval(period=ROLLING_CADENCE_S)
+    async def rolling_tick(ctx: Context):
+        now = rolling_hour()
+        if not rolling.due(now):
+            return
+        try:
+            await jobs.run(
+                rolling.replan, now, current_backend, current_default_objective, start=datetime.now(timezone.utc),
+                priority=BATCH, kind="rolling",
+            )
+        except Exception as e:
+            ctx.logger.warning(f"rolling re-plan at hour {now} failed: {e}")
+
+
+@agent.on_rest_post("/telemetry/delta", TelemetryDeltaRequest, MessageResponse)
+async def api_telemetry_delta(ctx: Context, req: TelemetryDeltaRequest) -> MessageResponse:
+    try:
+        touched = rolling.apply_delta(
+            rolling_hour(),
+            updates=[u.dict() for u in req.updates],
+            arrivals=[a.dict() for a in req.arrivals],
+            departures=req.departures,
+        )
+    except Exception as e:
+        return MessageResponse(message=f"error: {e}")
+    return MessageResponse(message=f"Applied telemetry for {len(touched)} vehicles")
+
+
+@agent.on_rest_post("/telemetry/events", TelemetryEventsRequest, MessageResponse)
+async def api_telemetry_events(ctx: Context, req: TelemetryEventsRequest) -> MessageResponse:
+    try:
+        # blocks while the ingest queue is full (backpressure), so keep it off the event loop
+        queued = await asyncio.to_thread(stream.submit, req.events, 5.0)
+    except queue.Full:
+        return MessageResponse(message="error: telemetry queue is full, retry later")
+    return MessageResponse(message=f"Queued {queued} telemetry events")
+
+
+@agent.on_rest_get("/rolling", RollingResponse)
+async def api_rolling(ctx: Context) -> RollingResponse:
+    return rolling_response()
+
+
+@agent.on_rest_post("/rolling/replan", RollingReplanRequest, RollingResponse)
+async def api_rolling_replan(ctx: Context, req: RollingReplanRequest) -> RollingResponse:
+    obj = req.objective or current_default_objective
+    be = req.backend or current_backend
+    try:
+        await jobs.run(rolling.replan, rolling_hour(), be, obj, start=datetime.now(timezone.utc), kind="rolling")
+    except Exception as e:
+        return rolling_response(message=f"error: {e}")
+    return rolling_response()
+
+
+@agent.on_rest_post("/scenario/drop", ScenarioRequest, MessageResponse)
+async def api_scenario_drop(ctx: Context, req: ScenarioRequest) -> MessageResponse:
+    try:
+        dropped = kg.drop_scenario(req.scenario)
     except Exception as e:
         return MessageResponse(message=f"error: {e}")
+    last_runs.pop(req.scenario, None)
+    if dropped is not None:
+        # live MILP models are keyed by the view's id, which a new view may reuse
+        milp_optimizer.forget(dropped)
+        planner.forget(lambda key: key[0] == req.scenario)
+        for sender in [s for s, name in chat_scenarios.items() if name == req.scenario]:
+            del chat_scenarios[sender]
+    return MessageResponse(message=f"Dropped scenario '{req.scenario}'" if dropped else f"No scenario '{req.scenario}'")
 
 if __name__ == "__main__":
     agent.run()
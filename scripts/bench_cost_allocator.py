@@ -0,0 +1,109 @@
+import os
+import sys
+import random
+import time
+from typing import Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import numpy as np
+
+from services.telemetry_service import TelemetryService
+from services.price_service import PriceService
+from services.kg_service import KGService
+from services.optimizer_service import OptimizerService
+
+
+class SyntheticTelemetry:
+    """Scales the bundled fleet up by cloning vehicles with jittered departures and demand."""
+
+    def __init__(self, base: List[Dict], size: int, seed: int = 7):
+        rng = random.Random(seed)
+        self.vehicles: List[Dict] = []
+        for i in range(size):
+            v = dict(base[i % len(base)])
+            v["id"] = f"v{i + 1}"
+            v["departure_hour"] = rng.randint(2, 23)
+            v["required_kwh"] = float(rng.randint(5, 40))
+            self.vehicles.append(v)
+
+    def get_fleet_state(self) -> Dict[str, List[Dict]]:
+        return {"vehicles": [dict(v) for v in self.vehicles]}
+
+
+class FixedPrices:
+    def __init__(self, curve: List[float]):
+        self.curve = curve
+
+    def get_prices(self, horizon_hours: int, slot_minutes: int = 60, start=None) -> List[float]:
+        return list(self.curve[: horizon_hours * (60 // slot_minutes)])
+
+
+def legacy_cost_allocation(kg, fleet: List[Dict], price_curve: List[float]) -> Dict[str, Dict[int, float]]:
+    """The pre-DepartureQueue cost branch, kept verbatim as the reference implementation."""
+    vehicles_by_depot: Dict[str, List[Dict]] = {}
+    for v in fleet:
+        vehicles_by_depot.setdefault(v["depot_id"], []).append(v)
+    price_order = sorted([(h, p) for h, p in enumerate(price_curve)], key=lambda x: x[1])
+    per_vehicle: Dict[str, Dict[int, float]] = {}
+    remaining_kwh: Dict[str, float] = {v["id"]: float(v["required_kwh"]) for v in fleet}
+
+    for hour, price in price_order:
+        for depot_id, depot_vehicles in vehicles_by_depot.items():
+            if kg.is_blackout(depot_id, hour):
+                continue
+            hour_budget_kw = min(kg.get_site_peak_limit_kw(depot_id), kg.get_total_capacity_kw(depot_id))
+            max_sessions = kg.get_max_concurrent_chargers(depot_id)
+            candidates = [
+                v for v in depot_vehicles
+                if remaining_kwh[v["id"]] > 0 and hour < int(v["departure_hour"]) and v.get("connector")
+            ]
+            candidates.sort(key=lambda v: (int(v["departure_hour"]), remaining_kwh[v["id"]]), reverse=False)
+            sessions = 0
+            allocated_kw_this_hour = 0.0
+            for v in candidates:
+                if sessions >= max_sessions or allocated_kw_this_hour >= hour_budget_kw:
+                    break
+                v_id = v["id"]
+                grant = min(float(v.get("max_kw", 22.0)), remaining_kwh[v_id], hour_budget_kw - allocated_kw_this_hour)
+                if grant <= 0:
+                    continue
+                per_vehicle.setdefault(v_id, {})[hour] = per_vehicle.get(v_id, {}).get(hour, 0.0) + grant
+                remaining_kwh[v_id] -= grant
+                allocated_kw_this_hour += grant
+                sessions += 1
+    return per_vehicle
+
+
+def main():
+    prices = PriceService()
+    kg = KGService()
+    sizes = [int(x) for x in (sys.argv[1:] or ["10", "500", "2000", "5000"])]
+    base = TelemetryService().get_fleet_state()["vehicles"]
+    horizon = 24
+
+    print(f"{'vehicles':>9} {'legacy_s':>10} {'queue_s':>10} {'speedup':>8} identical")
+    for size in sizes:
+        telemetry = SyntheticTelemetry(base, size) if size != len(base) else TelemetryService()
+        # Both implementations must see the same curve even if the clock crosses an hour boundary
+        price_curve = prices.get_prices(horizon)
+        optimizer = OptimizerService(kg=kg, telemetry=telemetry, prices=FixedPrices(price_curve))
+
+        fleet = telemetry.get_fleet_state()["vehicles"]
+        t0 = time.perf_counter()
+        reference = legacy_cost_allocation(kg, fleet, price_curve)
+        t_legacy = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        schedule = optimizer.optimize(horizon_hours=horizon, objective="cost")
+        t_queue = time.perf_counter() - t0
+
+        identical = schedule["per_vehicle"] == reference
+        print(f"{size:>9} {t_legacy:>10.4f} {t_queue:>10.4f} {t_legacy / max(t_queue, 1e-9):>7.1f}x {identical}")
+        if not identical:
+            diff = np.abs(schedule.kw).sum() - sum(sum(a.values()) for a in reference.values())
+            print(f"  mismatch: total kWh delta {diff:+.6f}")
+
+
+if __name__ == "__main__":
+    main()
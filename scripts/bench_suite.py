@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import numpy as np
+
+from services.evaluation_service import EvaluationService
+from services.instance_generator import Instance, generate_instance
+from services.optimizer_milp import OptimizerMILP
+from services.optimizer_service import OptimizerService
+from services.price_service import PriceService
+
+
+RESULTS_FORMAT = 1
+# every run prices the same day, so results do not depend on the clock
+PRICE_START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+QUALITY_FIELDS = ("total_cost", "peak_kw", "on_time_pct", "load_factor", "energy_shortfall_kwh")
+
+
+def run_case(
+    instance: Instance,
+    backend: str,
+    objective: str,
+    price_curve: Sequence[float],
+    repeat: int = 3,
+    time_limit_s: Optional[float] = None,
+    workers: Optional[int] = None,
+) -> Dict:
+    """
+    Benchmark one (instance, backend, objective): best wall time of ``repeat`` solves, peak
+    traced memory of one extra solve, model size and the KPIs of the plan. Memory counts Python
+    and NumPy allocations of this process; the MILP solver's native memory and its worker
+    processes are not seen. A MILP that finds no feasible plan is recorded with status
+    "infeasible" and its error instead of timings.
+    """
+    case = {"backend": backend, "objective": objective, **instance.summary(), "seed": instance.params["seed"]}
+    kg_index = instance.kg_index()
+    fleet = instance.fleet()
+    evaluation = EvaluationService()
+    horizon = instance.params["horizon_hours"]
+    if backend == "milp":
+        optimizer = OptimizerMILP(kg=kg_index, telemetry=None, prices=None, decompose=True, workers=workers)
+
+        def solve():
+            return optimizer.optimize(
+                horizon, objective=objective, kg=kg_index, fleet=fleet.records(), price_curve=price_curve,
+                time_limit_seconds=time_limit_s, incremental=False,
+            )
+    else:
+        optimizer = OptimizerService(kg=kg_index, telemetry=None, prices=None)
+
+        def solve():
+            return optimizer.optimize(horizon, objective=objective, kg=kg_index, fleet=fleet, price_curve=price_curve)
+
+    try:
+        times: List[float] = []
+        for _ in range(max(1, repeat)):
+            t0 = time.perf_counter()
+            schedule = solve()
+            times.append(time.perf_counter() - t0)
+        tracemalloc.start()
+        try:
+            solve()
+            _, peak_bytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    except RuntimeError as e:
+        return {**case, "status": "infeasible", "error": str(e)}
+    finally:
+        if backend == "milp":
+            optimizer.close()
+
+    t0 = time.perf_counter()
+    kpis = evaluation.compute_kpis(schedule, price_curve)
+    kpi_seconds = time.perf_counter() - t0
+    return {
+        **case,
+        "status": "ok",
+        "wall_s": min(times),
+        "wall_s_median": float(np.median(times)),
+        "peak_mem_mb": peak_bytes / 2**20,
+        "kpi_s": kpi_seconds,
+        "variables": schedule.stats.get("variables", 0.0),
+        "constraints": schedule.stats.get("constraints", 0.0),
+        "gap": schedule.stats.get("gap", 0.0),
+        "quality": {field: float(kpis[field]) for field in QUALITY_FIELDS},
+    }
+
+
+def run_suite(
+    sizes: Sequence[int],
+    backends: Sequence[str] = ("greedy", "milp"),
+    objectives: Sequence[str] = ("cost", "peak"),
+    seed: int = 0,
+    horizon_hours: int = 24,
+    repeat: int = 3,
+    milp_max_vehicles: int = 100,
+    time_limit_s: Optional[float] = 10.0,
+    workers: Optional[int] = None,
+    log=print,
+) -> Dict:
+    """Run every size x backend x objective case (MILP only up to ``milp_max_vehicles``) into a results dict."""
+    price_curve = PriceService().get_prices(horizon_hours, start=PRICE_START)
+    runs: List[Dict] = []
+    for size in sizes:
+        instance = generate_instance(size, seed=seed, horizon_hours=horizon_hours)
+        for backend in backends:
+            if backend == "milp" and size > milp_max_vehicles:
+                continue
+            for objective in objectives:
+                run = run_case(instance, backend, objective, price_curve, repeat, time_limit_s, workers)
+                runs.append(run)
+                if log:
+                    log(format_run(run))
+    return {
+        "format": RESULTS_FORMAT,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "params": {
+            "seed": seed, "horizon_hours": horizon_hours, "repeat": repeat,
+            "milp_max_vehicles": milp_max_vehicles, "time_limit_s": time_limit_s,
+        },
+        "runs": runs,
+    }
+
+
+def run_key(run: Dict) -> tuple:
+    return run["backend"], run["objective"], run["vehicles"], run["seed"]
+
+
+def compare_results(
+    current: Dict,
+    baseline: Dict,
+    time_tolerance: float = 0.25,
+    memory_tolerance: float = 0.25,
+    quality_tolerance: float = 0.01,
+    min_seconds: float = 0.05,
+) -> List[str]:
+    """
+    Regressions of ``current`` against ``baseline`` for the cases both contain: slower by more
+    than ``time_tolerance`` (and ``min_seconds``), more memory by more than ``memory_tolerance``,
+    or a worse plan (cost or peak up, on-time share down, shortfall up) by more than
+    ``quality_tolerance`` relative. A case that is infeasible now but was solved in the baseline
+    is a regression; cases infeasible in the baseline are skipped.
+    """
+    previous = {run_key(run): run for run in baseline.get("runs", [])}
+    regressions: List[str] = []
+    for run in current.get("runs", []):
+        base = previous.get(run_key(run))
+        if base is None or base.get("status", "ok") != "ok":
+            continue
+        label = "{} {} {} vehicles".format(*run_key(run)[:3])
+        if run.get("status", "ok") != "ok":
+            regressions.append(f"{label}: {run['status']} ({run.get('error', '')}), solved in the baseline")
+            continue
+        if run["wall_s"] > base["wall_s"] * (1 + time_tolerance) and run["wall_s"] - base["wall_s"] > min_seconds:
+            regressions.append(f"{label}: wall {base['wall_s']:.3f}s -> {run['wall_s']:.3f}s")
+        if run["peak_mem_mb"] > base["peak_mem_mb"] * (1 + memory_tolerance) and run["peak_mem_mb"] - base["peak_mem_mb"] > 1.0:
+            regressions.append(f"{label}: peak memory {base['peak_mem_mb']:.1f}MB -> {run['peak_mem_mb']:.1f}MB")
+        for field, worse in (("total_cost", 1), ("peak_kw", 1), ("energy_shortfall_kwh", 1), ("on_time_pct", -1)):
+            was, now = base["quality"][field], run["quality"][field]
+            if worse * (now - was) > quality_tolerance * max(abs(was), 1.0):
+                regressions.append(f"{label}: {field} {was:.4g} -> {now:.4g}")
+    return regressions
+
+
+def format_run(run: Dict) -> str:
+    if run.get("status", "ok") != "ok":
+        return f"{run['backend']:>6} {run['objective']:>4} {run['vehicles']:>7} {run['status']}: {run.get('error', '')}"
+    q = run["quality"]
+    return (
+        f"{run['backend']:>6} {run['objective']:>4} {run['vehicles']:>7} "
+        f"{run['wall_s']:>9.3f}s {run['peak_mem_mb']:>8.1f}MB {int(run['variables']):>8} vars "
+        f"cost {q['total_cost']:>12.2f} peak {q['peak_kw']:>10.1f} on-time {q['on_time_pct']:>6.1f}% "
+        f"short {q['energy_shortfall_kwh']:>9.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the optimizers on synthetic fleets")
+    parser.add_argument("--sizes", default="10,100,1000,10000,100000", help="comma-separated fleet sizes")
+    parser.add_argument("--backends", default="greedy,milp")
+    parser.add_argument("--objectives", default="cost,peak")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--horizon", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=3, help="solves per case; the fastest counts")
+    parser.add_argument("--milp-max-vehicles", type=int, default=100, help="skip MILP above this fleet size")
+    parser.add_argument("--time-limit", type=float, default=10.0, help="MILP time limit per depot model (s)")
+    parser.add_argument("--workers", type=int, default=None, help="MILP worker processes")
+    parser.add_argument("--out", default="bench_results.json", help="where to write the results JSON")
+    parser.add_argument("--baseline", default=None, help="results JSON to compare against; exit 1 on regressions")
+    parser.add_argument("--time-tolerance", type=float, default=0.25)
+    parser.add_argument("--memory-tolerance", type=float, default=0.25)
+    parser.add_argument("--quality-tolerance", type=float, default=0.01)
+    args = parser.parse_args()
+
+    results = run_suite(
+        sizes=[int(x) for x in args.sizes.split(",") if x],
+        backends=[b for b in args.backends.split(",") if b],
+        objectives=[o for o in args.objectives.split(",") if o],
+        seed=args.seed,
+        horizon_hours=args.horizon,
+        repeat=args.repeat,
+        milp_max_vehicles=args.milp_max_vehicles,
+        time_limit_s=args.time_limit,
+        workers=args.workers,
+    )
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=1)
+    print(f"wrote {len(results['runs'])} runs to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_results(
+            results, baseline, args.time_tolerance, args.memory_tolerance, args.quality_tolerance
+        )
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
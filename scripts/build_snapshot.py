@@ -0,0 +1,54 @@
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from services.fleet_store import FleetStore
+from services.snapshot import Snapshot
+
+
+def main():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Compile the vehicle, charger and site-limit CSVs into a binary snapshot.")
+    parser.add_argument("--out", default=os.path.join(root, "data", "snapshot"), help="snapshot directory")
+    parser.add_argument("--vehicles", help="vehicles CSV (default: data/vehicles.csv)")
+    parser.add_argument("--check", action="store_true", help="only report staleness and checksum mismatches")
+    args = parser.parse_args()
+
+    # the same source paths TelemetryService and KGService check the snapshot against
+    sources = {
+        "vehicles": os.path.abspath(args.vehicles) if args.vehicles else os.path.join(root, "data", "vehicles.csv"),
+        "chargers": os.path.join(root, "data", "chargers.csv"),
+        "site_limits": os.path.join(root, "kg", "site_limits.csv"),
+    }
+
+    if args.check:
+        snapshot = Snapshot.open(args.out)
+        if snapshot is None:
+            print(f"No snapshot at {args.out}")
+            sys.exit(1)
+        stale = [name for name in snapshot.tables() if not snapshot.is_fresh(name, sources.get(name))]
+        corrupt = snapshot.verify()
+        print(f"Snapshot {snapshot.checksum[:12]} at {args.out}: tables {', '.join(snapshot.tables())}")
+        for name in stale:
+            print(f"  stale: {name} (source {sources.get(name)} changed)")
+        for file_name in corrupt:
+            print(f"  checksum mismatch: {file_name}")
+        sys.exit(1 if stale or corrupt else 0)
+
+    tables = {
+        "vehicles": FleetStore.from_frame(pd.read_csv(sources["vehicles"])).to_frame(),
+        "chargers": pd.read_csv(sources["chargers"]),
+    }
+    if os.path.exists(sources["site_limits"]):
+        tables["site_limits"] = pd.read_csv(sources["site_limits"])
+    snapshot = Snapshot.write(args.out, tables, sources=sources, categorical=("depot_id", "connector"))
+    rows = ", ".join(f"{name}={len(df)}" for name, df in tables.items())
+    print(f"Wrote snapshot {snapshot.checksum[:12]} to {args.out} ({rows})")
+
+
+if __name__ == "__main__":
+    main()
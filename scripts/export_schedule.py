@@ -24,13 +24,13 @@ def main():
         objective = "cost"
 
     schedule = optimizer.optimize(horizon_hours=horizon, request_text="export", objective=objective)
-    kpis = eval_service.compute_kpis(schedule=schedule, price_curve=schedule["price_curve"])
+    kpis = eval_service.compute_kpis(schedule=schedule, price_curve=schedule.price_curve)
 
     out_dir = os.getenv("OUT_DIR", "./")
     os.makedirs(out_dir, exist_ok=True)
 
     with open(os.path.join(out_dir, "schedule.json"), "w") as f:
-        json.dump(schedule, f, indent=2)
+        json.dump(schedule.to_dict(), f, indent=2)
     with open(os.path.join(out_dir, "kpis.json"), "w") as f:
         json.dump(kpis, f, indent=2)
 
@@ -27,7 +27,7 @@ def main():
         objective = "cost"
 
     schedule = optimizer.optimize(horizon_hours=horizon, request_text="local demo run", objective=objective)
-    kpis = eval_service.compute_kpis(schedule=schedule, price_curve=schedule["price_curve"])
+    kpis = eval_service.compute_kpis(schedule=schedule, price_curve=schedule.price_curve)
 
     print("EV Fleet Charge Optimizer Demo\n---")
     print(f"Horizon: {horizon}h")
@@ -36,7 +36,7 @@ def main():
     print(f"Peak power: {kpis['peak_kw']:.1f} kW")
     print(f"On-time compliance: {kpis['on_time_pct']:.1f}%")
     print("Top decisions:")
-    for line in schedule.get("explanations", [])[:10]:
+    for line in schedule.explanations[:10]:
         print(" -", line)
 
 
@@ -0,0 +1,143 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+Interval = Tuple[int, int]
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Sort and merge overlapping or touching [start, end) intervals; empty ones are dropped."""
+    merged: List[Interval] = []
+    for start, end in sorted((int(s), int(e)) for s, e in intervals if int(e) > int(s)):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_interval(intervals: List[Interval], start: int, end: int) -> List[Interval]:
+    out: List[Interval] = []
+    for s, e in intervals:
+        if e <= start or s >= end:
+            out.append((s, e))
+            continue
+        if s < start:
+            out.append((s, start))
+        if e > end:
+            out.append((end, e))
+    return out
+
+
+def intersect_intervals(a: List[Interval], b: List[Interval]) -> List[Interval]:
+    """Intersection of two merged interval lists (two-pointer sweep)."""
+    out: List[Interval] = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            out.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return out
+
+
+class BlackoutCalendar:
+    """
+    Per-depot blackout windows.
+
+    Each depot keeps its windows as merged [start, end) hour intervals plus a boolean mask covering
+    hours [0, last end), so per-hour checks are O(1) and whole-depot availability is one slice.
+    """
+
+    def __init__(self):
+        self._intervals: Dict[str, List[Interval]] = {}
+        self._masks: Dict[str, np.ndarray] = {}
+
+    def copy(self) -> "BlackoutCalendar":
+        # masks are never written in place, so they can be shared
+        out = BlackoutCalendar()
+        out._intervals = {d: list(iv) for d, iv in self._intervals.items()}
+        out._masks = dict(self._masks)
+        return out
+
+    def _set(self, depot_id: str, intervals: List[Interval]) -> None:
+        if not intervals:
+            self._intervals.pop(depot_id, None)
+            self._masks.pop(depot_id, None)
+            return
+        mask = np.zeros(intervals[-1][1], dtype=bool)
+        for start, end in intervals:
+            mask[start:end] = True
+        self._intervals[depot_id] = intervals
+        self._masks[depot_id] = mask
+
+    # --- Interval algebra ---
+    def add(self, depot_id: str, start_hour: int, end_hour: int) -> None:
+        """Union a window into the depot's calendar."""
+        depot_id = str(depot_id)
+        start = max(0, int(start_hour))
+        end = max(start, int(end_hour))
+        self._set(depot_id, merge_intervals(self._intervals.get(depot_id, []) + [(start, end)]))
+
+    def remove(self, depot_id: str, start_hour: int, end_hour: int) -> None:
+        """Lift the blackout for hours [start_hour, end_hour), splitting windows if needed."""
+        depot_id = str(depot_id)
+        self._set(depot_id, subtract_interval(self._intervals.get(depot_id, []), int(start_hour), int(end_hour)))
+
+    def intersect(self, depot_id: str, windows: Iterable[Interval]) -> None:
+        """Keep only the blackout hours that also fall inside ``windows``."""
+        depot_id = str(depot_id)
+        self._set(depot_id, intersect_intervals(self._intervals.get(depot_id, []), merge_intervals(windows)))
+
+    def union(self, other: "BlackoutCalendar") -> "BlackoutCalendar":
+        out = self.copy()
+        for depot_id, intervals in other._intervals.items():
+            out._set(depot_id, merge_intervals(out._intervals.get(depot_id, []) + intervals))
+        return out
+
+    def intersection(self, other: "BlackoutCalendar") -> "BlackoutCalendar":
+        out = BlackoutCalendar()
+        for depot_id in set(self._intervals) & set(other._intervals):
+            out._set(depot_id, intersect_intervals(self._intervals[depot_id], other._intervals[depot_id]))
+        return out
+
+    def clear(self, depot_id: Optional[str] = None) -> None:
+        if depot_id is None:
+            self._intervals.clear()
+            self._masks.clear()
+        else:
+            self._set(str(depot_id), [])
+
+    # --- Queries ---
+    def windows(self, depot_id: str) -> List[Interval]:
+        return list(self._intervals.get(str(depot_id), []))
+
+    def depots(self) -> List[str]:
+        return list(self._intervals.keys())
+
+    def is_blackout(self, depot_id: str, hour: int) -> bool:
+        mask = self._masks.get(str(depot_id))
+        h = int(hour)
+        return mask is not None and 0 <= h < len(mask) and bool(mask[h])
+
+    def blackout_mask(self, depot_id: str, horizon: int) -> np.ndarray:
+        out = np.zeros(horizon, dtype=bool)
+        mask = self._masks.get(str(depot_id))
+        if mask is not None:
+            n = min(horizon, len(mask))
+            out[:n] = mask[:n]
+        return out
+
+    def available_mask(self, depot_id: str, horizon: int) -> np.ndarray:
+        return ~self.blackout_mask(depot_id, horizon)
+
+    def available_hours(self, depot_id: str, horizon: int) -> np.ndarray:
+        return np.flatnonzero(self.available_mask(depot_id, horizon))
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, BlackoutCalendar) and self._intervals == other._intervals
@@ -0,0 +1,83 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from services.schedule import Schedule
+
+
+class DepotScopedPlanner:
+    """
+    Depot-scoped re-optimization after what-if edits.
+
+    Remembers, per request key, the last plan and KPIs together with the KG snapshot, fleet and
+    price curve they were solved for. When the same request comes back with only KG changes,
+    ``KGIndex.changed_depots`` names the depots the edits touched: only their vehicles are
+    re-solved, the result is spliced into the remembered plan (``Schedule.splice``) and the KPIs
+    are patched (``EvaluationService.splice_kpis``).
+
+    A full solve runs instead when there is no plan yet, the fleet or prices changed, the request
+    is not ``separable`` (an objective coupling the depots) or more than ``max_fraction`` of the
+    fleet's depots changed.
+    """
+
+    def __init__(self, evaluator, max_plans: int = 32, max_fraction: float = 0.5):
+        self.evaluator = evaluator
+        self.max_plans = max_plans
+        self.max_fraction = max_fraction
+        self._plans: "OrderedDict[Hashable, Tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.full_solves = 0
+        self.scoped_solves = 0
+
+    def plan(
+        self,
+        key: Hashable,
+        solve: Callable[[Optional[List[str]]], Schedule],
+        kg_index,
+        fleet: List[Dict],
+        price_curve: List[float],
+        separable: bool = True,
+    ) -> Tuple[Schedule, Dict]:
+        """
+        Schedule and KPIs for ``key``; ``solve(depots)`` runs the optimizer on those depots (None: all).
+        """
+        with self._lock:
+            previous = self._plans.get(key)
+        changed: Optional[List[str]] = None
+        if previous is not None and separable:
+            prev_index, prev_fleet, prev_curve, prev_schedule, prev_kpis = previous
+            if prev_fleet == fleet and list(prev_curve) == list(price_curve):
+                changed = [d for d in kg_index.changed_depots(prev_index) if d in prev_schedule.depot_index]
+                if len(changed) > self.max_fraction * len(prev_schedule.depot_ids):
+                    changed = None
+
+        if changed is None:
+            schedule = solve(None)
+            kpis = self.evaluator.compute_kpis(schedule, price_curve)
+            self.full_solves += 1
+        elif not changed:
+            schedule, kpis = prev_schedule, prev_kpis
+        else:
+            schedule = prev_schedule.splice(solve(changed))
+            schedule.stats["resolved_depots"] = float(len(changed))
+            kpis = self.evaluator.splice_kpis(prev_kpis, prev_schedule, schedule, changed, price_curve)
+            self.scoped_solves += 1
+
+        with self._lock:
+            self._plans[key] = (kg_index, fleet, list(price_curve), schedule, kpis)
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+        return schedule, kpis
+
+    def forget(self, match: Callable[[Hashable], bool]) -> int:
+        """Drop the plans whose key satisfies ``match`` (e.g. those of a dropped scenario); returns how many."""
+        with self._lock:
+            keys = [key for key in self._plans if match(key)]
+            for key in keys:
+                del self._plans[key]
+        return len(keys)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {"plans": float(len(self._plans)), "full": float(self.full_solves), "scoped": float(self.scoped_solves)}
@@ -1,44 +1,118 @@
-from typing import Dict, List
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from services.schedule import Schedule, as_schedule
 
 
 class EvaluationService:
-    def compute_kpis(self, schedule: Dict, price_curve: List[float]) -> Dict[str, float]:
-        per_vehicle: Dict[str, Dict[int, float]] = schedule.get("per_vehicle", {})
-        per_depot: Dict[str, Dict[int, float]] = schedule.get("per_depot", {})
-        remaining_kwh: Dict[str, float] = schedule.get("remaining_kwh", {})
-
-        # Total cost = sum over hours (sum vehicle kW) * price[$/kWh]
-        max_hour = 0
-        for v_id, alloc in per_vehicle.items():
-            if alloc:
-                max_hour = max(max_hour, max(alloc.keys()))
-        horizon = min(len(price_curve), max_hour + 1) if price_curve else (max_hour + 1)
-
-        total_cost = 0.0
-        for h in range(horizon):
-            hour_kw = sum(alloc.get(h, 0.0) for alloc in per_vehicle.values())
-            price = price_curve[h] if h < len(price_curve) else price_curve[-1]
-            total_cost += hour_kw * price
-
-        # Peak kW across all depots
-        peak_kw = 0.0
-        for h in range(horizon):
-            total_kw_h = 0.0
-            for depot_id, alloc in per_depot.items():
-                total_kw_h += alloc.get(h, 0.0)
-            if total_kw_h > peak_kw:
-                peak_kw = total_kw_h
-
-        # On-time compliance: % vehicles with remaining_kwh <= 0 (met demand)
-        total_vehicles = len(remaining_kwh) if remaining_kwh else len(per_vehicle)
-        met = 0
-        for v_id, rem in remaining_kwh.items():
-            if rem <= 1e-6:
-                met += 1
-        on_time_pct = 100.0 * (met / total_vehicles) if total_vehicles > 0 else 100.0
-
-        return {
-            "total_cost": float(total_cost),
-            "peak_kw": float(peak_kw),
-            "on_time_pct": float(on_time_pct),
-        }
+    """
+    Vectorized KPI engine.
+
+    Every KPI is an array reduction over the schedule matrices. ``compute_kpis_batch`` scores N
+    schedules against M price curves in one call and returns a (N, M, len(KPI_FIELDS)) tensor.
+    Price curves hold one price per schedule slot; energy and cost scale with ``Schedule.slot_hours``.
+    """
+
+    KPI_FIELDS = ("total_cost", "peak_kw", "on_time_pct", "load_factor", "energy_shortfall_kwh")
+
+    def compute_kpis(self, schedule, price_curve: List[float]) -> Dict:
+        sched = as_schedule(schedule)
+        tensor = self.compute_kpis_batch([sched], [price_curve])
+        kpis: Dict = self.kpis_from_row(tensor[0, 0])
+
+        # Per-depot peaks over the scored horizon
+        horizon = self._scored_horizon(sched, len(price_curve))
+        depot_peaks = sched.depot_kw[:, :horizon].max(axis=1) if horizon else np.zeros(len(sched.depot_ids))
+        kpis["per_depot_peak_kw"] = {d: float(p) for d, p in zip(sched.depot_ids, depot_peaks.tolist())}
+        return kpis
+
+    def compute_kpis_list(self, schedules: Sequence, price_curve: List[float]) -> List[Dict[str, float]]:
+        """Score several schedules against one price curve (e.g. both legs of a compare)."""
+        tensor = self.compute_kpis_batch(schedules, [price_curve])
+        return [self.kpis_from_row(tensor[n, 0]) for n in range(tensor.shape[0])]
+
+    def compute_kpis_batch(self, schedules: Sequence, price_curves: Sequence[Sequence[float]]) -> np.ndarray:
+        scheds: List[Schedule] = [as_schedule(s) for s in schedules]
+        n, m = len(scheds), len(price_curves)
+        out = np.zeros((n, m, len(self.KPI_FIELDS)), dtype=float)
+        if n == 0 or m == 0:
+            return out
+
+        # Fleet load per slot, zero-padded to a common width: loads[n, h]
+        width = max(max(s.horizon for s in scheds), max(len(p) for p in price_curves))
+        loads = np.zeros((n, width), dtype=float)
+        for i, s in enumerate(scheds):
+            loads[i, : s.horizon] = s.total_kw
+
+        # Price curves zero-padded: slots past either the schedule or the curve are not scored
+        prices = np.zeros((m, width), dtype=float)
+        for j, curve in enumerate(price_curves):
+            prices[j, : len(curve)] = np.asarray(curve, dtype=float)
+        sched_len = np.array([s.horizon for s in scheds])
+        curve_len = np.array([len(p) for p in price_curves])
+        scored = np.minimum(sched_len[:, None], np.where(curve_len > 0, curve_len, width)[None, :])
+
+        # Total cost = sum over slots (fleet kW) * slot length [h] * price[$/kWh]
+        slot_hours = np.array([s.slot_hours for s in scheds])
+        out[:, :, 0] = (loads @ prices.T) * slot_hours[:, None]
+
+        # Peak and load factor over the scored hours; loads are non-negative so masking with 0 is safe
+        hour_mask = np.arange(width)[None, None, :] < scored[:, :, None]
+        masked = np.where(hour_mask, loads[:, None, :], 0.0)
+        peak = masked.max(axis=2)
+        mean = masked.sum(axis=2) / np.maximum(scored, 1)
+        out[:, :, 1] = peak
+        out[:, :, 3] = np.divide(mean, peak, out=np.zeros_like(peak), where=peak > 0)
+
+        # Price-independent KPIs: on-time compliance and unmet energy
+        on_time = np.array(
+            [100.0 * np.count_nonzero(s.remaining_kwh <= 1e-6) / len(s.remaining_kwh) if len(s.remaining_kwh) else 100.0 for s in scheds]
+        )
+        # same 1e-6 tolerance as on-time, so float dust from the allocators is not reported
+        shortfall = np.array([float(s.remaining_kwh[s.remaining_kwh > 1e-6].sum()) for s in scheds])
+        out[:, :, 2] = on_time[:, None]
+        out[:, :, 4] = shortfall[:, None]
+        return out
+
+    def splice_kpis(self, kpis: Dict, before, after, depots: Sequence[str], price_curve: List[float]) -> Dict:
+        """
+        KPIs of ``after`` derived from those of ``before`` when only the vehicles of ``depots`` changed.
+
+        Cost, on-time count, shortfall and per-depot peaks are patched with the changed depots'
+        contributions; only the fleet load (for peak and load factor) is re-summed.
+        """
+        old, new = as_schedule(before), as_schedule(after)
+        horizon = self._scored_horizon(new, len(price_curve))
+        prices = np.asarray(price_curve, dtype=float)[:horizon]
+        d_rows = [new.depot_index[d] for d in depots if d in new.depot_index]
+        v_rows = np.flatnonzero(np.isin(new.vehicle_depot, d_rows))
+
+        out = dict(kpis)
+        delta_kw = (new.depot_kw[d_rows, :horizon] - old.depot_kw[d_rows, :horizon]).sum(axis=0)
+        out["total_cost"] = kpis["total_cost"] + float(delta_kw @ prices) * new.slot_hours
+        load = new.total_kw[:horizon]
+        peak = float(load.max()) if horizon else 0.0
+        out["peak_kw"] = peak
+        out["load_factor"] = float(load.mean()) / peak if peak > 0 else 0.0
+        n = len(new.remaining_kwh)
+        if n:
+            late_before = np.count_nonzero(old.remaining_kwh[v_rows] > 1e-6)
+            late_after = np.count_nonzero(new.remaining_kwh[v_rows] > 1e-6)
+            out["on_time_pct"] = kpis["on_time_pct"] + 100.0 * float(late_before - late_after) / n
+        gap_before, gap_after = old.remaining_kwh[v_rows], new.remaining_kwh[v_rows]
+        out["energy_shortfall_kwh"] = (
+            kpis["energy_shortfall_kwh"] - float(gap_before[gap_before > 1e-6].sum()) + float(gap_after[gap_after > 1e-6].sum())
+        )
+        per_depot = dict(kpis.get("per_depot_peak_kw", {}))
+        for d in d_rows:
+            per_depot[new.depot_ids[d]] = float(new.depot_kw[d, :horizon].max()) if horizon else 0.0
+        out["per_depot_peak_kw"] = per_depot
+        return out
+
+    def kpis_from_row(self, row: np.ndarray) -> Dict[str, float]:
+        return {name: float(val) for name, val in zip(self.KPI_FIELDS, row.tolist())}
+
+    @staticmethod
+    def _scored_horizon(sched: Schedule, curve_len: int) -> int:
+        return min(curve_len, sched.horizon) if curve_len else sched.horizon
@@ -0,0 +1,400 @@
+import hashlib
+from collections.abc import Sequence
+from typing import Collection, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class FleetStore:
+    """
+    Columnar, read-only snapshot of the fleet used by the optimizer hot loops.
+
+    One typed array per field, all indexed by fleet row:
+      - ids: vehicle ids (str values; object or fixed-width unicode array)
+      - battery_kwh / soc0 / min_soc / max_kw / required_kwh: float64
+      - departure_hour: int64
+      - depot_codes / connector_codes: int32 positions into ``depots`` / ``connectors``
+        (first-appearance order, so grouping by code keeps the fleet's depot order)
+    The arrays are handed out as-is (they are marked read-only); a new store is built whenever
+    the fleet changes. ``records()`` is the legacy list-of-dicts view, built lazily per row.
+    """
+
+    FIELDS = ("id", "battery_kwh", "soc0", "min_soc", "depot_id", "connector", "max_kw", "departure_hour", "required_kwh")
+    FLOAT_FIELDS = ("battery_kwh", "soc0", "min_soc", "max_kw", "required_kwh")
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        columns: Dict[str, np.ndarray],
+        depot_codes: np.ndarray,
+        depots: List[str],
+        connector_codes: np.ndarray,
+        connectors: List[str],
+        version: int = 0,
+    ):
+        self.version = version
+        self.ids = ids
+        self.battery_kwh = columns["battery_kwh"]
+        self.soc0 = columns["soc0"]
+        self.min_soc = columns["min_soc"]
+        self.max_kw = columns["max_kw"]
+        self.required_kwh = columns["required_kwh"]
+        self.departure_hour = columns["departure_hour"]
+        self.depot_codes = depot_codes
+        self.depots = depots
+        self.connector_codes = connector_codes
+        self.connectors = connectors
+        for arr in self._arrays():
+            arr.flags.writeable = False
+        self._fingerprint: Optional[str] = None
+        self._records: Optional["FleetRecords"] = None
+        self._depot_rows: Optional[Dict[str, np.ndarray]] = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, version: int = 0) -> "FleetStore":
+        """Build from a vehicles DataFrame with the ``data/vehicles.csv`` columns."""
+        depot_codes, depots = pd.factorize(df["depot_id"].astype(str), sort=False)
+        connector_codes, connectors = pd.factorize(df["connector"].astype(str), sort=False)
+        columns = {col: df[col].to_numpy(dtype=float, copy=True) for col in cls.FLOAT_FIELDS}
+        columns["departure_hour"] = df["departure_hour"].to_numpy(dtype=np.int64, copy=True)
+        return cls(
+            ids=df["id"].astype(str).to_numpy(dtype=object),
+            columns=columns,
+            depot_codes=depot_codes.astype(np.int32),
+            depots=[str(d) for d in depots],
+            connector_codes=connector_codes.astype(np.int32),
+            connectors=[str(c) for c in connectors],
+            version=version,
+        )
+
+    @classmethod
+    def from_snapshot(cls, table, version: int = 0) -> "FleetStore":
+        """Wrap a ``Snapshot`` vehicles table; the memory-mapped columns are used without copying."""
+        cols = table.columns
+        columns = {col: np.asarray(cols[col], dtype=float) for col in cls.FLOAT_FIELDS}
+        columns["departure_hour"] = np.asarray(cols["departure_hour"], dtype=np.int64)
+        return cls(
+            ids=cols["id"],
+            columns=columns,
+            depot_codes=np.asarray(cols["depot_id"], dtype=np.int32),
+            depots=list(table.categories["depot_id"]),
+            connector_codes=np.asarray(cols["connector"], dtype=np.int32),
+            connectors=list(table.categories["connector"]),
+            version=version,
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """Columns as a DataFrame with the ``data/vehicles.csv`` layout and typed columns."""
+        return pd.DataFrame(
+            {
+                "id": self.ids.astype(str),
+                "battery_kwh": self.battery_kwh,
+                "soc0": self.soc0,
+                "min_soc": self.min_soc,
+                "depot_id": self.depot_ids,
+                "connector": np.asarray(self.connectors, dtype=object)[self.connector_codes] if self.connectors else [],
+                "max_kw": self.max_kw,
+                "departure_hour": self.departure_hour,
+                "required_kwh": self.required_kwh,
+            }
+        )
+
+    @classmethod
+    def from_records(cls, vehicles: Iterable[Dict], version: int = 0) -> "FleetStore":
+        """Build from legacy vehicle dicts (``max_kw`` defaults to 22 kW, a missing connector to "")."""
+        vehicles = list(vehicles)
+        n = len(vehicles)
+        depot_codes, depots = pd.factorize(pd.Series([str(v["depot_id"]) for v in vehicles], dtype=object), sort=False)
+        connector_codes, connectors = pd.factorize(
+            pd.Series([str(v.get("connector") or "") for v in vehicles], dtype=object), sort=False
+        )
+        defaults = {"battery_kwh": 0.0, "soc0": 0.0, "min_soc": 0.0, "max_kw": 22.0}
+        columns = {
+            col: np.fromiter((float(v.get(col, defaults.get(col, 0.0))) for v in vehicles), dtype=float, count=n)
+            for col in cls.FLOAT_FIELDS
+        }
+        columns["departure_hour"] = np.fromiter((int(v["departure_hour"]) for v in vehicles), dtype=np.int64, count=n)
+        return cls(
+            ids=np.array([str(v["id"]) for v in vehicles], dtype=object),
+            columns=columns,
+            depot_codes=depot_codes.astype(np.int32),
+            depots=[str(d) for d in depots],
+            connector_codes=connector_codes.astype(np.int32),
+            connectors=[str(c) for c in connectors],
+            version=version,
+        )
+
+    def __len__(self) -> int:
+        return int(self.ids.shape[0])
+
+    @property
+    def depot_ids(self) -> np.ndarray:
+        """Depot id per row (decoded; a new array)."""
+        return np.asarray(self.depots, dtype=object)[self.depot_codes] if len(self.depots) else np.empty(0, dtype=object)
+
+    @property
+    def has_connector(self) -> np.ndarray:
+        """True for rows with a non-empty connector."""
+        empty = np.array([not c for c in self.connectors], dtype=bool)
+        return ~empty[self.connector_codes] if len(self.connectors) else np.zeros(0, dtype=bool)
+
+    def depot_rows(self) -> Dict[str, np.ndarray]:
+        """Rows of each depot in fleet order, depots in first-appearance order."""
+        if self._depot_rows is None:
+            order = np.argsort(self.depot_codes, kind="stable")
+            bounds = np.searchsorted(self.depot_codes[order], np.arange(len(self.depots) + 1))
+            self._depot_rows = {
+                depot_id: order[bounds[d]: bounds[d + 1]] for d, depot_id in enumerate(self.depots)
+                if bounds[d + 1] > bounds[d]
+            }
+        return self._depot_rows
+
+    def select(self, depots: Collection[str]) -> "FleetStore":
+        """Store restricted to the vehicles of ``depots`` (fleet order kept)."""
+        codes = [d for d, depot_id in enumerate(self.depots) if depot_id in set(depots)]
+        rows = np.flatnonzero(np.isin(self.depot_codes, codes))
+        return self.take(rows)
+
+    def take(self, rows: np.ndarray) -> "FleetStore":
+        """Store of the given rows, in that order; depot and connector codes are re-numbered."""
+        depot_codes, depots = pd.factorize(self.depot_codes[rows], sort=False)
+        connector_codes, connectors = pd.factorize(self.connector_codes[rows], sort=False)
+        columns = {col: getattr(self, col)[rows] for col in self.FLOAT_FIELDS + ("departure_hour",)}
+        return FleetStore(
+            ids=self.ids[rows],
+            columns=columns,
+            depot_codes=depot_codes.astype(np.int32),
+            depots=[self.depots[d] for d in depots.tolist()],
+            connector_codes=connector_codes.astype(np.int32),
+            connectors=[self.connectors[c] for c in connectors.tolist()],
+            version=self.version,
+        )
+
+    def fingerprint(self) -> str:
+        """Content hash of the whole store; equal fleets hash equal whatever their version."""
+        if self._fingerprint is None:
+            digest = hashlib.sha1()
+            digest.update("\0".join(map(str, self.ids.tolist())).encode())
+            digest.update("\0".join(self.depots).encode() + b"\1" + "\0".join(self.connectors).encode())
+            for arr in self._arrays():
+                digest.update(np.ascontiguousarray(arr).tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def records(self) -> "FleetRecords":
+        """Legacy view: one vehicle dict per row, built on first access and reused afterwards."""
+        if self._records is None:
+            self._records = FleetRecords(self)
+        return self._records
+
+    def record(self, row: int) -> Dict:
+        return {
+            "id": str(self.ids[row]),
+            "battery_kwh": float(self.battery_kwh[row]),
+            "soc0": float(self.soc0[row]),
+            "min_soc": float(self.min_soc[row]),
+            "depot_id": self.depots[self.depot_codes[row]],
+            "connector": self.connectors[self.connector_codes[row]],
+            "max_kw": float(self.max_kw[row]),
+            "departure_hour": int(self.departure_hour[row]),
+            "required_kwh": float(self.required_kwh[row]),
+        }
+
+    def _arrays(self) -> List[np.ndarray]:
+        return [
+            self.battery_kwh, self.soc0, self.min_soc, self.max_kw, self.required_kwh, self.departure_hour,
+            self.depot_codes, self.connector_codes,
+        ]
+
+
+class FleetRecords(Sequence):
+    """
+    Lazy list-of-dicts view of a FleetStore (what ``get_fleet_state()["vehicles"]`` returns).
+
+    Rows become dicts on first access and are cached, so the dicts are shared by every caller
+    of the same snapshot and must be treated as read-only (copy before editing, e.g.
+    ``{**v, ...}``). Two views of stores with the same content compare equal without building
+    any dicts; comparing with a plain list compares the dicts.
+    """
+
+    def __init__(self, store: FleetStore):
+        self.store = store
+        self._rows: List[Optional[Dict]] = [None] * len(store)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self._rows)))]
+        row = self._rows[i]
+        if row is None:
+            row = self._rows[i] = self.store.record(range(len(self._rows))[i])
+        return row
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, FleetRecords):
+            return other.store is self.store or other.store.fingerprint() == self.store.fingerprint()
+        if isinstance(other, (list, tuple)):
+            return len(other) == len(self) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"FleetRecords({len(self)} vehicles, version {self.store.version})"
+
+
+def as_fleet_store(fleet) -> FleetStore:
+    """Accept a FleetStore, a FleetRecords view or a list of vehicle dicts."""
+    if isinstance(fleet, FleetStore):
+        return fleet
+    if isinstance(fleet, FleetRecords):
+        return fleet.store
+    return FleetStore.from_records(fleet)
+
+
+class FleetTable:
+    """
+    Mutable in-memory fleet state that telemetry events are applied to one at a time.
+
+    Columns are growable NumPy arrays addressed through an id -> row map, so an update, arrival or
+    departure costs O(1) whatever the fleet size. Departed rows are tombstoned and an arrival
+    appends a row (an arriving id that already exists moves to the end, as a replaced record);
+    ``snapshot`` publishes the live rows in order as an immutable FleetStore and compacts the
+    table once half of it is tombstones.
+    """
+
+    def __init__(self, store: FleetStore):
+        n = len(store)
+        self._n = n
+        self._ids: List[str] = store.ids.tolist()
+        self._alive = np.ones(n, dtype=bool)
+        self._cols: Dict[str, np.ndarray] = {
+            col: np.array(getattr(store, col)) for col in FleetStore.FLOAT_FIELDS + ("departure_hour",)
+        }
+        self._depot_codes = np.array(store.depot_codes)
+        self._connector_codes = np.array(store.connector_codes)
+        self.depots: List[str] = list(store.depots)
+        self.connectors: List[str] = list(store.connectors)
+        self._depot_code = {d: i for i, d in enumerate(self.depots)}
+        self._connector_code = {c: i for i, c in enumerate(self.connectors)}
+        self._row: Dict[str, int] = {v_id: i for i, v_id in enumerate(self._ids)}
+
+    def __len__(self) -> int:
+        return len(self._row)
+
+    def __contains__(self, v_id: str) -> bool:
+        return str(v_id) in self._row
+
+    def update(self, fields: Dict) -> str:
+        """
+        Apply a partial record keyed by ``id`` (ValueError when the id or a field is unknown);
+        returns the id.
+
+        A new ``soc`` replaces ``soc0`` and moves ``required_kwh`` by the energy gained since (the
+        charge target stays put) unless ``required_kwh`` is given as well.
+        """
+        v_id = str(fields.get("id"))
+        row = self._row.get(v_id)
+        if row is None:
+            raise ValueError(f"unknown vehicle {v_id}")
+        values = {k: self._convert(k, val) for k, val in fields.items() if k != "id" and val is not None}
+        if "soc" in values:
+            soc = values.pop("soc")
+            if "required_kwh" not in values:
+                gained = (soc - self._cols["soc0"][row]) * self._cols["battery_kwh"][row]
+                values["required_kwh"] = max(0.0, float(self._cols["required_kwh"][row] - gained))
+            values["soc0"] = soc
+        for col, val in values.items():
+            self._set(row, col, val)
+        return v_id
+
+    def arrive(self, record: Dict) -> str:
+        """Add a full vehicle record (ValueError when fields are missing); returns the id."""
+        missing = [f for f in FleetStore.FIELDS if f not in record]
+        if missing:
+            raise ValueError(f"arrival {record.get('id')} is missing {', '.join(missing)}")
+        v_id = str(record["id"])
+        values = {col: self._convert(col, record[col]) for col in FleetStore.FIELDS[1:]}
+        self.depart(v_id)
+        if self._n == self._alive.shape[0]:
+            self._grow()
+        row = self._n
+        self._n += 1
+        self._ids.append(v_id)
+        self._alive[row] = True
+        self._row[v_id] = row
+        for col, val in values.items():
+            self._set(row, col, val)
+        return v_id
+
+    def depart(self, v_id: str) -> bool:
+        """Drop a vehicle; False when it was not in the table."""
+        row = self._row.pop(str(v_id), None)
+        if row is None:
+            return False
+        self._alive[row] = False
+        return True
+
+    def snapshot(self, version: int = 0) -> FleetStore:
+        """Immutable FleetStore of the live rows in table order."""
+        rows = np.flatnonzero(self._alive[: self._n])
+        if rows.size * 2 < self._n:
+            self._compact(rows)
+            rows = np.arange(self._n)
+        depot_codes, depots = pd.factorize(self._depot_codes[rows], sort=False)
+        connector_codes, connectors = pd.factorize(self._connector_codes[rows], sort=False)
+        ids = np.empty(rows.size, dtype=object)
+        ids[:] = [self._ids[r] for r in rows.tolist()]
+        return FleetStore(
+            ids=ids,
+            columns={col: arr[rows] for col, arr in self._cols.items()},
+            depot_codes=depot_codes.astype(np.int32),
+            depots=[self.depots[d] for d in depots.tolist()],
+            connector_codes=connector_codes.astype(np.int32),
+            connectors=[self.connectors[c] for c in connectors.tolist()],
+            version=version,
+        )
+
+    def _convert(self, col: str, val):
+        if col in ("depot_id", "connector"):
+            return str(val or "")
+        if col == "departure_hour":
+            return int(val)
+        if col in self._cols or col == "soc":
+            return float(val)
+        raise ValueError(f"unknown vehicle field '{col}'")
+
+    def _set(self, row: int, col: str, val) -> None:
+        if col == "depot_id":
+            self._depot_codes[row] = self._code(self._depot_code, self.depots, val)
+        elif col == "connector":
+            self._connector_codes[row] = self._code(self._connector_code, self.connectors, val)
+        else:
+            self._cols[col][row] = val
+
+    @staticmethod
+    def _code(codes: Dict[str, int], names: List[str], name: str) -> int:
+        if name not in codes:
+            codes[name] = len(names)
+            names.append(name)
+        return codes[name]
+
+    def _grow(self) -> None:
+        size = max(16, 2 * self._alive.shape[0])
+        extra = size - self._alive.shape[0]
+        self._alive = np.concatenate((self._alive, np.zeros(extra, dtype=bool)))
+        self._depot_codes = np.concatenate((self._depot_codes, np.zeros(extra, dtype=self._depot_codes.dtype)))
+        self._connector_codes = np.concatenate((self._connector_codes, np.zeros(extra, dtype=self._connector_codes.dtype)))
+        self._cols = {col: np.concatenate((arr, np.zeros(extra, dtype=arr.dtype))) for col, arr in self._cols.items()}
+
+    def _compact(self, rows: np.ndarray) -> None:
+        self._ids = [self._ids[r] for r in rows.tolist()]
+        self._n = len(self._ids)
+        self._alive = np.ones(self._n, dtype=bool)
+        self._depot_codes = self._depot_codes[rows]
+        self._connector_codes = self._connector_codes[rows]
+        self._cols = {col: arr[rows] for col, arr in self._cols.items()}
+        self._row = {v_id: i for i, v_id in enumerate(self._ids)}
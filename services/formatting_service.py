@@ -1,23 +1,26 @@
-from typing import Dict, List
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from services.schedule import as_schedule
 
 
 class FormattingService:
-    def format_schedule_preview(self, schedule: Dict, max_vehicles: int = 5, max_hours: int = 12) -> List[str]:
-        per_vehicle: Dict[str, Dict[int, float]] = schedule.get("per_vehicle", {})
-        if not per_vehicle:
-            return []
+    @staticmethod
+    def _hour_entries(row: np.ndarray, max_hours: int, slot_hours: float = 1.0) -> List[str]:
+        # Compact hour:kw entries for the slots of the first max_hours hours where kw>0 (h2.25 = 2h15m in, with 15-min slots)
+        window = row[: int(round(max_hours / slot_hours))]
+        return [f"h{h * slot_hours:g}:{window[h]:.0f}kW" for h in np.flatnonzero(window > 0).tolist()]
+
+    def format_schedule_preview(self, schedule, max_vehicles: int = 5, max_hours: int = 12) -> List[str]:
+        sched = as_schedule(schedule)
+        # Only vehicles with any allocation are listed, in fleet order
+        charged_rows = np.flatnonzero((sched.kw > 0).any(axis=1))[:max_vehicles]
         lines: List[str] = []
-        for i, (v_id, alloc) in enumerate(per_vehicle.items()):
-            if i >= max_vehicles:
-                break
-            # Build compact hour:kw entries for first max_hours hours where kw>0
-            entries: List[str] = []
-            for h in range(max_hours):
-                kw = alloc.get(h, 0.0)
-                if kw > 0:
-                    entries.append(f"h{h}:{kw:.0f}kW")
+        for r in charged_rows.tolist():
+            entries = self._hour_entries(sched.kw[r], max_hours, sched.slot_hours)
             if entries:
-                lines.append(f"- {v_id}: " + ", ".join(entries))
+                lines.append(f"- {sched.vehicle_ids[r]}: " + ", ".join(entries))
         return lines
 
     def format_help(self) -> str:
@@ -32,12 +35,14 @@ class FormattingService:
             "- preview (or 'preview 10 vehicles 24h')",
             "- explain (or 'explain v5')",
             "- compare cost vs peak",
+            "- frontier 24h 5 points (cost vs peak trade-off)",
             "- set default objective peak | cost",
             "- set default horizon 24h",
             "- set site peak D1 40kW",
             "- blackout D2 18-22h",
             "- clear blackouts [D1]",
             "- clear peak [D1]",
+            "- use scenario storm (what-ifs and runs stay in that scenario; 'use scenario default' to go back)",
             "You can also say: 'optimize for 24h with peak flattening'",
         ]
         return "\n".join(lines)
@@ -66,16 +71,12 @@ class FormattingService:
             lines.extend(preview_lines)
         return "\n".join(lines)
 
-    def format_vehicle_detail(self, schedule: Dict, vehicle_id: str, max_hours: int = 24) -> str:
-        per_vehicle: Dict[str, Dict[int, float]] = schedule.get("per_vehicle", {})
-        alloc = per_vehicle.get(vehicle_id)
-        if not alloc:
+    def format_vehicle_detail(self, schedule, vehicle_id: str, max_hours: int = 24) -> str:
+        sched = as_schedule(schedule)
+        row = sched.vehicle_index.get(vehicle_id)
+        if row is None or not (sched.kw[row] > 0).any():
             return f"No entries for {vehicle_id}"
-        entries: List[str] = []
-        for h in range(max_hours):
-            kw = alloc.get(h, 0.0)
-            if kw > 0:
-                entries.append(f"h{h}:{kw:.0f}kW")
+        entries = self._hour_entries(sched.kw[row], max_hours, sched.slot_hours)
         body = ", ".join(entries) if entries else "(no power assigned)"
         return f"{vehicle_id}: {body}"
 
@@ -88,3 +89,34 @@ class FormattingService:
             f"Δ Peak: {(peak_kpis['peak_kw']-cost_kpis['peak_kw']):+.1f}kW",
         ]
         return "\n".join(lines)
+
+    def format_frontier(self, points: List[Tuple[float, Dict[str, float]]]) -> str:
+        if not points:
+            return "Frontier: no points"
+        lines = ["Cost vs peak frontier (depot peak cap -> KPIs)"]
+        for cap, kpis in points:
+            lines.append(
+                f"- cap {cap:.1f}kW: ${kpis['total_cost']:.2f}, fleet peak {kpis['peak_kw']:.1f}kW, on-time {kpis['on_time_pct']:.1f}%"
+            )
+        return "\n".join(lines)
+
+    def format_whatif_table(self, rows: List[Dict]) -> List[str]:
+        """One line per what-if row; deltas are against the "baseline" row when it is first."""
+        base = rows[0]["kpis"] if rows and rows[0]["name"] == "baseline" else None
+        lines = ["name | horizon | objective | cost | peak kW | on-time % | d cost | d peak"]
+        for row in rows:
+            kpis = row["kpis"]
+            if not kpis:
+                lines.append(f"{row['name']} | {row['horizon']}h | {row['objective']} | error: {row['error']}")
+                continue
+            line = (
+                f"{row['name']} | {row['horizon']}h | {row['objective']} | ${kpis['total_cost']:.2f} | "
+                f"{kpis['peak_kw']:.1f} | {kpis['on_time_pct']:.1f}"
+            )
+            if base and row is not rows[0]:
+                # round before formatting so solver float dust does not print as -0.00
+                d_cost = round(kpis["total_cost"] - base["total_cost"], 2) + 0.0
+                d_peak = round(kpis["peak_kw"] - base["peak_kw"], 1) + 0.0
+                line += f" | {d_cost:+.2f} | {d_peak:+.1f}"
+            lines.append(line)
+        return lines
@@ -0,0 +1,140 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.blackout_calendar import BlackoutCalendar
+from services.fleet_store import FleetStore
+from services.kg_service import KGIndex
+
+
+class Instance:
+    """
+    One synthetic planning instance: vehicles, chargers and site limits in the CSV column layout
+    of ``data/vehicles.csv``, ``data/chargers.csv`` and ``kg/site_limits.csv``, plus blackout
+    windows as (depot, start hour, end hour). ``fleet()`` and ``kg_index()`` turn it into the
+    inputs the optimizers take.
+    """
+
+    def __init__(
+        self,
+        vehicles: pd.DataFrame,
+        chargers: pd.DataFrame,
+        site_limits: pd.DataFrame,
+        blackouts: List[Tuple[str, int, int]],
+        params: Dict,
+    ):
+        self.vehicles = vehicles
+        self.chargers = chargers
+        self.site_limits = site_limits
+        self.blackouts = blackouts
+        self.params = params
+
+    def fleet(self) -> FleetStore:
+        return FleetStore.from_frame(self.vehicles)
+
+    def kg_index(self) -> KGIndex:
+        chargers: Dict[str, List[Dict]] = {}
+        for ch_id, depot_id, connector, max_kw in zip(
+            self.chargers["id"].tolist(), self.chargers["depot_id"].tolist(),
+            self.chargers["connector"].tolist(), self.chargers["max_kw"].tolist(),
+        ):
+            chargers.setdefault(depot_id, []).append(
+                {"id": ch_id, "depot_id": depot_id, "connector": connector, "max_kw": float(max_kw)}
+            )
+        site_peak = dict(zip(self.site_limits["depot_id"].tolist(), self.site_limits["site_peak_kw"].astype(float).tolist()))
+        calendar = BlackoutCalendar()
+        for depot_id, start, end in self.blackouts:
+            calendar.add(depot_id, start, end)
+        return KGIndex(chargers, site_peak, calendar, 0)
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "vehicles": int(len(self.vehicles)),
+            "depots": int(len(self.site_limits)),
+            "chargers": int(len(self.chargers)),
+            "blackouts": len(self.blackouts),
+        }
+
+
+def generate_instance(
+    vehicles: int,
+    seed: int = 0,
+    vehicles_per_depot: int = 40,
+    chargers_per_vehicle: float = 0.3,
+    peak_cap_ratio: float = 0.6,
+    blackout_share: float = 0.2,
+    horizon_hours: int = 24,
+    connectors: Optional[Dict[str, float]] = None,
+) -> Instance:
+    """
+    Deterministic synthetic instance (same arguments, same instance) from a handful of knobs.
+
+      - ``vehicles`` split over ceil(vehicles / vehicles_per_depot) depots (D1, D2, ...)
+      - per depot, about ``chargers_per_vehicle`` chargers per vehicle (at least one) of 11/22/50 kW
+      - site peak cap: ``peak_cap_ratio`` of the depot's installed charger power
+      - ``blackout_share`` of the depots get one 1-3 hour blackout inside the horizon
+      - departures in [4, horizon_hours); demand at most what the vehicle's power and dwell allow
+      - ``connectors`` maps connector types to their share (default all "ccs", as in the bundled data);
+        every depot has a charger of each type its vehicles use
+    """
+    rng = np.random.default_rng(seed)
+    connectors = connectors or {"ccs": 1.0}
+    kinds = list(connectors)
+    weights = np.array([connectors[k] for k in kinds], dtype=float)
+    n_depots = max(1, -(-vehicles // vehicles_per_depot))
+    depot_ids = [f"D{d + 1}" for d in range(n_depots)]
+
+    # vehicles: round-robin over depots so every depot is populated
+    depot_of = np.arange(vehicles) % n_depots
+    connector_of = rng.choice(len(kinds), size=vehicles, p=weights / weights.sum())
+    battery = rng.choice([40.0, 60.0, 75.0, 100.0], size=vehicles)
+    soc0 = np.round(rng.uniform(0.15, 0.6, size=vehicles), 2)
+    max_kw = rng.choice([11.0, 22.0, 50.0], size=vehicles, p=[0.3, 0.5, 0.2])
+    departure = rng.integers(4, max(5, horizon_hours), size=vehicles)
+    headroom = battery * (0.95 - soc0)
+    required = np.floor(np.minimum(headroom, max_kw * departure) * rng.uniform(0.2, 0.8, size=vehicles))
+    vehicles_df = pd.DataFrame(
+        {
+            "id": [f"v{i + 1}" for i in range(vehicles)],
+            "battery_kwh": battery,
+            "soc0": soc0,
+            "min_soc": np.full(vehicles, 0.2),
+            "depot_id": np.array(depot_ids, dtype=object)[depot_of],
+            "connector": np.array(kinds, dtype=object)[connector_of],
+            "max_kw": max_kw,
+            "departure_hour": departure.astype(np.int64),
+            "required_kwh": required,
+        }
+    )
+
+    # chargers and site caps per depot
+    per_depot = np.bincount(depot_of, minlength=n_depots)
+    pairs = np.unique(depot_of * len(kinds) + connector_of)
+    used_by_depot: Dict[int, List[str]] = {}
+    for pair in pairs.tolist():
+        used_by_depot.setdefault(pair // len(kinds), []).append(kinds[pair % len(kinds)])
+    charger_rows: List[Tuple[str, str, str, float]] = []
+    peaks: List[float] = []
+    blackouts: List[Tuple[str, int, int]] = []
+    for d, depot_id in enumerate(depot_ids):
+        used = used_by_depot.get(d, kinds[:1])
+        count = max(len(used), int(round(per_depot[d] * chargers_per_vehicle)))
+        types = used + rng.choice(used, size=count - len(used)).tolist()
+        powers = rng.choice([11.0, 22.0, 50.0], size=count, p=[0.2, 0.6, 0.2])
+        for connector, kw in zip(types, powers.tolist()):
+            charger_rows.append((f"c{len(charger_rows) + 1}", depot_id, connector, kw))
+        peaks.append(float(np.round(peak_cap_ratio * powers.sum(), 1)))
+        if rng.random() < blackout_share:
+            length = int(rng.integers(1, 4))
+            start = int(rng.integers(0, max(1, horizon_hours - length)))
+            blackouts.append((depot_id, start, start + length))
+
+    chargers_df = pd.DataFrame(charger_rows, columns=["id", "depot_id", "connector", "max_kw"])
+    site_limits_df = pd.DataFrame({"depot_id": depot_ids, "site_peak_kw": peaks})
+    params = {
+        "vehicles": vehicles, "seed": seed, "vehicles_per_depot": vehicles_per_depot,
+        "chargers_per_vehicle": chargers_per_vehicle, "peak_cap_ratio": peak_cap_ratio,
+        "blackout_share": blackout_share, "horizon_hours": horizon_hours, "connectors": dict(connectors),
+    }
+    return Instance(vehicles_df, chargers_df, site_limits_df, blackouts, params)
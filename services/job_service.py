@@ -0,0 +1,172 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+
+class Job:
+    """One unit of solver work and its lifecycle: queued -> running -> done | failed | cancelled."""
+
+    def __init__(self, fn: Callable, args: Tuple, kwargs: Dict, priority: int, kind: str):
+        self.id = uuid4().hex[:12]
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.kind = kind
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_requested = False
+        self.future: Future = Future()
+
+    @property
+    def result(self) -> Any:
+        return self.future.result() if self.status == "done" else None
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "priority": PRIORITY_NAMES.get(self.priority, str(self.priority)),
+            "status": self.status,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobService:
+    """
+    Bounded, prioritized executor for solver work.
+
+    ``max_workers`` threads pull jobs from one heap ordered by (priority, submission order), so
+    interactive requests overtake queued batch work but never preempt a running solve. The solvers
+    spend most of their time in native code, which keeps the agent's event loop responsive while
+    jobs run. Finished jobs are kept for polling up to ``history`` entries.
+
+    Cancelling a queued job drops it; cancelling a running job marks it and discards its result
+    (a solve in progress cannot be interrupted).
+    """
+
+    def __init__(self, max_workers: int = 2, history: int = 200):
+        self.max_workers = max(1, int(max_workers))
+        self.history = history
+        self._heap: List[Tuple[int, int, Job]] = []
+        self._seq = itertools.count()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+
+    # --- Submission ---
+    def submit(self, fn: Callable, *args, priority: int = BATCH, kind: str = "", **kwargs) -> Job:
+        job = Job(fn, args, kwargs, priority, kind or getattr(fn, "__name__", "job"))
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("job service is shut down")
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (priority, next(self._seq), job))
+            self._trim()
+            self._ensure_workers()
+            self._cond.notify()
+        return job
+
+    async def run(self, fn: Callable, *args, priority: int = INTERACTIVE, kind: str = "", **kwargs) -> Any:
+        """Submit and await the result without blocking the event loop."""
+        job = self.submit(fn, *args, priority=priority, kind=kind, **kwargs)
+        return await asyncio.wrap_future(job.future)
+
+    # --- Polling / cancellation ---
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; returns False for unknown or already finished jobs."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in ("queued", "running"):
+                return False
+            job.cancel_requested = True
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.finished_at = time.time()
+                job.future.cancel()
+            return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            counts["workers"] = self.max_workers
+            return counts
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._closed = True
+            for _, _, job in self._heap:
+                if job.status == "queued":
+                    job.status = "cancelled"
+                    job.future.cancel()
+            self._heap.clear()
+            self._cond.notify_all()
+
+    # --- Workers ---
+    def _ensure_workers(self) -> None:
+        while len(self._threads) < self.max_workers:
+            t = threading.Thread(target=self._worker, name=f"solver-job-{len(self._threads)}", daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+                if job.status != "queued":
+                    continue  # cancelled while waiting
+                job.status = "running"
+                job.started_at = time.time()
+            try:
+                value = job.fn(*job.args, **job.kwargs)
+                error = None
+            except Exception as e:
+                value, error = None, e
+            with self._cond:
+                job.finished_at = time.time()
+                if job.cancel_requested:
+                    job.status = "cancelled"
+                    job.future.cancel()
+                elif error is not None:
+                    job.status = "failed"
+                    job.error = str(error)
+                    job.future.set_exception(error)
+                else:
+                    job.status = "done"
+                    job.future.set_result(value)
+
+    def _trim(self) -> None:
+        # drop the oldest finished jobs beyond the history limit
+        excess = len(self._jobs) - self.history
+        if excess <= 0:
+            return
+        for job_id in [j.id for j in self._jobs.values() if j.status in ("done", "failed", "cancelled")][:excess]:
+            del self._jobs[job_id]
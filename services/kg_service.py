@@ -1,38 +1,266 @@
+import hashlib
+import json
 import os
-from typing import Dict, List, Optional
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
 import pandas as pd
 
+from services.blackout_calendar import BlackoutCalendar
+from services.snapshot import Snapshot
+
+
+DEFAULT_SITE_PEAK_KW = 60.0
+
+
+class KGIndex:
+    """
+    Compiled, read-only snapshot of the KG used by the optimizer hot loops.
+
+    Built once from the CSVs (or MeTTa facts) and replaced, never mutated, when the KG changes:
+      - chargers[depot]: charger dicts in source order
+      - charger_ids / charger_max_kw / charger_connectors[depot]: per-depot charger arrays
+      - connector_groups[depot][CONNECTOR]: positions of the chargers with that connector
+      - capacity_kw / max_sessions / site_peak_kw[depot]: per-depot totals and limits
+      - charger_depot[charger_id]: owning depot
+      - blackouts: frozen copy of the BlackoutCalendar
+    ``version`` is the KGService version the snapshot was built for; ``fingerprint()`` hashes the
+    content instead, so two snapshots of the same KG state (e.g. a what-if toggled back) match.
+    """
+
+    def __init__(
+        self,
+        chargers: Dict[str, List[Dict]],
+        site_peak_kw: Dict[str, float],
+        blackouts: BlackoutCalendar,
+        version: int,
+    ):
+        self.version = version
+        self._fingerprint: Optional[str] = None
+        self.chargers: Dict[str, List[Dict]] = chargers
+        self.site_peak_kw: Dict[str, float] = site_peak_kw
+        self.blackouts = blackouts
+        self.charger_ids: Dict[str, np.ndarray] = {}
+        self.charger_max_kw: Dict[str, np.ndarray] = {}
+        self.charger_connectors: Dict[str, np.ndarray] = {}
+        self.connector_groups: Dict[str, Dict[str, np.ndarray]] = {}
+        self.capacity_kw: Dict[str, float] = {}
+        self.max_sessions: Dict[str, int] = {}
+        self.charger_depot: Dict[str, str] = {}
+        for depot_id, chs in chargers.items():
+            self.charger_ids[depot_id] = np.array([str(ch["id"]) for ch in chs], dtype=object)
+            self.charger_max_kw[depot_id] = np.array([float(ch["max_kw"]) for ch in chs], dtype=float)
+            connectors = np.array([str(ch.get("connector", "")).upper() for ch in chs], dtype=object)
+            self.charger_connectors[depot_id] = connectors
+            self.connector_groups[depot_id] = {
+                conn: np.flatnonzero(connectors == conn) for conn in dict.fromkeys(connectors.tolist())
+            }
+            self.capacity_kw[depot_id] = float(self.charger_max_kw[depot_id].sum())
+            self.max_sessions[depot_id] = len(chs)
+            for ch in chs:
+                self.charger_depot[str(ch["id"])] = depot_id
+
+    def with_overrides(self, site_peak_kw: Dict[str, float], blackouts: BlackoutCalendar, version: int) -> "KGIndex":
+        """Cheap copy sharing the charger arrays, with new site limits and blackouts."""
+        patched = object.__new__(KGIndex)
+        patched.__dict__.update(self.__dict__)
+        patched.site_peak_kw = site_peak_kw
+        patched.blackouts = blackouts
+        patched.version = version
+        patched._fingerprint = None
+        return patched
+
+    def with_whatif(
+        self,
+        site_peak_kw: Optional[Dict[str, float]] = None,
+        blackouts: Iterable[Tuple[str, int, int]] = (),
+        clear_blackouts: bool = False,
+    ) -> "KGIndex":
+        """Throwaway variant with extra site-peak caps and (depot, start, end) blackout windows."""
+        calendar = BlackoutCalendar() if clear_blackouts else self.blackouts.copy()
+        for depot_id, start, end in blackouts:
+            calendar.add(depot_id, start, end)
+        peaks = {**self.site_peak_kw, **{str(d): float(kw) for d, kw in (site_peak_kw or {}).items()}}
+        return self.with_overrides(peaks, calendar, self.version)
+
+    def shifted(self, hours: int) -> "KGIndex":
+        """Copy whose hour 0 is this snapshot's hour ``hours`` (blackout windows moved back, clipped at 0)."""
+        if hours <= 0:
+            return self
+        calendar = BlackoutCalendar()
+        for depot_id in self.blackouts.depots():
+            for start, end in self.blackouts.windows(depot_id):
+                if end > hours:
+                    calendar.add(depot_id, start - hours, end - hours)
+        return self.with_overrides(self.site_peak_kw, calendar, self.version)
+
+    def changed_depots(self, other: "KGIndex") -> List[str]:
+        """Depots whose chargers, site limit or blackout windows differ between the two snapshots."""
+        depots = set(self.chargers) | set(other.chargers) | set(self.site_peak_kw) | set(other.site_peak_kw)
+        depots |= set(self.blackouts.depots()) | set(other.blackouts.depots())
+        changed = []
+        for depot_id in sorted(depots):
+            mine, theirs = self.chargers.get(depot_id), other.chargers.get(depot_id)
+            if (
+                (mine is not theirs and mine != theirs)  # with_overrides copies share the charger lists
+                or self.get_site_peak_limit_kw(depot_id) != other.get_site_peak_limit_kw(depot_id)
+                or self.blackouts.windows(depot_id) != other.blackouts.windows(depot_id)
+            ):
+                changed.append(depot_id)
+        return changed
+
+    def compiled(self) -> "KGIndex":
+        # an index is its own read-only view, so it can be passed wherever kg= is accepted
+        return self
+
+    def fingerprint(self) -> str:
+        if self._fingerprint is None:
+            state = {
+                "chargers": {d: [[str(ch["id"]), str(ch.get("connector", "")), float(ch["max_kw"])] for ch in chs] for d, chs in self.chargers.items()},
+                "site_peak_kw": self.site_peak_kw,
+                "blackouts": {d: self.blackouts.windows(d) for d in self.blackouts.depots()},
+            }
+            self._fingerprint = hashlib.sha1(json.dumps(state, sort_keys=True).encode()).hexdigest()
+        return self._fingerprint
+
+    def get_site_peak_limit_kw(self, depot_id: str) -> float:
+        return self.site_peak_kw.get(depot_id, DEFAULT_SITE_PEAK_KW)
+
+    def get_total_capacity_kw(self, depot_id: str) -> float:
+        return self.capacity_kw.get(depot_id, 0.0)
+
+    def get_max_concurrent_chargers(self, depot_id: str) -> int:
+        return self.max_sessions.get(depot_id, 0)
+
+    def get_hour_budget_kw(self, depot_id: str) -> float:
+        return min(self.get_site_peak_limit_kw(depot_id), self.get_total_capacity_kw(depot_id))
+
+    def is_blackout(self, depot_id: str, hour: int) -> bool:
+        return self.blackouts.is_blackout(depot_id, hour)
+
+    def available_mask(self, depot_id: str, horizon: int) -> np.ndarray:
+        return self.blackouts.available_mask(depot_id, horizon)
+
+
+class KGView(ABC):
+    """
+    Read and what-if API shared by the base KGService and its scenario overlays.
 
-class KGService:
+    Reads go through ``compiled()``; mutators write into the containers returned by
+    ``_peaks_for_write()`` / ``_blackouts_for_write()`` and then call ``_bump()``. The four are
+    abstract, so a view that lacks one fails when it is created. Subclasses also provide
+    ``_lock``: a mutator holds it for its write and the bump together, and ``compiled()`` takes it
+    too, so no index is ever built from a half-applied edit.
+    """
+
+    @abstractmethod
+    def compiled(self) -> KGIndex:
+        ...
+
+    @abstractmethod
+    def _peaks_for_write(self) -> Dict[str, float]:
+        ...
+
+    @abstractmethod
+    def _blackouts_for_write(self) -> BlackoutCalendar:
+        ...
+
+    @abstractmethod
+    def _bump(self) -> None:
+        ...
+
+    def get_depot_chargers(self, depot_id: str) -> List[Dict]:
+        return list(self.compiled().chargers.get(depot_id, []))
+
+    def connectors_compatible(self, vehicle_connector: str, charger_connector: str) -> bool:
+        return str(vehicle_connector).lower() == str(charger_connector).lower()
+
+    def get_site_peak_limit_kw(self, depot_id: str) -> float:
+        return self.compiled().get_site_peak_limit_kw(depot_id)  # kW
+
+    def get_max_concurrent_chargers(self, depot_id: str) -> int:
+        return self.compiled().get_max_concurrent_chargers(depot_id)
+
+    def get_total_capacity_kw(self, depot_id: str) -> float:
+        return self.compiled().get_total_capacity_kw(depot_id)
+
+    def is_blackout(self, depot_id: str, hour: int) -> bool:
+        return self.compiled().is_blackout(depot_id, hour)
+
+    def available_mask(self, depot_id: str, horizon: int) -> np.ndarray:
+        return self.compiled().available_mask(depot_id, horizon)
+
+    # --- Runtime mutation helpers (what-if scenarios) ---
+    def set_site_peak_limit_kw(self, depot_id: str, kw: float) -> None:
+        with self._lock:
+            self._peaks_for_write()[str(depot_id)] = float(kw)
+            self._bump()
+
+    def add_blackout(self, depot_id: str, start_hour: int, end_hour: int) -> None:
+        with self._lock:
+            self._blackouts_for_write().add(depot_id, start_hour, end_hour)
+            self._bump()
+
+    def remove_blackout(self, depot_id: str, start_hour: int, end_hour: int) -> None:
+        with self._lock:
+            self._blackouts_for_write().remove(depot_id, start_hour, end_hour)
+            self._bump()
+
+    def clear_blackouts(self, depot_id: str | None = None) -> None:
+        with self._lock:
+            self._blackouts_for_write().clear(depot_id)
+            self._bump()
+
+    def clear_site_peak_override(self, depot_id: str | None = None) -> None:
+        with self._lock:
+            peaks = self._peaks_for_write()
+            if depot_id is None:
+                peaks.clear()
+            else:
+                peaks.pop(str(depot_id), None)
+            self._bump()
+
+
+class KGService(KGView):
     """
     MeTTa-style Grid Knowledge Graph adapter (MVP in Python).
 
     Sources:
       - data/chargers.csv: id,depot_id,connector,max_kw
       - kg/site_limits.csv: depot_id,site_peak_kw
+    Each is read from the binary snapshot in ``data/snapshot`` instead when that table is fresh for
+    its CSV (see ``services.snapshot``).
+
+    Lookups are served from a compiled KGIndex. ``version`` increases on every mutation (what-if
+    overrides, blackouts, CSV reloads) so downstream caches can key on it.
+
+    The service's own overrides form the "default" scenario; ``scenario(name)`` returns named
+    copy-on-write overlays (KGScenario) with their own overrides and blackouts.
     """
 
-    def __init__(self, metta: Optional[object] = None):
+    DEFAULT_SCENARIO = "default"
+
+    def __init__(self, metta: Optional[object] = None, snapshot_dir: Optional[str] = None):
         root = os.path.dirname(os.path.dirname(__file__))
         self.chargers_path = os.path.join(root, "data", "chargers.csv")
         self.site_limits_path = os.path.join(root, "kg", "site_limits.csv")
-
-        if not os.path.exists(self.chargers_path):
-            raise FileNotFoundError(f"Missing chargers dataset at {self.chargers_path}")
-        self._chargers_df = pd.read_csv(self.chargers_path)
-
-        if os.path.exists(self.site_limits_path):
-            self._site_limits_df = pd.read_csv(self.site_limits_path)
-        else:
-            # sensible defaults
-            self._site_limits_df = pd.DataFrame(
-                {"depot_id": ["D1", "D2"], "site_peak_kw": [60.0, 60.0]}
-            )
+        self.snapshot_dir = snapshot_dir or os.path.join(root, "data", "snapshot")
+        self._load_sources()
 
         # runtime overrides and windows
         self._site_peak_override: Dict[str, float] = {}
-        # blackout windows per depot: list of (start_hour_inclusive, end_hour_exclusive)
-        self._blackouts: Dict[str, List[List[int]]] = {}
+        # blackout windows per depot, merged [start_hour_inclusive, end_hour_exclusive) intervals
+        self.blackouts = BlackoutCalendar()
+
+        self.version = 0
+        self._index: Optional[KGIndex] = None
+        self._base_site_peak: Dict[str, float] = {}
+        self._scenarios: Dict[str, "KGScenario"] = {}
+        self._scenarios_lock = threading.Lock()
+        # guards the overrides, blackouts, compiled index and version: edits and rebuilds take turns
+        self._lock = threading.Lock()
 
         # MeTTa adapter (optional)
         self.metta = metta
@@ -40,80 +268,168 @@ class KGService:
         self._use_metta = bool(self.metta) and str(os.getenv("USE_METTA", "false")).lower() in ("1", "true", "yes") and getattr(self.metta, "enabled", False)
         if self._use_metta:
             try:
-                # Provide DF facts to MeTTa
+                # Provide DF facts to MeTTa (loaded once; CSV reloads only refresh the pandas path)
                 self.metta.load_facts(self._site_limits_df, self._chargers_df)
             except Exception:
                 self._use_metta = False
 
-    def get_depot_chargers(self, depot_id: str) -> List[Dict]:
-        if self._use_metta and self.metta:
-            from_metta = self.metta.query_chargers(depot_id)
-            if from_metta:
-                # decorate with depot_id
-                for ch in from_metta:
-                    ch["depot_id"] = depot_id
-                return from_metta
-        df = self._chargers_df[self._chargers_df["depot_id"] == depot_id]
-        chargers: List[Dict] = []
-        for _, row in df.iterrows():
-            chargers.append(
+    def _source_mtimes(self) -> Tuple[float, float]:
+        def mtime(path: str) -> float:
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return 0.0
+
+        return mtime(self.chargers_path), mtime(self.site_limits_path)
+
+    def _load_sources(self) -> None:
+        self._mtimes = self._source_mtimes()
+        snapshot = Snapshot.open(self.snapshot_dir)
+        if snapshot is not None and snapshot.is_fresh("chargers", self.chargers_path):
+            self._chargers_df = snapshot.table("chargers").frame()
+        elif os.path.exists(self.chargers_path):
+            self._chargers_df = pd.read_csv(self.chargers_path)
+        else:
+            raise FileNotFoundError(f"Missing chargers dataset at {self.chargers_path}")
+        if snapshot is not None and snapshot.is_fresh("site_limits", self.site_limits_path):
+            self._site_limits_df = snapshot.table("site_limits").frame()
+        elif os.path.exists(self.site_limits_path):
+            self._site_limits_df = pd.read_csv(self.site_limits_path)
+        else:
+            # sensible defaults
+            self._site_limits_df = pd.DataFrame(
+                {"depot_id": ["D1", "D2"], "site_peak_kw": [60.0, 60.0]}
+            )
+
+    # --- Compiled snapshot ---
+    def compiled(self) -> KGIndex:
+        """Current KGIndex, rebuilt only when the sources changed since the last build."""
+        with self._lock:
+            if self._mtimes != self._source_mtimes():
+                self._load_sources()
+                self._index = None
+                self.version += 1
+            if self._index is None:
+                self._index = self._build_index()
+            return self._index
+
+    def _build_index(self) -> KGIndex:
+        chargers: Dict[str, List[Dict]] = {}
+        for rec in self._chargers_df.to_dict("records"):
+            chargers.setdefault(str(rec["depot_id"]), []).append(
                 {
-                    "id": row["id"],
-                    "depot_id": row["depot_id"],
-                    "connector": row["connector"],
-                    "max_kw": float(row["max_kw"]),
+                    "id": rec["id"],
+                    "depot_id": str(rec["depot_id"]),
+                    "connector": rec["connector"],
+                    "max_kw": float(rec["max_kw"]),
                 }
             )
-        return chargers
+        base_peak: Dict[str, float] = {
+            str(rec["depot_id"]): float(rec["site_peak_kw"])
+            for rec in self._site_limits_df.drop_duplicates("depot_id", keep="first").to_dict("records")
+        }
+        if self._use_metta and self.metta:
+            for depot_id in set(chargers) | set(base_peak):
+                from_metta = self.metta.query_chargers(depot_id)
+                if from_metta:
+                    # decorate with depot_id
+                    for ch in from_metta:
+                        ch["depot_id"] = depot_id
+                    chargers[depot_id] = from_metta
+                val = self.metta.query_site_peak(depot_id)
+                if val is not None:
+                    base_peak[depot_id] = float(val)
+        self._base_site_peak = base_peak
+        return KGIndex(chargers, self._effective_site_peak(), self.blackouts.copy(), self.version)
 
-    def connectors_compatible(self, vehicle_connector: str, charger_connector: str) -> bool:
-        return str(vehicle_connector).lower() == str(charger_connector).lower()
+    def _effective_site_peak(self) -> Dict[str, float]:
+        return {**self._base_site_peak, **self._site_peak_override}
 
-    def get_site_peak_limit_kw(self, depot_id: str) -> float:
-        if depot_id in self._site_peak_override:
-            return float(self._site_peak_override[depot_id])
-        if self._use_metta and self.metta:
-            val = self.metta.query_site_peak(depot_id)
-            if val is not None:
-                return float(val)
-        df = self._site_limits_df[self._site_limits_df["depot_id"] == depot_id]
-        if df.empty:
-            return 60.0
-        return float(df.iloc[0]["site_peak_kw"])  # kW
+    def _bump(self) -> None:
+        # called with self._lock held, right after the edit
+        self.version += 1
+        if self._index is not None:
+            self._index = self._index.with_overrides(self._effective_site_peak(), self.blackouts.copy(), self.version)
 
-    def get_max_concurrent_chargers(self, depot_id: str) -> int:
-        return len(self.get_depot_chargers(depot_id))
+    def _peaks_for_write(self) -> Dict[str, float]:
+        return self._site_peak_override
 
-    def get_total_capacity_kw(self, depot_id: str) -> float:
-        chargers = self.get_depot_chargers(depot_id)
-        return sum(ch["max_kw"] for ch in chargers)
+    def _blackouts_for_write(self) -> BlackoutCalendar:
+        return self.blackouts
 
-    # --- Runtime mutation helpers (what-if scenarios) ---
-    def set_site_peak_limit_kw(self, depot_id: str, kw: float) -> None:
-        self._site_peak_override[str(depot_id)] = float(kw)
+    # --- Scenario overlays ---
+    def scenario(self, name: Optional[str] = None) -> KGView:
+        """The named overlay (created on first use); ``None`` or "default" is the service itself."""
+        if not name or name == self.DEFAULT_SCENARIO:
+            return self
+        with self._scenarios_lock:
+            view = self._scenarios.get(name)
+            if view is None:
+                view = self._scenarios[name] = KGScenario(self, name)
+            return view
 
-    def add_blackout(self, depot_id: str, start_hour: int, end_hour: int) -> None:
-        start = max(0, int(start_hour))
-        end = max(start, int(end_hour))
-        arr = self._blackouts.setdefault(str(depot_id), [])
-        arr.append([start, end])
+    def drop_scenario(self, name: str) -> Optional["KGScenario"]:
+        """Forget the named overlay; returns it (so callers can evict what they built on it) or None."""
+        with self._scenarios_lock:
+            return self._scenarios.pop(name, None)
 
-    def is_blackout(self, depot_id: str, hour: int) -> bool:
-        windows = self._blackouts.get(str(depot_id), [])
-        h = int(hour)
-        for w in windows:
-            if len(w) == 2 and w[0] <= h < w[1]:
-                return True
-        return False
+    def scenario_names(self) -> List[str]:
+        with self._scenarios_lock:
+            return [self.DEFAULT_SCENARIO] + list(self._scenarios.keys())
 
-    def clear_blackouts(self, depot_id: str | None = None) -> None:
-        if depot_id is None:
-            self._blackouts.clear()
-        else:
-            self._blackouts.pop(str(depot_id), None)
 
-    def clear_site_peak_override(self, depot_id: str | None = None) -> None:
-        if depot_id is None:
-            self._site_peak_override.clear()
-        else:
-            self._site_peak_override.pop(str(depot_id), None)
+class KGScenario(KGView):
+    """
+    Named what-if overlay over a KGService.
+
+    Site-peak overrides and blackouts are read through from the base until the scenario first
+    changes them; each is then copied once (copy-on-write) and only the copy is edited, so other
+    scenarios and the base never see the change. Chargers and site limits always come from the
+    base, and the compiled index shares the base index's charger arrays.
+    """
+
+    def __init__(self, base: KGService, name: str):
+        self.base = base
+        self.name = name
+        self.version = 0
+        self._site_peak_override: Optional[Dict[str, float]] = None
+        self._blackouts: Optional[BlackoutCalendar] = None
+        self._index: Optional[KGIndex] = None
+        self._index_base: Optional[KGIndex] = None
+        self._lock = threading.Lock()
+
+    @property
+    def blackouts(self) -> BlackoutCalendar:
+        return self._blackouts if self._blackouts is not None else self.base.blackouts
+
+    def compiled(self) -> KGIndex:
+        base_index = self.base.compiled()
+        if self._site_peak_override is None and self._blackouts is None:
+            return base_index
+        with self._lock:
+            if self._index is None or self._index_base is not base_index:
+                peaks = base_index.site_peak_kw
+                if self._site_peak_override is not None:
+                    peaks = {**self.base._base_site_peak, **self._site_peak_override}
+                # blackouts not yet written here read through from the base snapshot, not the live base calendar
+                blackouts = self._blackouts.copy() if self._blackouts is not None else base_index.blackouts
+                self._index = base_index.with_overrides(peaks, blackouts, base_index.version)
+                self._index_base = base_index
+            return self._index
+
+    def _peaks_for_write(self) -> Dict[str, float]:
+        if self._site_peak_override is None:
+            with self.base._lock:
+                self._site_peak_override = dict(self.base._site_peak_override)
+        return self._site_peak_override
+
+    def _blackouts_for_write(self) -> BlackoutCalendar:
+        if self._blackouts is None:
+            with self.base._lock:
+                self._blackouts = self.base.blackouts.copy()
+        return self._blackouts
+
+    def _bump(self) -> None:
+        # called with self._lock held, right after the edit
+        self.version += 1
+        self._index = None
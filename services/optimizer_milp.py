@@ -1,165 +1,1227 @@
-from typing import Dict, List, Tuple
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Collection, Dict, List, Optional, Tuple, Union
 
+import numpy as np
 from ortools.linear_solver import pywraplp
 
+from services.schedule import Schedule, slots_per_hour
 
-class OptimizerMILP:
-    def __init__(self, kg, telemetry, prices):
-        self.kg = kg
-        self.telemetry = telemetry
-        self.prices = prices
 
-    def optimize(self, horizon_hours: int, objective: str = "cost") -> Dict:
-        fleet = self.telemetry.get_fleet_state()["vehicles"]
-        price_curve: List[float] = self.prices.get_prices(horizon_hours)
+VarKey = Tuple[str, str, int]
 
-        vehicles_by_depot: Dict[str, List[Dict]] = {}
-        for v in fleet:
-            vehicles_by_depot.setdefault(v["depot_id"], []).append(v)
+# $/kWh added to a windowed vehicle's deferred price so equal-price energy is taken in the earlier window
+DEFERRAL_TIE_BREAK = 1e-4
+
+
+def assign_chargers(
+    kw: np.ndarray,
+    row_of: Dict[str, int],
+    vehicles_by_depot: Dict[str, List[Dict]],
+    chargers_by_depot: Dict[str, List[Dict]],
+) -> Dict[VarKey, float]:
+    """
+    Map a vehicle x hour schedule onto concrete chargers.
+
+    Per depot-hour, vehicles are placed largest grant first on the smallest free compatible charger
+    that covers the grant (or the largest free one, clipping the grant). Vehicles that find no free
+    compatible charger are left out, so the result is a partial assignment.
+    """
+    assignment: Dict[VarKey, float] = {}
+    for depot_id, vehicles in vehicles_by_depot.items():
+        chargers = [
+            (str(ch["id"]), str(ch.get("connector", "")).upper(), float(ch.get("max_kw", 22.0)))
+            for ch in chargers_by_depot.get(depot_id, [])
+        ]
+        if not chargers or not vehicles:
+            continue
+        sub = kw[[row_of[v["id"]] for v in vehicles]]
+        for h in np.flatnonzero(sub.any(axis=0)).tolist():
+            free = set(range(len(chargers)))
+            order = sorted(((float(sub[i, h]), i) for i in np.flatnonzero(sub[:, h]).tolist()), reverse=True)
+            for grant, i in order:
+                v = vehicles[i]
+                v_conn = str(v.get("connector", "")).upper()
+                fits = [j for j in free if not (v_conn and chargers[j][1] and v_conn != chargers[j][1])]
+                if not fits:
+                    continue
+                covering = [j for j in fits if chargers[j][2] >= grant]
+                j = min(covering, key=lambda j: chargers[j][2]) if covering else max(fits, key=lambda j: chargers[j][2])
+                free.discard(j)
+                assignment[(v["id"], chargers[j][0], h)] = min(grant, chargers[j][2], float(v.get("max_kw", 22.0)))
+    return assignment
+
+
+def charger_columns(depot_id: str, chargers: List[Dict], pooled: bool = False) -> List[Dict]:
+    """
+    Charger columns of one depot for the MILP.
+
+    Without ``pooled`` every charger is its own column. With ``pooled`` chargers sharing connector
+    and max_kw are interchangeable and merged into one pool column whose ``members`` are the concrete
+    charger ids; single chargers keep their own id.
+    """
+    groups: Dict[Tuple[str, float], List[str]] = {}
+    for ch in chargers:
+        c_id = str(ch["id"])
+        spec = (str(ch.get("connector", "")).upper(), float(ch.get("max_kw", 22.0)))
+        groups.setdefault(spec if pooled else (c_id, spec), []).append(c_id)
+    columns: List[Dict] = []
+    for spec, members in groups.items():
+        connector, max_kw = spec if pooled else spec[1]
+        col_id = members[0] if len(members) == 1 else f"pool:{depot_id}:{connector or '*'}:{max_kw:g}kW"
+        columns.append({"id": col_id, "connector": connector, "max_kw": max_kw, "members": members})
+    return columns
 
-        chargers_by_depot: Dict[str, List[Dict]] = {}
-        for depot_id in vehicles_by_depot.keys():
-            chargers_by_depot[depot_id] = self.kg.get_depot_chargers(depot_id)
 
-        solver = pywraplp.Solver.CreateSolver("SCIP")
-        if solver is None:
+def expand_pools(assignment: Dict[VarKey, float], members: Dict[str, List[str]]) -> Dict[VarKey, float]:
+    """
+    Turn a pool-level assignment into concrete charger ids.
+
+    Hours are walked in order; within a pool a vehicle keeps the charger it last used when that one
+    is still free, otherwise it takes the first free member. The pool capacity constraint guarantees
+    enough members per hour. Columns that are not pools map onto themselves.
+    """
+    by_column_hour: Dict[Tuple[str, int], List[Tuple[str, float]]] = {}
+    for (v_id, col, h), val in assignment.items():
+        by_column_hour.setdefault((col, h), []).append((v_id, val))
+
+    out: Dict[VarKey, float] = {}
+    last_used: Dict[str, Dict[str, str]] = {}
+    for col, h in sorted(by_column_hour, key=lambda key: (key[1], key[0])):
+        entries = by_column_hour[(col, h)]
+        last = last_used.setdefault(col, {})
+        placed: Dict[str, str] = {}
+        for v_id, _ in entries:
+            c_id = last.get(v_id)
+            if c_id is not None and c_id not in placed.values():
+                placed[v_id] = c_id
+        free = iter([c_id for c_id in members.get(col, [col]) if c_id not in placed.values()])
+        for v_id, val in entries:
+            if v_id not in placed:
+                placed[v_id] = next(free)
+            out[(v_id, placed[v_id], h)] = val
+        last.update(placed)
+    return out
+
+
+class MILPModel:
+    """
+    Indexed SCIP model for per-charger charging assignment.
+
+    Variables are indexed as they are created (by vehicle, by (vehicle, hour), by (charger, hour)
+    and by (depot, hour)), so every constraint family is built in time linear in the variable
+    count. The model only needs plain data: vehicles and chargers grouped by depot, per-depot hour
+    budgets and availability masks.
+
+    With ``pooled`` interchangeable chargers are merged into pool columns (see ``charger_columns``):
+    a pool admits as many vehicles per hour as it has members, which removes the symmetry between
+    identical chargers. ``charger_assignment`` maps the solution back onto concrete charger ids.
+
+    A model built with ``updatable`` also has variables for blackout hours (fixed to 0) and keeps
+    handles on its capacity rows, so ``update`` can apply new depot budgets and blackouts in place
+    and the next ``solve`` starts from the previous solution instead of a cold build.
+
+    The model has ``horizon`` slots of ``slot_hours`` each ("hours" below are slots); x is in kW, so
+    a slot delivers x * slot_hours kWh, and vehicle departure hours are converted to slots. Besides
+    ``required_kwh`` (a floor), a vehicle may carry ``max_kwh`` (a ceiling) and ``deferred_price``:
+    the $/kWh at which energy it does not take here is valued later, which the cost term credits
+    for every kWh taken (see ``OptimizerMILP`` windowed solves).
+    """
+
+    def __init__(
+        self, horizon: int, price_curve: List[float], objective: str = "cost", pooled: bool = False, slot_hours: float = 1.0
+    ):
+        self.horizon = horizon
+        self.price_curve = price_curve
+        self.objective = objective
+        self.pooled = pooled
+        self.slot_hours = float(slot_hours)
+        self.solver = pywraplp.Solver.CreateSolver("SCIP")
+        if self.solver is None:
             raise RuntimeError("ORTools SCIP solver not available")
 
-        # Decision variables
         # x[v,c,h] in kW, z[v,c,h] in {0,1} to model assignment
-        x: Dict[Tuple[str, str, int], pywraplp.Variable] = {}
-        z: Dict[Tuple[str, str, int], pywraplp.Variable] = {}
+        self.x: Dict[VarKey, pywraplp.Variable] = {}
+        self.z: Dict[VarKey, pywraplp.Variable] = {}
+        self.x_by_vehicle: Dict[str, List[pywraplp.Variable]] = {}
+        self.z_by_vehicle_hour: Dict[Tuple[str, int], List[pywraplp.Variable]] = {}
+        self.z_by_charger_hour: Dict[Tuple[str, int], List[pywraplp.Variable]] = {}
+        self.x_by_depot_hour: Dict[Tuple[str, int], List[pywraplp.Variable]] = {}
+        self.charger_depot: Dict[str, str] = {}
+        # vehicle id -> deferred_price, for vehicles that have one
+        self.deferred: Dict[str, float] = {}
+        # column id -> concrete charger ids, and charger id -> column id
+        self.members: Dict[str, List[str]] = {}
+        self.column_of: Dict[str, str] = {}
+        self.peak_var: Optional[pywraplp.Variable] = None
+        # in-place updates: capacity rows, x upper bounds and the keys of every depot-hour
+        self.capacity: Dict[Tuple[str, int], pywraplp.Constraint] = {}
+        self.x_ub: Dict[VarKey, float] = {}
+        self.keys_by_depot_hour: Dict[Tuple[str, int], List[VarKey]] = {}
+        self.budgets: Dict[str, float] = {}
+        self.available: Dict[str, np.ndarray] = {}
+        self.peak_cap_kw: Optional[float] = None
+        self.peak_floor_kw = 0.0
+        self.updatable = False
+        self.last_solution: Dict[VarKey, float] = {}
+        self.hint_objective: Optional[float] = None
+        self.build_seconds = 0.0
+        self.solve_seconds = 0.0
+        self.update_seconds = 0.0
+        self.updates = 0
+        self.kg_fingerprint: Optional[str] = None
+        # the solver holds a solution of the model as it is now (SCIP refuses hints and re-solves until the next edit)
+        self.solved = False
+        # live models are shared between job threads; held across update, solve and read-back
+        self.lock = threading.Lock()
+
+    def build(
+        self,
+        vehicles_by_depot: Dict[str, List[Dict]],
+        chargers_by_depot: Dict[str, List[Dict]],
+        budgets: Dict[str, float],
+        available: Dict[str, np.ndarray],
+        peak_cap_kw: Optional[float] = None,
+        updatable: bool = False,
+        peak_floor_kw: float = 0.0,
+    ) -> None:
+        """
+        Create variables and constraints; ``peak_cap_kw`` further caps every depot-hour load and
+        ``peak_floor_kw`` is a peak already incurred elsewhere (the peak objective counts nothing below it).
+        """
+        t0 = time.perf_counter()
+        solver = self.solver
+        self.updatable = updatable
+        self.budgets = dict(budgets)
+        self.available = {depot_id: np.array(mask, dtype=bool) for depot_id, mask in available.items()}
+        self.peak_cap_kw = peak_cap_kw
+        self.peak_floor_kw = peak_floor_kw
 
         for depot_id, depot_vehicles in vehicles_by_depot.items():
-            chargers = chargers_by_depot.get(depot_id, [])
+            charger_specs = []
+            for col in charger_columns(depot_id, chargers_by_depot.get(depot_id, []), self.pooled):
+                c_id = col["id"]
+                self.charger_depot[c_id] = depot_id
+                self.members[c_id] = col["members"]
+                self.column_of[c_id] = c_id
+                for member in col["members"]:
+                    self.column_of[member] = c_id
+                charger_specs.append((c_id, col["connector"], col["max_kw"]))
             for v in depot_vehicles:
                 v_id = v["id"]
                 v_conn = str(v.get("connector", "")).upper()
                 v_max = float(v.get("max_kw", 22.0))
-                dep = int(v["departure_hour"])  # exclusive
-                for h in range(min(horizon_hours, dep)):
-                    if self.kg.is_blackout(depot_id, h):
+                dep = int(round(float(v["departure_hour"]) / self.slot_hours))  # exclusive, in slots
+                vehicle_x = self.x_by_vehicle.setdefault(v_id, [])
+                for h in range(min(self.horizon, dep)):
+                    open_hour = bool(available[depot_id][h])
+                    if not open_hour and not updatable:
                         continue
-                    for ch in chargers:
-                        c_id = str(ch["id"])
-                        c_conn = str(ch.get("connector", "")).upper()
-                        c_max = float(ch.get("max_kw", 22.0))
+                    for c_id, c_conn, c_max in charger_specs:
                         if v_conn and c_conn and v_conn != c_conn:
                             continue  # incompatible
                         ub = min(v_max, c_max)
                         if ub <= 0:
                             continue
-                        x[(v_id, c_id, h)] = solver.NumVar(0.0, ub, f"x_{v_id}_{c_id}_{h}")
-                        z[(v_id, c_id, h)] = solver.BoolVar(f"z_{v_id}_{c_id}_{h}")
+                        key = (v_id, c_id, h)
+                        x_var = solver.NumVar(0.0, ub if open_hour else 0.0, f"x_{v_id}_{c_id}_{h}")
+                        z_var = solver.IntVar(0.0, 1.0 if open_hour else 0.0, f"z_{v_id}_{c_id}_{h}")
                         # Link x and z
-                        solver.Add(x[(v_id, c_id, h)] <= ub * z[(v_id, c_id, h)])
+                        solver.Add(x_var <= ub * z_var)
+                        self.x[key] = x_var
+                        self.z[key] = z_var
+                        self.x_ub[key] = ub
+                        self.keys_by_depot_hour.setdefault((depot_id, h), []).append(key)
+                        vehicle_x.append(x_var)
+                        self.z_by_vehicle_hour.setdefault((v_id, h), []).append(z_var)
+                        self.z_by_charger_hour.setdefault((c_id, h), []).append(z_var)
+                        self.x_by_depot_hour.setdefault((depot_id, h), []).append(x_var)
 
-        # Vehicle demand constraints: sum_c,h x[v,c,h] >= required_kwh
-        for v in fleet:
-            v_id = v["id"]
-            dep = int(v["departure_hour"])  # exclusive
-            need = float(v["required_kwh"])  # 1h slots: kW == kWh per slot
-            expr = solver.Sum(x.get((v_id, c_id, h), 0.0) for (vid, c_id, h) in x.keys() if vid == v_id and h < dep)
-            solver.Add(expr >= need)
+        # Vehicle demand constraints: sum_c,h x[v,c,h] * slot_hours >= required_kwh (and <= max_kwh if given)
+        for depot_vehicles in vehicles_by_depot.values():
+            for v in depot_vehicles:
+                energy = solver.Sum(self.x_by_vehicle.get(v["id"], []))
+                solver.Add(energy >= float(v["required_kwh"]) / self.slot_hours)
+                if v.get("max_kwh") is not None:
+                    solver.Add(energy <= float(v["max_kwh"]) / self.slot_hours)
+                if v.get("deferred_price"):
+                    self.deferred[v["id"]] = float(v["deferred_price"])
 
         # At most one charger per vehicle per hour
-        for v in fleet:
-            v_id = v["id"]
-            dep = int(v["departure_hour"])  # exclusive
-            for h in range(min(horizon_hours, dep)):
-                expr = solver.Sum(z.get((v_id, c_id, h), 0.0) for (vid, c_id, hh) in z.keys() if vid == v_id and hh == h)
-                if isinstance(expr, pywraplp.LinearExpr):
-                    solver.Add(expr <= 1)
-
-        # One vehicle per charger per hour
-        for depot_id, chargers in chargers_by_depot.items():
-            for ch in chargers:
-                c_id = str(ch["id"])
-                for h in range(horizon_hours):
-                    if self.kg.is_blackout(depot_id, h):
-                        # force zero
-                        for v in vehicles_by_depot[depot_id]:
-                            if (v["id"], c_id, h) in x:
-                                solver.Add(x[(v["id"], c_id, h)] <= 0.0)
-                                solver.Add(z[(v["id"], c_id, h)] <= 0.0)
-                        continue
-                    expr = solver.Sum(z.get((v["id"], c_id, h), 0.0) for v in vehicles_by_depot[depot_id])
-                    if isinstance(expr, pywraplp.LinearExpr):
-                        solver.Add(expr <= 1)
+        for zs in self.z_by_vehicle_hour.values():
+            if len(zs) > 1:
+                solver.Add(solver.Sum(zs) <= 1)
 
-        # Depot/hour capacity
-        for depot_id, depot_vehicles in vehicles_by_depot.items():
-            site_peak = self.kg.get_site_peak_limit_kw(depot_id)
-            total_capacity_kw = self.kg.get_total_capacity_kw(depot_id)
-            hour_budget_kw = min(site_peak, total_capacity_kw)
-            chargers = chargers_by_depot.get(depot_id, [])
-            for h in range(horizon_hours):
-                if self.kg.is_blackout(depot_id, h):
-                    continue  # already zeroed above
-                expr = solver.Sum(x.get((v["id"], ch["id"], h), 0.0) for v in depot_vehicles for ch in chargers)
-                if isinstance(expr, pywraplp.LinearExpr):
-                    solver.Add(expr <= hour_budget_kw)
+        # One vehicle per charger per hour (a pool takes one vehicle per member)
+        for (c_id, _h), zs in self.z_by_charger_hour.items():
+            slots = len(self.members[c_id])
+            if len(zs) > slots:
+                solver.Add(solver.Sum(zs) <= slots)
+
+        # Depot/hour capacity (unless updatable, blackout hours have no variables at all)
+        for (depot_id, h), xs in self.x_by_depot_hour.items():
+            self.capacity[(depot_id, h)] = solver.Add(solver.Sum(xs) <= self._cap(depot_id))
 
         # Objective
-        if objective == "peak":
-            P = solver.NumVar(0.0, solver.infinity(), "peak_var")
-            for depot_id, depot_vehicles in vehicles_by_depot.items():
-                chargers = chargers_by_depot.get(depot_id, [])
-                for h in range(horizon_hours):
-                    expr = solver.Sum(x.get((v["id"], ch["id"], h), 0.0) for v in depot_vehicles for ch in chargers)
-                    if isinstance(expr, pywraplp.LinearExpr):
-                        solver.Add(expr <= P)
-            cost_term = solver.Sum(price_curve[h] * x_var for ((_, _, h), x_var) in x.items())
+        cost_term = solver.Sum(self._energy_price(v_id, h) * x_var for ((v_id, _, h), x_var) in self.x.items())
+        if self.objective == "peak":
+            P = solver.NumVar(peak_floor_kw, solver.infinity(), "peak_var")
+            self.peak_var = P
+            for xs in self.x_by_depot_hour.values():
+                solver.Add(solver.Sum(xs) <= P)
             solver.Minimize(P + 0.001 * cost_term)
         else:
-            solver.Minimize(solver.Sum(price_curve[h] * x_var for ((_, _, h), x_var) in x.items()))
+            solver.Minimize(cost_term)
+        self.build_seconds = time.perf_counter() - t0
+
+    def _energy_price(self, v_id: str, h: int) -> float:
+        """Objective coefficient of 1 kW for ``v_id`` in slot ``h``: slot price net of its deferred value."""
+        return (self.price_curve[h] - self.deferred.get(v_id, 0.0)) * self.slot_hours
+
+    def _cap(self, depot_id: str) -> float:
+        budget = self.budgets[depot_id]
+        return budget if self.peak_cap_kw is None else min(budget, self.peak_cap_kw)
+
+    def update(
+        self,
+        budgets: Dict[str, float],
+        available: Dict[str, np.ndarray],
+        peak_cap_kw: Optional[float] = None,
+    ) -> int:
+        """
+        Apply new depot budgets, blackouts and peak cap in place; returns the number of changed rows.
+
+        Budget changes move capacity right-hand sides; availability changes open or close the
+        depot-hour's variables through their upper bounds. Nothing is rebuilt.
+        """
+        if not self.updatable:
+            raise RuntimeError("model was not built with updatable=True")
+        t0 = time.perf_counter()
+        self.budgets.update(budgets)
+        self.peak_cap_kw = peak_cap_kw
+        changed = 0
+        for (depot_id, _h), row in self.capacity.items():
+            cap = self._cap(depot_id)
+            if row.ub() != cap:
+                row.SetUb(cap)
+                changed += 1
+        for depot_id, mask in available.items():
+            mask = np.asarray(mask, dtype=bool)
+            old = self.available.get(depot_id)
+            if old is None:
+                continue
+            for h in np.flatnonzero(old != mask).tolist():
+                open_hour = bool(mask[h])
+                for key in self.keys_by_depot_hour.get((depot_id, h), []):
+                    self.x[key].SetUb(self.x_ub[key] if open_hour else 0.0)
+                    self.z[key].SetUb(1.0 if open_hour else 0.0)
+                changed += 1
+            self.available[depot_id] = mask.copy()
+        self.update_seconds = time.perf_counter() - t0
+        self.updates += 1
+        if changed:
+            self.solved = False
+        return changed
+
+    def set_hint(self, assignment: Dict[VarKey, float]) -> None:
+        """
+        Pass a per-charger assignment (e.g. a converted greedy schedule) to SCIP as a start solution.
+
+        Every variable gets a hinted value (0 where unassigned) so the start is complete; its
+        objective value is kept in ``hint_objective`` for reporting. Concrete charger ids are folded
+        into their pool columns.
+        """
+        values: Dict[VarKey, float] = {}
+        for (v_id, c_id, h), val in assignment.items():
+            key = (v_id, self.column_of.get(c_id, c_id), h)
+            if key in self.x and val > 1e-9 and self.x[key].ub() > 0:
+                values[key] = values.get(key, 0.0) + val
+        hint_vars: List[pywraplp.Variable] = []
+        hint_vals: List[float] = []
+        for key, x_var in self.x.items():
+            val = values.get(key, 0.0)
+            hint_vars.extend((x_var, self.z[key]))
+            hint_vals.extend((val, 1.0 if val > 0 else 0.0))
+
+        cost = sum(self._energy_price(v_id, h) * val for (v_id, _, h), val in values.items())
+        if self.peak_var is not None:
+            depot_hour: Dict[Tuple[str, int], float] = {}
+            for (_, c_id, h), val in values.items():
+                key = (self.charger_depot[c_id], h)
+                depot_hour[key] = depot_hour.get(key, 0.0) + val
+            peak = max(max(depot_hour.values(), default=0.0), self.peak_floor_kw)
+            hint_vars.append(self.peak_var)
+            hint_vals.append(peak)
+            self.hint_objective = peak + 0.001 * cost
+        else:
+            self.hint_objective = cost
+        self.solver.SetHint(hint_vars, hint_vals)
 
-        status = solver.Solve()
+    def solve(self, time_limit_seconds: Optional[float] = None) -> int:
+        if time_limit_seconds:
+            self.solver.SetTimeLimit(int(time_limit_seconds * 1000))
+        t0 = time.perf_counter()
+        status = self.solver.Solve()
+        self.solve_seconds = time.perf_counter() - t0
         if status not in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+            self.last_solution = {}
+            self.solved = False
             raise RuntimeError("MILP did not find a feasible solution")
+        # kept for warm re-solves: solution values are unreadable once the model is modified
+        self.last_solution = self.solution_assignment()
+        self.solved = True
+        return status
 
-        # Extract solution
-        per_vehicle: Dict[str, Dict[int, float]] = {}
-        per_depot: Dict[str, Dict[int, float]] = {}
-        # init per_depot
-        for depot_id in vehicles_by_depot.keys():
-            per_depot[depot_id] = {}
+    def stats(self) -> Dict[str, float]:
+        objective = self.solver.Objective()
+        value = float(objective.Value())
+        bound = float(objective.BestBound())
+        out = {
+            "build_seconds": self.build_seconds,
+            "solve_seconds": self.solve_seconds,
+            "variables": float(self.solver.NumVariables()),
+            "constraints": float(self.solver.NumConstraints()),
+            "objective_value": value,
+            "best_bound": bound,
+            "gap": abs(value - bound) / max(abs(value), 1e-9),
+        }
+        if self.hint_objective is not None:
+            out["warm_start_objective"] = float(self.hint_objective)
+        if self.updates:
+            out["update_seconds"] = self.update_seconds
+            out["model_updates"] = float(self.updates)
+        return out
 
-        for (v_id, c_id, h), var in x.items():
+    def solution_assignment(self) -> Dict[VarKey, float]:
+        """
+        Non-zero x values keyed by (vehicle, column, hour); usable as a hint for a related model.
+
+        Values whose z is 0 within SCIP's integrality tolerance are dropped: with a negative cost
+        coefficient (a ``deferred_price`` above the slot price) the solver would otherwise report
+        such crumbs on a charger that another vehicle holds.
+        """
+        out: Dict[VarKey, float] = {}
+        for key, var in self.x.items():
             val = var.solution_value()
-            if val <= 1e-9:
+            if val > 1e-9 and self.z[key].solution_value() > 0.5:
+                out[key] = float(val)
+        return out
+
+    def charger_assignment(self) -> Dict[VarKey, float]:
+        """Non-zero x values keyed by (vehicle, concrete charger, hour)."""
+        return expand_pools(self.solution_assignment(), self.members)
+
+    def solution_kw(self, row_of: Dict[str, int], n_rows: int) -> np.ndarray:
+        """Dense vehicle x hour matrix of the solved x values (same values as ``solution_assignment``)."""
+        kw = np.zeros((n_rows, self.horizon), dtype=float)
+        for (v_id, _c_id, h), val in self.solution_assignment().items():
+            kw[row_of[v_id], h] += val
+        return kw
+
+
+def solve_depot(task: Dict) -> Dict:
+    """
+    Solve one depot's sub-model.
+
+    Runs in a worker process, so inputs and outputs are plain picklable data: the task carries the
+    depot's vehicles, chargers, hour budget, availability mask, prices, objective and optional
+    peak cap / hint; the result carries the depot's kW rows (in task vehicle order), the non-zero
+    column-level assignment, its concrete charger assignment and the model stats.
+    """
+    depot_id = task["depot_id"]
+    vehicles = task["vehicles"]
+    model = MILPModel(
+        task["horizon"], task["price_curve"], task["objective"], pooled=task.get("pooled", False), slot_hours=task.get("slot_hours", 1.0)
+    )
+    model.build(
+        {depot_id: vehicles},
+        {depot_id: task["chargers"]},
+        {depot_id: task["budget"]},
+        {depot_id: task["available"]},
+        peak_cap_kw=task.get("peak_cap_kw"),
+        peak_floor_kw=task.get("peak_floor_kw", 0.0),
+    )
+    if task.get("hint"):
+        model.set_hint(task["hint"])
+    model.solve(task.get("time_limit_seconds"))
+    row_of = {v["id"]: i for i, v in enumerate(vehicles)}
+    return {
+        "depot_id": depot_id,
+        "kw": model.solution_kw(row_of, len(vehicles)),
+        "assignment": model.solution_assignment(),
+        "chargers": model.charger_assignment(),
+        "stats": model.stats(),
+    }
+
+
+def try_solve_depot(task: Dict) -> Dict:
+    """``solve_depot`` that reports a failure as ``{"depot_id", "error"}`` instead of raising."""
+    try:
+        return solve_depot(task)
+    except Exception as e:
+        return {"depot_id": task["depot_id"], "error": str(e)}
+
+
+class OptimizerMILP:
+    # live models kept for incremental re-solves (least recently used dropped first)
+    MAX_LIVE_MODELS = 8
+
+    def __init__(
+        self,
+        kg,
+        telemetry,
+        prices,
+        warm_start: bool = False,
+        time_limit_seconds: Optional[float] = None,
+        decompose: bool = False,
+        workers: Optional[int] = None,
+        pooled: bool = False,
+        incremental: bool = False,
+        window_hours: Optional[int] = None,
+        overlap_hours: int = 6,
+    ):
+        self.kg = kg
+        self.telemetry = telemetry
+        self.prices = prices
+        # defaults for optimize(); all can be overridden per call
+        self.warm_start = warm_start
+        self.time_limit_seconds = time_limit_seconds
+        self.decompose = decompose
+        self.workers = workers or os.cpu_count() or 1
+        self.pooled = pooled
+        self.incremental = incremental
+        self.window_hours = window_hours
+        self.overlap_hours = overlap_hours
+        self._live: "OrderedDict[Tuple, MILPModel]" = OrderedDict()
+        # optimize() may be called from several job threads: live models and the pool are shared
+        self._lock = threading.RLock()
+        self._greedy = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def optimize(
+        self,
+        horizon_hours: int,
+        objective: str = "cost",
+        warm_start: Optional[bool] = None,
+        initial_schedule: Optional[Schedule] = None,
+        time_limit_seconds: Optional[float] = None,
+        decompose: Optional[bool] = None,
+        pooled: Optional[bool] = None,
+        incremental: Optional[bool] = None,
+        kg=None,
+        fleet: Optional[List[Dict]] = None,
+        price_curve: Optional[List[float]] = None,
+        depots: Optional[Collection[str]] = None,
+        slot_minutes: int = 60,
+        window_hours: Optional[int] = None,
+        overlap_hours: Optional[int] = None,
+        peak_floor_kw: float = 0.0,
+    ) -> Schedule:
+        """
+        Solve the per-charger MILP.
+
+        With ``warm_start`` the greedy OptimizerService schedule (or ``initial_schedule`` when given)
+        is converted into a per-charger assignment and passed to SCIP as a start solution; its
+        objective is reported as ``warm_start_objective`` next to the final incumbent and gap.
+
+        With ``decompose`` one sub-model per depot is solved in a process pool (see
+        ``_solve_decomposed``) and the depot results are merged into one schedule.
+
+        With ``pooled`` identical chargers are solved as pools; either way the schedule carries the
+        concrete charger per vehicle-hour in ``Schedule.chargers``.
+
+        With ``incremental`` (monolithic solves only) the built model is kept alive, keyed by
+        everything except depot budgets and blackouts. A later call on the same fleet, prices and
+        chargers patches the live model with the current KG state (``MILPModel.update``) and
+        re-solves from the previous solution; ``initial_schedule`` still takes precedence as hint.
+        When nothing changed since the last solve, that solution is returned as is. A live model
+        whose solve fails is dropped.
+
+        ``kg`` overrides the optimizer's KG for this call (e.g. a scenario overlay); every KG view
+        keeps its own live models. ``fleet`` / ``price_curve`` reuse inputs the caller already
+        loaded; ``depots`` restricts the run to those depots' vehicles (exact for the cost
+        objective only, where depots are independent).
+
+        ``slot_minutes`` sets the time resolution (one column and one price per slot). Horizons
+        longer than ``window_hours`` are solved as a sequence of overlapping windows instead of one
+        model (see ``_optimize_windowed``); 0 or None disables windowing. ``peak_floor_kw`` is a
+        depot-hour peak already incurred before this horizon (windowed solves pass the running peak).
+        """
+        warm_start = self.warm_start if warm_start is None else warm_start
+        pooled = self.pooled if pooled is None else pooled
+        incremental = self.incremental if incremental is None else incremental
+        time_limit_seconds = time_limit_seconds or self.time_limit_seconds
+        decompose = self.decompose if decompose is None else decompose
+        window_hours = self.window_hours if window_hours is None else window_hours
+        overlap_hours = self.overlap_hours if overlap_hours is None else overlap_hours
+        kg = kg or self.kg
+        fleet = fleet if fleet is not None else self.telemetry.get_fleet_state()["vehicles"]
+        if depots is not None:
+            fleet = [v for v in fleet if v["depot_id"] in depots]
+        if window_hours and horizon_hours > window_hours:
+            return self._optimize_windowed(
+                horizon_hours, objective, window_hours, overlap_hours, slot_minutes, kg, fleet, price_curve, initial_schedule,
+                warm_start=warm_start, time_limit_seconds=time_limit_seconds, decompose=decompose, pooled=pooled,
+                peak_floor_kw=peak_floor_kw,
+            )
+        fleet, kg_index, price_curve, vehicles_by_depot, chargers_by_depot, budgets, available = self._prepare(
+            horizon_hours, kg, fleet, price_curve, slot_minutes
+        )
+        per_hour = slots_per_hour(slot_minutes)
+        slot_hours = 1.0 / per_hour
+        n_slots = horizon_hours * per_hour
+
+        row_of: Dict[str, int] = {v["id"]: i for i, v in enumerate(fleet)}
+        live_key = (id(kg), slot_hours, peak_floor_kw) + self._live_key(fleet, chargers_by_depot, price_curve, objective, pooled) if incremental and not decompose else None
+        with self._lock:
+            live = self._live.get(live_key) if live_key is not None else None
+        if initial_schedule is None and warm_start and live is None:
+            initial_schedule = self._greedy_optimizer().optimize(
+                horizon_hours=horizon_hours, objective=objective, kg=kg, fleet=fleet, price_curve=price_curve,
+                slot_minutes=slot_minutes,
+            )
+        hint: Optional[Dict[VarKey, float]] = None
+        if initial_schedule is not None:
+            hint = assign_chargers(self._align(initial_schedule, fleet, n_slots), row_of, vehicles_by_depot, chargers_by_depot)
+
+        if decompose:
+            tasks = self._depot_tasks(
+                vehicles_by_depot, chargers_by_depot, budgets, available, price_curve, objective, pooled, time_limit_seconds,
+                slot_hours,
+            )
+            for task in tasks:
+                task["hint"] = self._depot_hint(hint, task["vehicles"])
+                task["peak_floor_kw"] = peak_floor_kw
+            kw, chargers, stats = self._solve_decomposed(tasks, objective, row_of, len(fleet), price_curve, slot_hours)
+            return self._to_schedule(fleet, vehicles_by_depot, kw, price_curve, stats, chargers, slot_hours)
+
+        if live_key is None:
+            model = MILPModel(n_slots, price_curve, objective, pooled=pooled, slot_hours=slot_hours)
+            model.build(vehicles_by_depot, chargers_by_depot, budgets, available, peak_floor_kw=peak_floor_kw)
+            if hint is not None:
+                model.set_hint(hint)
+            model.solve(time_limit_seconds)
+            kw = model.solution_kw(row_of, len(fleet))
+            return self._to_schedule(
+                fleet, vehicles_by_depot, kw, price_curve, model.stats(), model.charger_assignment(), slot_hours
+            )
+
+        # self._lock only guards the table of live models; each model's own lock serializes its
+        # update/solve/read-back, so solves on different models (scenarios, objectives) run in parallel
+        with self._lock:
+            model = self._live.get(live_key)
+            if model is not None:
+                self._live.move_to_end(live_key)
+        if model is None:
+            built = MILPModel(n_slots, price_curve, objective, pooled=pooled, slot_hours=slot_hours)
+            built.build(vehicles_by_depot, chargers_by_depot, budgets, available, updatable=True, peak_floor_kw=peak_floor_kw)
+            built.kg_fingerprint = kg_index.fingerprint()
+            with self._lock:
+                # another thread may have built the same model meanwhile: share the first one
+                model = self._live.setdefault(live_key, built)
+                self._live.move_to_end(live_key)
+                while len(self._live) > self.MAX_LIVE_MODELS:
+                    self._live.popitem(last=False)
+
+        with model.lock:
+            if model.kg_fingerprint != kg_index.fingerprint():
+                model.update(budgets, available)
+                model.kg_fingerprint = kg_index.fingerprint()
+            if not model.solved:
+                if hint is not None or model.last_solution:
+                    model.set_hint(hint if hint is not None else model.last_solution)
+                try:
+                    model.solve(time_limit_seconds)
+                except RuntimeError:
+                    # SCIP may be left in a state it cannot re-solve from: rebuild on the next call
+                    with self._lock:
+                        if self._live.get(live_key) is model:
+                            del self._live[live_key]
+                    raise
+
+            # Extract solution into the dense vehicle x slot matrix
+            kw = model.solution_kw(row_of, len(fleet))
+            return self._to_schedule(
+                fleet, vehicles_by_depot, kw, price_curve, model.stats(), model.charger_assignment(), slot_hours
+            )
+
+    def _optimize_windowed(
+        self,
+        horizon_hours: int,
+        objective: str,
+        window_hours: int,
+        overlap_hours: int,
+        slot_minutes: int,
+        kg,
+        fleet: List[Dict],
+        price_curve: Optional[List[float]],
+        initial_schedule: Optional[Schedule],
+        **options,
+    ) -> Schedule:
+        """
+        Solve a long horizon as overlapping windows and stitch them into one schedule.
+
+        Windows of ``window_hours`` start every ``window_hours - overlap_hours`` hours and are solved
+        in sequence, each as an ordinary ``optimize`` call (so ``decompose`` still spreads a window's
+        depots over the pool). A window commits its slots up to the next window's start; the overlap
+        is re-planned by the next window, which sees further prices and is warm-started from the
+        uncommitted tail. Energy state is coupled across boundaries: every window sees each
+        vehicle's need minus what earlier windows committed. A vehicle still parked after the
+        window end must take only what it could not get afterwards at full power and may take up
+        to its whole need; what it leaves is valued at the cheapest price of its remaining stay, so
+        it is pulled into the window wherever that is cheaper. For the peak objective every window
+        gets ``peak_floor_kw``: the larger of the peak committed so far and a lower bound on the
+        whole horizon's peak (``_peak_lower_bound``), so early windows fill up to it for free.
+        Later capacity is estimated per vehicle, so a window can still turn infeasible when many
+        deferred vehicles compete for the same depot.
+        """
+        if not 0 <= overlap_hours < window_hours:
+            raise ValueError("window overlap must be shorter than the window")
+        t0 = time.perf_counter()
+        per_hour = slots_per_hour(slot_minutes)
+        slot_hours = 1.0 / per_hour
+        kg_index = kg.compiled()
+        price_curve = price_curve if price_curve is not None else self.prices.get_prices(horizon_hours, slot_minutes)
+        prices = np.asarray(price_curve, dtype=float)
+
+        vehicles_by_depot: Dict[str, List[Dict]] = {}
+        for v in fleet:
+            vehicles_by_depot.setdefault(v["depot_id"], []).append(v)
+        budgets = {depot_id: kg_index.get_hour_budget_kw(depot_id) for depot_id in vehicles_by_depot}
+        open_hours = {depot_id: kg_index.available_mask(depot_id, horizon_hours) for depot_id in vehicles_by_depot}
+
+        need = np.array([float(v["required_kwh"]) for v in fleet], dtype=float)
+        kw = np.zeros((len(fleet), horizon_hours * per_hour), dtype=float)
+        assignment: Dict[VarKey, float] = {}
+        sub_stats: List[Dict[str, float]] = []
+        tail: Optional[Schedule] = None
+        running_peak = options.pop("peak_floor_kw", 0.0)
+        if objective == "peak":
+            running_peak = max(running_peak, self._peak_lower_bound(vehicles_by_depot, open_hours, horizon_hours))
+        start = 0
+        while start < horizon_hours:
+            end = min(start + window_hours, horizon_hours)
+            commit = end if end == horizon_hours else end - overlap_hours
+            rows: List[int] = []
+            window_fleet: List[Dict] = []
+            for i, v in enumerate(fleet):
+                dep = min(int(v["departure_hour"]), horizon_hours)
+                if dep <= start or need[i] <= 1e-9:
+                    continue
+                record = {**v, "departure_hour": dep - start, "required_kwh": float(need[i])}
+                if dep > end:
+                    record.update(
+                        self._window_bounds(v, float(need[i]), end, dep, budgets, open_hours, prices, per_hour)
+                    )
+                rows.append(i)
+                window_fleet.append(record)
+
+            s0, n_commit = start * per_hour, (commit - start) * per_hour
+            if window_fleet:
+                part = self.optimize(
+                    end - start,
+                    objective,
+                    initial_schedule=initial_schedule.window(s0) if initial_schedule is not None else tail,
+                    incremental=False,
+                    kg=kg_index.shifted(start),
+                    fleet=window_fleet,
+                    price_curve=list(price_curve[s0: end * per_hour]),
+                    slot_minutes=slot_minutes,
+                    window_hours=0,
+                    peak_floor_kw=running_peak,
+                    **options,
+                )
+                committed = part.kw[:, :n_commit]
+                kw[rows, s0: s0 + n_commit] = committed
+                if objective == "peak" and n_commit:
+                    running_peak = max(running_peak, float(part.depot_kw[:, :n_commit].max()))
+                need[rows] -= committed.sum(axis=1) * slot_hours
+                for v_id, slots in part.chargers.items():
+                    row = part.vehicle_index[v_id]
+                    for h, c_id in slots.items():
+                        if h < n_commit:
+                            assignment[(v_id, c_id, s0 + h)] = float(part.kw[row, h])
+                tail = part.window(n_commit)
+                sub_stats.append(part.stats)
+            else:
+                tail = None
+            start = commit
+
+        stats = self._sum_stats(sub_stats, len(vehicles_by_depot), time.perf_counter() - t0)
+        stats.update(windows=float(len(sub_stats)), window_hours=float(window_hours), overlap_hours=float(overlap_hours))
+        schedule = self._to_schedule(fleet, vehicles_by_depot, kw, price_curve, stats, assignment, slot_hours)
+        cost = float(schedule.total_kw @ prices) * slot_hours
+        peak = float(schedule.depot_kw.max()) if schedule.depot_kw.size else 0.0
+        schedule.stats["objective_value"] = peak + 0.001 * cost if objective == "peak" else cost
+        return schedule
+
+    @staticmethod
+    def _peak_lower_bound(vehicles_by_depot: Dict[str, List[Dict]], open_hours: Dict[str, np.ndarray], horizon_hours: int) -> float:
+        """Largest depot load any plan needs: energy due by each departure over the open hours before it."""
+        bound = 0.0
+        for depot_id, vehicles in vehicles_by_depot.items():
+            open_before = np.concatenate(([0.0], np.cumsum(open_hours[depot_id])))
+            due = 0.0
+            for v in sorted(vehicles, key=lambda v: int(v["departure_hour"])):
+                due += float(v["required_kwh"])
+                hours = open_before[min(int(v["departure_hour"]), horizon_hours)]
+                if hours > 0:
+                    bound = max(bound, due / hours)
+        return bound
+
+    @staticmethod
+    def _window_bounds(
+        v: Dict,
+        need: float,
+        end: int,
+        departure: int,
+        budgets: Dict[str, float],
+        open_hours: Dict[str, np.ndarray],
+        prices: np.ndarray,
+        per_hour: int,
+    ) -> Dict[str, float]:
+        """Energy floor/ceiling (and deferred value) for a vehicle that stays past the window end."""
+        depot_id = v["depot_id"]
+        after = open_hours[depot_id][end:departure]
+        full_power = min(float(v.get("max_kw", 22.0)), budgets[depot_id])
+        bounds = {"required_kwh": max(0.0, need - full_power * float(after.sum())), "max_kwh": need}
+        later = prices[end * per_hour: departure * per_hour][np.repeat(after, per_hour)]
+        if later.size:
+            # a hair above the cheapest later price: ties charge now, as later capacity is only estimated
+            bounds["deferred_price"] = float(later.min()) + DEFERRAL_TIE_BREAK
+        return bounds
+
+    def frontier(
+        self,
+        horizon_hours: int,
+        points: int = 5,
+        pooled: Optional[bool] = None,
+        time_limit_seconds: Optional[float] = None,
+        kg=None,
+        slot_minutes: int = 60,
+        price_curve: Optional[List[float]] = None,
+    ) -> List[Schedule]:
+        """
+        Cost-vs-peak Pareto sweep (epsilon constraint on the depot-hour peak).
+
+        The cost-optimal and peak-optimal depot sub-models are solved together in one pool round;
+        the largest depot peak of each bounds the sweep to [P_min, P_max]. For ``points`` caps spread
+        over that range, every depot whose cost-optimal plan exceeds the cap is re-solved for minimum
+        cost under it (all caps in a second pool round); the others reuse their cost-optimal plan.
+        Schedules are returned from the peak-optimal end to the cost-optimal end, each with
+        ``peak_cap_kw`` in its stats.
+        """
+        t0 = time.perf_counter()
+        pooled = self.pooled if pooled is None else pooled
+        time_limit_seconds = time_limit_seconds or self.time_limit_seconds
+        slot_hours = 1.0 / slots_per_hour(slot_minutes)
+        fleet, _kg_index, price_curve, vehicles_by_depot, chargers_by_depot, budgets, available = self._prepare(
+            horizon_hours, kg or self.kg, price_curve=price_curve, slot_minutes=slot_minutes
+        )
+        row_of: Dict[str, int] = {v["id"]: i for i, v in enumerate(fleet)}
+        tasks = self._depot_tasks(
+            vehicles_by_depot, chargers_by_depot, budgets, available, price_curve, "cost", pooled, time_limit_seconds,
+            slot_hours,
+        )
+
+        first = self._map(tasks + [dict(task, objective="peak") for task in tasks])
+        cost_results = {r["depot_id"]: r for r in first[: len(tasks)]}
+        peak_results = {r["depot_id"]: r for r in first[len(tasks):]}
+        cost_peaks = {d: self._depot_peak(r) for d, r in cost_results.items()}
+        p_min = max((self._depot_peak(r) for r in peak_results.values()), default=0.0)
+        p_max = max(cost_peaks.values(), default=0.0)
+        caps = [p_max] if p_max - p_min <= 1e-6 else np.linspace(p_min, p_max, max(points, 2)).tolist()
+
+        # Second round: every (cap, depot) whose cost-optimal plan does not fit under the cap
+        rerun_keys: List[Tuple[int, str]] = []
+        rerun: List[Dict] = []
+        for k, cap in enumerate(caps):
+            for task in tasks:
+                depot_id = task["depot_id"]
+                if cost_peaks[depot_id] > cap + 1e-6:
+                    rerun_keys.append((k, depot_id))
+                    rerun.append(dict(task, peak_cap_kw=cap, hint=peak_results[depot_id]["assignment"]))
+        capped: Dict[Tuple[int, str], Dict] = dict(zip(rerun_keys, self._map(rerun)))
+
+        sub_stats = [r["stats"] for r in first] + [r["stats"] for r in capped.values()]
+        wall_seconds = time.perf_counter() - t0
+        schedules: List[Schedule] = []
+        for k, cap in enumerate(caps):
+            results = {d: capped.get((k, d), r) for d, r in cost_results.items()}
+            kw, chargers = self._merge_depots(results, tasks, row_of, len(fleet), len(price_curve))
+            stats = self._sum_stats(sub_stats, len(tasks), wall_seconds)
+            stats["peak_cap_kw"] = float(cap)
+            stats["objective_value"] = float(kw.sum(axis=0) @ np.asarray(price_curve, dtype=float)) * slot_hours
+            schedules.append(self._to_schedule(fleet, vehicles_by_depot, kw, price_curve, stats, chargers, slot_hours))
+        return schedules
+
+    def batch(
+        self,
+        runs: List[Tuple[int, str, object]],
+        fleet: Optional[List[Dict]] = None,
+        pooled: Optional[bool] = None,
+        time_limit_seconds: Optional[float] = None,
+        slot_minutes: int = 60,
+        start: Optional[datetime] = None,
+    ) -> List[Union[Schedule, Exception]]:
+        """
+        Solve many (horizon, objective, kg) variants in shared pool rounds.
+
+        The fleet and each horizon's price curve (one price per slot of ``slot_minutes``, from
+        ``start``) are loaded once. Every variant is split per depot as
+        in ``optimize(decompose=True)``, and identical depot sub-models (same depot, budget, blackout
+        mask, prices and objective) are solved once for all variants containing them; a what-if
+        usually touches one depot, so the others come for free. Peak variants get the usual capped
+        second round. A variant with a depot that fails to solve yields the exception instead.
+        """
+        t0 = time.perf_counter()
+        pooled = self.pooled if pooled is None else pooled
+        time_limit_seconds = time_limit_seconds or self.time_limit_seconds
+        slot_hours = 1.0 / slots_per_hour(slot_minutes)
+        fleet = fleet if fleet is not None else self.telemetry.get_fleet_state()["vehicles"]
+        row_of: Dict[str, int] = {v["id"]: i for i, v in enumerate(fleet)}
+        curves: Dict[int, List[float]] = {}
+        prepared = []
+        for horizon_hours, objective, kg in runs:
+            if horizon_hours not in curves:
+                curves[horizon_hours] = self.prices.get_prices(horizon_hours, slot_minutes, start=start)
+            _, _, price_curve, vehicles_by_depot, chargers_by_depot, budgets, available = self._prepare(
+                horizon_hours, kg, fleet, curves[horizon_hours], slot_minutes
+            )
+            tasks = self._depot_tasks(
+                vehicles_by_depot, chargers_by_depot, budgets, available, price_curve, objective, pooled, time_limit_seconds,
+                slot_hours,
+            )
+            prepared.append((objective, price_curve, vehicles_by_depot, tasks))
+
+        first, unique = self._map_unique([task for *_, tasks in prepared for task in tasks])
+        results: List[Dict[str, Dict]] = []
+        offset = 0
+        for _, _, _, tasks in prepared:
+            results.append({r["depot_id"]: r for r in first[offset: offset + len(tasks)]})
+            offset += len(tasks)
+
+        # Second round: peak variants re-solve their other depots for cost under the common peak
+        targets: Dict[int, float] = {}
+        rerun_keys: List[Tuple[int, str]] = []
+        rerun: List[Dict] = []
+        for k, (objective, _, _, tasks) in enumerate(prepared):
+            if objective != "peak" or not tasks or any("error" in r for r in results[k].values()):
+                continue
+            peaks = {d: self._depot_peak(r) for d, r in results[k].items()}
+            targets[k] = max(peaks.values())
+            for task in tasks:
+                if peaks[task["depot_id"]] < targets[k] - 1e-6:
+                    rerun_keys.append((k, task["depot_id"]))
+                    rerun.append(dict(task, objective="cost", peak_cap_kw=targets[k], hint=results[k][task["depot_id"]]["assignment"]))
+        second, unique_rerun = self._map_unique(rerun)
+        for (k, depot_id), r in zip(rerun_keys, second):
+            results[k][depot_id] = r
+
+        wall_seconds = time.perf_counter() - t0
+        out: List[Union[Schedule, Exception]] = []
+        for k, (objective, price_curve, vehicles_by_depot, tasks) in enumerate(prepared):
+            failed = [f"{d}: {r['error']}" for d, r in results[k].items() if "error" in r]
+            if failed:
+                out.append(RuntimeError("; ".join(failed)))
                 continue
-            per_vehicle.setdefault(v_id, {})[h] = per_vehicle.get(v_id, {}).get(h, 0.0) + float(val)
-            # find depot for charger
-            depot_id = None
-            for dep, chargers in chargers_by_depot.items():
-                if any(str(ch["id"]) == str(c_id) for ch in chargers):
-                    depot_id = dep
-                    break
-            if depot_id is not None:
-                per_depot[depot_id][h] = per_depot[depot_id].get(h, 0.0) + float(val)
+            kw, chargers = self._merge_depots(results[k], tasks, row_of, len(fleet), len(price_curve))
+            cost = float(kw.sum(axis=0) @ np.asarray(price_curve, dtype=float)) * slot_hours
+            stats = self._sum_stats([r["stats"] for r in results[k].values()], len(tasks), wall_seconds)
+            if k in targets:
+                stats["peak_target_kw"] = targets[k]
+                stats["objective_value"] = targets[k] + 0.001 * cost
+            else:
+                stats["objective_value"] = cost
+            stats["batch_variants"] = float(len(runs))
+            stats["batch_subproblems"] = float(len(first) + len(second))
+            stats["batch_solved"] = float(unique + unique_rerun)
+            out.append(self._to_schedule(fleet, vehicles_by_depot, kw, price_curve, stats, chargers, slot_hours))
+        return out
+
+    def _solve_decomposed(
+        self,
+        tasks: List[Dict],
+        objective: str,
+        row_of: Dict[str, int],
+        n_rows: int,
+        price_curve: List[float],
+        slot_hours: float = 1.0,
+    ) -> Tuple[np.ndarray, Dict[VarKey, float], Dict[str, float]]:
+        """
+        Solve per-depot sub-models concurrently and merge them.
 
+        Cost: depots share nothing, so one round of independent solves is exact.
+        Peak: depots are linked only through the common peak P. Round one minimizes each depot's own
+        peak; the largest of those is the common target P*, since no schedule can go below it. Round two
+        re-solves every other depot for minimum cost under the cap P*, hinted with its round-one
+        solution (which already satisfies the cap).
+        """
+        t0 = time.perf_counter()
+        results = {r["depot_id"]: r for r in self._map(tasks)}
+        sub_stats = [r["stats"] for r in results.values()]
+
+        peak_target = None
+        if objective == "peak" and results:
+            peaks = {d: self._depot_peak(r) for d, r in results.items()}
+            peak_target = max([*peaks.values(), *(task.get("peak_floor_kw", 0.0) for task in tasks)])
+            rerun = [
+                dict(task, objective="cost", peak_cap_kw=peak_target, hint=results[task["depot_id"]]["assignment"])
+                for task in tasks
+                if peaks[task["depot_id"]] < peak_target - 1e-6
+            ]
+            for r in self._map(rerun):
+                results[r["depot_id"]] = r
+                sub_stats.append(r["stats"])
+
+        kw, chargers = self._merge_depots(results, tasks, row_of, n_rows, len(price_curve))
+        cost = float(kw.sum(axis=0) @ np.asarray(price_curve, dtype=float)) * slot_hours
+        stats = self._sum_stats(sub_stats, len(tasks), time.perf_counter() - t0)
+        if peak_target is not None:
+            stats["peak_target_kw"] = peak_target
+            stats["objective_value"] = peak_target + 0.001 * cost
+        else:
+            stats["objective_value"] = cost
+            stats["best_bound"] = float(sum(r["stats"]["best_bound"] for r in results.values()))
+        return kw, chargers, stats
+
+    def _prepare(
+        self,
+        horizon_hours: int,
+        kg,
+        fleet: Optional[List[Dict]] = None,
+        price_curve: Optional[List[float]] = None,
+        slot_minutes: int = 60,
+    ) -> Tuple:
+        """
+        Fleet, KG snapshot, prices and the per-depot model inputs for one run (fleet/prices may be
+        shared). Prices and availability masks have one entry per slot of ``slot_minutes``.
+        """
+        fleet = fleet if fleet is not None else self.telemetry.get_fleet_state()["vehicles"]
+        kg_index = kg.compiled()
+        per_hour = slots_per_hour(slot_minutes)
+        price_curve = price_curve if price_curve is not None else self.prices.get_prices(horizon_hours, slot_minutes)
+
+        vehicles_by_depot: Dict[str, List[Dict]] = {}
+        for v in fleet:
+            vehicles_by_depot.setdefault(v["depot_id"], []).append(v)
+
+        chargers_by_depot: Dict[str, List[Dict]] = {}
+        budgets: Dict[str, float] = {}
+        available: Dict[str, np.ndarray] = {}
+        for depot_id in vehicles_by_depot.keys():
+            chargers_by_depot[depot_id] = kg_index.chargers.get(depot_id, [])
+            budgets[depot_id] = kg_index.get_hour_budget_kw(depot_id)
+            # False inside blackout windows
+            available[depot_id] = np.repeat(kg_index.available_mask(depot_id, horizon_hours), per_hour)
+        return fleet, kg_index, price_curve, vehicles_by_depot, chargers_by_depot, budgets, available
+
+    @staticmethod
+    def _depot_tasks(
+        vehicles_by_depot: Dict[str, List[Dict]],
+        chargers_by_depot: Dict[str, List[Dict]],
+        budgets: Dict[str, float],
+        available: Dict[str, np.ndarray],
+        price_curve: List[float],
+        objective: str,
+        pooled: bool,
+        time_limit_seconds: Optional[float],
+        slot_hours: float = 1.0,
+    ) -> List[Dict]:
+        return [
+            {
+                "depot_id": depot_id,
+                "vehicles": depot_vehicles,
+                "chargers": chargers_by_depot[depot_id],
+                "budget": budgets[depot_id],
+                "available": available[depot_id],
+                "horizon": len(available[depot_id]),
+                "price_curve": list(price_curve),
+                "objective": objective,
+                "pooled": pooled,
+                "time_limit_seconds": time_limit_seconds,
+                "slot_hours": slot_hours,
+                "hint": None,
+            }
+            for depot_id, depot_vehicles in vehicles_by_depot.items()
+        ]
+
+    @staticmethod
+    def _depot_peak(result: Dict) -> float:
+        return float(result["kw"].sum(axis=0).max()) if result["kw"].size else 0.0
+
+    @staticmethod
+    def _merge_depots(
+        results: Dict[str, Dict],
+        tasks: List[Dict],
+        row_of: Dict[str, int],
+        n_rows: int,
+        horizon_hours: int,
+    ) -> Tuple[np.ndarray, Dict[VarKey, float]]:
+        kw = np.zeros((n_rows, horizon_hours), dtype=float)
+        chargers: Dict[VarKey, float] = {}
+        for task in tasks:
+            chargers.update(results[task["depot_id"]]["chargers"])
+            depot_kw = results[task["depot_id"]]["kw"]
+            for i, v in enumerate(task["vehicles"]):
+                kw[row_of[v["id"]]] = depot_kw[i]
+        return kw, chargers
+
+    def _sum_stats(self, sub_stats: List[Dict[str, float]], depots: int, wall_seconds: float) -> Dict[str, float]:
+        stats: Dict[str, float] = {
+            key: float(sum(st[key] for st in sub_stats)) for key in ("build_seconds", "solve_seconds", "variables", "constraints")
+        }
+        stats["wall_seconds"] = wall_seconds
+        stats["depots"] = float(depots)
+        stats["workers"] = float(min(self.workers, max(depots, 1)))
+        stats["gap"] = max((st["gap"] for st in sub_stats), default=0.0)
+        return stats
+
+    @staticmethod
+    def _live_key(
+        fleet: List[Dict],
+        chargers_by_depot: Dict[str, List[Dict]],
+        price_curve: List[float],
+        objective: str,
+        pooled: bool,
+    ) -> Tuple:
+        """Everything that shapes the model apart from budgets and blackouts (those are updated in place)."""
+        vehicles = tuple(
+            (str(v["id"]), str(v["depot_id"]), str(v.get("connector", "")).upper(), float(v.get("max_kw", 22.0)),
+             int(v["departure_hour"]), float(v["required_kwh"]))
+            for v in fleet
+        )
+        chargers = tuple(
+            (depot_id, str(ch["id"]), str(ch.get("connector", "")).upper(), float(ch.get("max_kw", 22.0)))
+            for depot_id, depot_chargers in chargers_by_depot.items()
+            for ch in depot_chargers
+        )
+        return vehicles, chargers, tuple(float(p) for p in price_curve), objective, pooled
+
+    def forget(self, kg) -> int:
+        """
+        Drop the live models built on KG view ``kg`` (e.g. a dropped scenario); returns how many.
+        Live models are keyed by the view's ``id``, which a later view may reuse once this one is gone.
+        """
+        with self._lock:
+            keys = [key for key in self._live if key[0] == id(kg)]
+            for key in keys:
+                del self._live[key]
+        return len(keys)
+
+    def start_pool(self) -> None:
+        """
+        Start the worker processes now, forked from this process. Only call it while the process
+        is still single-threaded (at startup): a pool created later, from job threads, is
+        spawned instead, since forking while other threads hold locks can deadlock the workers.
+        """
+        if self.workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+            return
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("fork"))
+                # a fork pool launches all its workers with the first task
+                self._pool.submit(os.getpid).result()
+
+    def _map(self, tasks: List[Dict], fn: Callable[[Dict], Dict] = solve_depot) -> List[Dict]:
+        if len(tasks) <= 1 or self.workers <= 1:
+            return [fn(task) for task in tasks]
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            pool = self._pool
+        return list(pool.map(fn, tasks))
+
+    def _map_unique(self, tasks: List[Dict]) -> Tuple[List[Dict], int]:
+        """Solve each distinct depot sub-model once (failures reported, not raised); returns (results, solved)."""
+        unique: Dict[Tuple, Dict] = {}
+        for task in tasks:
+            unique.setdefault(self._task_key(task), task)
+        solved = dict(zip(unique.keys(), self._map(list(unique.values()), try_solve_depot)))
+        return [solved[self._task_key(task)] for task in tasks], len(unique)
+
+    @staticmethod
+    def _task_key(task: Dict) -> Tuple:
+        # vehicles and chargers are per depot and shared by every task of one batch
+        return (
+            task["depot_id"], task["objective"], task["pooled"], task["budget"], task.get("peak_cap_kw"),
+            task["available"].tobytes(), tuple(task["price_curve"]), task["slot_hours"], task.get("peak_floor_kw"),
+        )
+
+    @staticmethod
+    def _depot_hint(hint: Optional[Dict[VarKey, float]], depot_vehicles: List[Dict]) -> Optional[Dict[VarKey, float]]:
+        if not hint:
+            return None
+        ids = {v["id"] for v in depot_vehicles}
+        return {key: val for key, val in hint.items() if key[0] in ids}
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def _greedy_optimizer(self):
+        if self._greedy is None:
+            from services.optimizer_service import OptimizerService
+
+            self._greedy = OptimizerService(kg=self.kg, telemetry=self.telemetry, prices=self.prices)
+        return self._greedy
+
+    @staticmethod
+    def _align(schedule: Schedule, fleet: List[Dict], horizon: int) -> np.ndarray:
+        """Re-index a schedule's kW matrix onto this run's fleet order and horizon (in slots)."""
+        kw = np.zeros((len(fleet), horizon), dtype=float)
+        width = min(horizon, schedule.horizon)
+        for i, v in enumerate(fleet):
+            row = schedule.vehicle_index.get(str(v["id"]))
+            if row is not None:
+                kw[i, :width] = schedule.kw[row, :width]
+        return kw
+
+    def _to_schedule(
+        self,
+        fleet: List[Dict],
+        vehicles_by_depot: Dict[str, List[Dict]],
+        kw: np.ndarray,
+        price_curve: List[float],
+        stats: Dict[str, float],
+        assignment: Optional[Dict[VarKey, float]] = None,
+        slot_hours: float = 1.0,
+    ) -> Schedule:
         # Explanations: top per-hour allocations
-        items: List[Tuple[str, int, float]] = []
-        for v_id, alloc in per_vehicle.items():
-            for h, kw in alloc.items():
-                items.append((v_id, h, kw))
+        rows, hours = np.nonzero(kw)
+        items: List[Tuple[str, int, float]] = [
+            (fleet[r]["id"], h, float(kw[r, h])) for r, h in zip(rows.tolist(), hours.tolist())
+        ]
         items.sort(key=lambda t: (-t[2], price_curve[t[1]] if t[1] < len(price_curve) else 0.0))
         explanations: List[str] = []
-        for v_id, h, kw in items[:20]:
-            explanations.append(f"{v_id} @h{h}: {kw:.1f}kW via MILP")
+        for v_id, h, val in items[:20]:
+            explanations.append(f"{v_id} @h{h * slot_hours:g}: {val:.1f}kW via MILP")
 
         # Remaining need approximation
-        remaining_kwh: Dict[str, float] = {}
-        for v in fleet:
-            v_id = v["id"]
-            need = float(v["required_kwh"]) - sum(per_vehicle.get(v_id, {}).values())
-            remaining_kwh[v_id] = need
-
-        return {
-            "per_vehicle": per_vehicle,
-            "per_depot": per_depot,
-            "price_curve": price_curve,
-            "explanations": explanations,
-            "remaining_kwh": remaining_kwh,
-        }
+        required = np.array([float(v["required_kwh"]) for v in fleet], dtype=float)
+        remaining_kwh = required - kw.sum(axis=1) * slot_hours
+
+        # Concrete charger per vehicle-hour, in hour order
+        chargers: Dict[str, Dict[int, str]] = {}
+        for v_id, c_id, h in sorted(assignment or {}, key=lambda key: key[2]):
+            chargers.setdefault(v_id, {})[h] = c_id
+
+        return Schedule(
+            vehicle_ids=[v["id"] for v in fleet],
+            vehicle_depots=[v["depot_id"] for v in fleet],
+            kw=kw,
+            price_curve=price_curve,
+            remaining_kwh=remaining_kwh,
+            required_kwh=required,
+            explanations=explanations,
+            depot_ids=list(vehicles_by_depot.keys()),
+            stats=stats,
+            chargers=chargers,
+            slot_hours=slot_hours,
+        )
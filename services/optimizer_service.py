@@ -1,4 +1,81 @@
-from typing import Dict, List, Tuple
+from bisect import bisect_left, bisect_right, insort
+from typing import Collection, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from services.fleet_store import FleetStore, as_fleet_store
+from services.schedule import Schedule, slots_per_hour
+
+
+def water_fill(loads: np.ndarray, caps: np.ndarray, need: float) -> np.ndarray:
+    """
+    Valley-filling grants for one vehicle.
+
+    Finds the water level ``lam`` such that ``sum(clip(lam - loads, 0, caps)) == need`` and returns
+    the per-hour grants; if the caps cannot cover ``need`` every hour is filled to its cap.
+    The fill curve is piecewise linear with breakpoints at ``loads`` and ``loads + caps``, so it is
+    evaluated at every breakpoint with two sorted prefix sums (O(H log H)) and interpolated.
+    """
+    tops = loads + caps
+    if float(caps.sum()) <= need:
+        return caps.copy()
+    starts = np.sort(loads)
+    ends = np.sort(tops)
+    start_sums = np.concatenate(([0.0], np.cumsum(starts)))
+    end_sums = np.concatenate(([0.0], np.cumsum(ends)))
+    levels = np.unique(np.concatenate((starts, ends)))
+    k_start = np.searchsorted(starts, levels, side="right")
+    k_end = np.searchsorted(ends, levels, side="right")
+    filled = (k_start * levels - start_sums[k_start]) - (k_end * levels - end_sums[k_end])
+
+    i = int(np.searchsorted(filled, need, side="left"))
+    if i == 0:
+        lam = float(levels[0])
+    else:
+        lo, hi = float(levels[i - 1]), float(levels[i])
+        f_lo, f_hi = float(filled[i - 1]), float(filled[i])
+        lam = lo + (hi - lo) * (need - f_lo) / (f_hi - f_lo)
+    return np.clip(lam - loads, 0.0, caps)
+
+
+class DepartureQueue:
+    """
+    Active vehicles of one depot for the cost allocator, indexed by departure slot.
+
+    Vehicles are bucketed by departure once; each bucket holds (remaining_kwh, seq) entries in
+    ascending order (seq is the vehicle's position in ``rows``, the depot's fleet rows, so ties
+    keep fleet order). Walking the buckets with departure > slot yields the candidates for that
+    slot in (departure, remaining) order; vehicles leave their bucket once fully served. Departure
+    hours are converted with ``slots_per_hour`` (1 for hourly slots).
+    """
+
+    def __init__(self, rows: np.ndarray, fleet: FleetStore, remaining_kwh: np.ndarray, slots_per_hour: int = 1):
+        self.rows: List[int] = rows.tolist()
+        self.departures: List[int] = (fleet.departure_hour[rows] * slots_per_hour).tolist()
+        self.max_kw: List[float] = fleet.max_kw[rows].tolist()
+        self._buckets: Dict[int, List[Tuple[float, int]]] = {}
+        for seq, need in enumerate(remaining_kwh[rows].tolist()):
+            if need > 0:
+                self._buckets.setdefault(self.departures[seq], []).append((need, seq))
+        for bucket in self._buckets.values():
+            bucket.sort()
+        self._keys = sorted(self._buckets)
+
+    def candidates(self, hour: int) -> Iterator[Tuple[int, float, int]]:
+        """Yield (departure, remaining_kwh, seq) for vehicles departing after ``hour``."""
+        for dep in self._keys[bisect_right(self._keys, hour):]:
+            for need, seq in self._buckets[dep]:
+                yield dep, need, seq
+
+    def update(self, seq: int, old_need: float, new_need: float) -> None:
+        dep = self.departures[seq]
+        bucket = self._buckets[dep]
+        del bucket[bisect_left(bucket, (old_need, seq))]
+        if new_need > 0:
+            insort(bucket, (new_need, seq))
+        elif not bucket:
+            del self._buckets[dep]
+            del self._keys[bisect_left(self._keys, dep)]
 
 
 class OptimizerService:
@@ -7,139 +84,158 @@ class OptimizerService:
         self.telemetry = telemetry
         self.prices = prices
 
-    def optimize(self, horizon_hours: int, request_text: str = "", objective: str = "cost") -> Dict:
-        fleet = self.telemetry.get_fleet_state()["vehicles"]
-        price_curve: List[float] = self.prices.get_prices(horizon_hours)
-
-        vehicles_by_depot: Dict[str, List[Dict]] = {}
-        for v in fleet:
-            vehicles_by_depot.setdefault(v["depot_id"], []).append(v)
+    def optimize(
+        self,
+        horizon_hours: int,
+        request_text: str = "",
+        objective: str = "cost",
+        kg=None,
+        fleet: Union[FleetStore, Sequence[Dict], None] = None,
+        price_curve: Optional[List[float]] = None,
+        depots: Optional[Collection[str]] = None,
+        slot_minutes: int = 60,
+    ) -> Schedule:
+        """
+        ``kg`` overrides the service's KG for this call (e.g. a scenario overlay); ``fleet`` and
+        ``price_curve`` let batch callers share one telemetry snapshot and price lookup. The
+        allocator reads the fleet's columns (``FleetStore``); vehicle dicts are converted first. ``depots``
+        restricts the run to those depots' vehicles; both objectives allocate depot by depot, so
+        that part of the plan is the same as in a full run.
+
+        ``slot_minutes`` sets the time resolution: the plan has one column per slot, a grant of
+        g kW in a slot delivers g * slot length kWh, and ``price_curve`` has one price per slot.
+        Departures and blackout windows stay on whole hours.
+        """
+        # TelemetryService hands out FleetRecords, which unwrap to their store without a copy
+        fleet = as_fleet_store(fleet if fleet is not None else self.telemetry.get_fleet_state()["vehicles"])
+        if depots is not None:
+            fleet = fleet.select(depots)
+        kg_index = (kg or self.kg).compiled()
+        per_hour = slots_per_hour(slot_minutes)
+        slot_hours = 1.0 / per_hour
+        n_slots = horizon_hours * per_hour
+        price_curve = price_curve if price_curve is not None else self.prices.get_prices(horizon_hours, slot_minutes)
+
+        # rows of each depot's vehicles, in fleet order
+        vehicles_by_depot: Dict[str, np.ndarray] = fleet.depot_rows()
+        ids = fleet.ids
 
         price_order: List[Tuple[int, float]] = sorted(
             [(h, p) for h, p in enumerate(price_curve)], key=lambda x: x[1]
         )
 
-        per_vehicle: Dict[str, Dict[int, float]] = {}
-        per_depot: Dict[str, Dict[int, float]] = {}
+        # kw[row, slot]: vehicle rows follow fleet order; depot_load[depot, slot] is the running aggregate
+        depot_row: Dict[str, int] = {depot_id: d for d, depot_id in enumerate(vehicles_by_depot.keys())}
+        kw = np.zeros((len(fleet), n_slots), dtype=float)
+        depot_load = np.zeros((len(depot_row), n_slots), dtype=float)
         explanations: List[str] = []
 
-        remaining_kwh: Dict[str, float] = {v["id"]: float(v["required_kwh"]) for v in fleet}
+        remaining_kwh = fleet.required_kwh.copy()
 
-        for depot_id, depot_vehicles in vehicles_by_depot.items():
-            per_depot[depot_id] = {}
+        # available[d, slot]: False inside blackout windows, precomputed once per run
+        available = np.ones((len(depot_row), n_slots), dtype=bool)
+        for depot_id, d in depot_row.items():
+            available[d] = np.repeat(kg_index.available_mask(depot_id, horizon_hours), per_hour)
 
         if objective == "peak":
-            # Peak-aware heuristic: for each depot, allocate each vehicle to the hours with lowest current depot load first,
-            # breaking ties by cheaper price.
+            # Peak-aware valley filling: each vehicle (earliest departure, then largest need first) raises
+            # a water level over its eligible hours so the depot load profile stays as flat as possible.
             for depot_id, depot_vehicles in vehicles_by_depot.items():
-                site_peak = self.kg.get_site_peak_limit_kw(depot_id)
-                total_capacity_kw = self.kg.get_total_capacity_kw(depot_id)
-                max_sessions = self.kg.get_max_concurrent_chargers(depot_id)
-                sessions_map: Dict[int, int] = {}
-
-                # Sort vehicles by earliest departure, then largest need
-                depot_vehicles_sorted = sorted(
-                    depot_vehicles,
-                    key=lambda v: (int(v["departure_hour"]), -remaining_kwh[v["id"]]),
-                )
-
-                for v in depot_vehicles_sorted:
-                    v_id = v["id"]
-                    need = remaining_kwh[v_id]
-                    v_max = float(v.get("max_kw", 22.0))
-                    dep = int(v["departure_hour"])
+                d = depot_row[depot_id]
+                hour_budget_kw = kg_index.get_hour_budget_kw(depot_id)
+                max_sessions = kg_index.get_max_concurrent_chargers(depot_id)
+                sessions = np.zeros(n_slots, dtype=np.int64)
+
+                # earliest departure first, then largest need; ties keep fleet order
+                order = depot_vehicles[np.lexsort((-remaining_kwh[depot_vehicles], fleet.departure_hour[depot_vehicles]))]
+                for row in order.tolist():
+                    v_id = ids[row]
+                    need = float(remaining_kwh[row])
                     if need <= 0:
                         continue
-
-                    # Iteratively allocate across hours from lowest-load → higher
-                    while need > 1e-6:
-                        # Build hour list for this vehicle respecting departure
-                        hours = [h for h in range(horizon_hours) if h < dep]
-                        if not hours:
-                            break
-                        # Sort hours by (current depot load, price) and skip blackout windows
-                        hours = [h for h in hours if not self.kg.is_blackout(depot_id, h)]
-                        hours.sort(key=lambda h: (per_depot[depot_id].get(h, 0.0), price_curve[h]))
-                        allocated_this_round = False
-                        for hour in hours:
-                            hour_budget_kw = min(site_peak, total_capacity_kw)
-                            current = per_depot[depot_id].get(hour, 0.0)
-                            if current >= hour_budget_kw:
-                                continue
-
-                            # Approximate sessions constraint by limiting per-hour allocations count
-                            # (we don't track sessions per connector; for MVP this is acceptable)
-                            if sessions_map.get(hour, 0) >= max_sessions:
-                                continue
-                            # Allocate up to v_max while respecting depot budget.
-                            grant = min(v_max, need, hour_budget_kw - current)
-                            if grant <= 0:
-                                continue
-                            per_vehicle.setdefault(v_id, {})[hour] = per_vehicle.get(v_id, {}).get(hour, 0.0) + grant
-                            per_depot[depot_id][hour] = current + grant
-                            remaining_kwh[v_id] -= grant
-                            need -= grant
-                            sessions_map[hour] = sessions_map.get(hour, 0) + 1
-                            allocated_this_round = True
-                            if len(explanations) < 20:
-                                explanations.append(
-                                    f"{v_id} @h{hour}: {grant:.1f}kW for peak-flattening (current depot h{hour}={per_depot[depot_id][hour]:.1f}kW, price=${price_curve[hour]:.2f})"
-                                )
-                            # Move to next hour after one grant to spread load
-                            break
-                        if not allocated_this_round:
+                    dep = min(int(fleet.departure_hour[row]) * per_hour, n_slots)
+                    load = depot_load[d, :dep]
+                    eligible = available[d, :dep] & (sessions[:dep] < max_sessions) & (load < hour_budget_kw)
+                    hours = np.flatnonzero(eligible)
+                    if hours.size == 0:
+                        continue
+                    caps = np.minimum(float(fleet.max_kw[row]), hour_budget_kw - load[hours])
+                    grants = water_fill(load[hours], caps, need / slot_hours)
+                    granted = grants > 1e-9
+                    hours, grants = hours[granted], grants[granted]
+
+                    kw[row, hours] += grants
+                    depot_load[d, hours] += grants
+                    sessions[hours] += 1
+                    remaining_kwh[row] = need - float(grants.sum()) * slot_hours
+                    for hour, grant in zip(hours.tolist(), grants.tolist()):
+                        if len(explanations) >= 20:
                             break
+                        at = f"h{hour * slot_hours:g}"
+                        explanations.append(
+                            f"{v_id} @{at}: {grant:.1f}kW for peak-flattening (current depot {at}={depot_load[d, hour]:.1f}kW, price=${price_curve[hour]:.2f})"
+                        )
         else:
-            # Cost objective (default): process hours by ascending price
+            # Cost objective (default): process hours by ascending price. Each depot keeps its active
+            # vehicles in a DepartureQueue, so candidates come out in (departure, remaining) order
+            # without re-filtering or re-sorting the depot's vehicles for every hour.
+            chargeable = fleet.has_connector & (fleet.max_kw > 0)
+            queues: Dict[str, DepartureQueue] = {}
+            for depot_id, depot_vehicles in vehicles_by_depot.items():
+                queues[depot_id] = DepartureQueue(
+                    depot_vehicles[chargeable[depot_vehicles]], fleet, remaining_kwh, per_hour
+                )
+            budgets = {depot_id: kg_index.get_hour_budget_kw(depot_id) for depot_id in vehicles_by_depot}
+
             for hour, price in price_order:
-                for depot_id, depot_vehicles in vehicles_by_depot.items():
+                for depot_id, queue in queues.items():
+                    d = depot_row[depot_id]
                     # Skip blackout windows at depot-hour
-                    if self.kg.is_blackout(depot_id, hour):
+                    if not available[d, hour]:
                         continue
-                    site_peak = self.kg.get_site_peak_limit_kw(depot_id)
-                    total_capacity_kw = self.kg.get_total_capacity_kw(depot_id)
-                    hour_budget_kw = min(site_peak, total_capacity_kw)
-                    max_sessions = self.kg.get_max_concurrent_chargers(depot_id)
-
-                    candidates = [
-                        v for v in depot_vehicles
-                        if remaining_kwh[v["id"]] > 0 and hour < int(v["departure_hour"]) and v.get("connector")
-                    ]
-
-                    candidates.sort(key=lambda v: (int(v["departure_hour"]), remaining_kwh[v["id"]]), reverse=False)
+                    hour_budget_kw = budgets[depot_id]
+                    max_sessions = kg_index.get_max_concurrent_chargers(depot_id)
 
                     sessions = 0
                     allocated_kw_this_hour = 0.0
+                    granted: List[Tuple[int, float, float]] = []
 
-                    for v in candidates:
+                    for dep, need, seq in queue.candidates(hour):
                         if sessions >= max_sessions or allocated_kw_this_hour >= hour_budget_kw:
                             break
 
-                        v_id = v["id"]
-                        v_max = float(v.get("max_kw", 22.0))
-                        need = remaining_kwh[v_id]
-                        if need <= 0:
-                            continue
-
-                        grant = min(v_max, need, hour_budget_kw - allocated_kw_this_hour)
+                        row = queue.rows[seq]
+                        grant = min(queue.max_kw[seq], need / slot_hours, hour_budget_kw - allocated_kw_this_hour)
                         if grant <= 0:
                             continue
 
-                        per_vehicle.setdefault(v_id, {})[hour] = per_vehicle.get(v_id, {}).get(hour, 0.0) + grant
-                        per_depot[depot_id][hour] = per_depot[depot_id].get(hour, 0.0) + grant
-                        remaining_kwh[v_id] -= grant
+                        left = need - grant * slot_hours
+                        # float dust from the kW -> kWh conversion must not keep a served vehicle queued
+                        left = 0.0 if left <= 1e-9 else left
+                        kw[row, hour] += grant
+                        depot_load[d, hour] += grant
+                        remaining_kwh[row] = left
                         allocated_kw_this_hour += grant
                         sessions += 1
+                        granted.append((seq, need, left))
 
                         if len(explanations) < 20:
                             explanations.append(
-                                f"{v_id} @h{hour}: {grant:.1f}kW due to low price ${price:.2f}, departs h{int(v['departure_hour'])}"
+                                f"{ids[row]} @h{hour * slot_hours:g}: {grant:.1f}kW due to low price ${price:.2f}, departs h{dep * slot_hours:g}"
                             )
 
-        return {
-            "per_vehicle": per_vehicle,
-            "per_depot": per_depot,
-            "price_curve": price_curve,
-            "explanations": explanations,
-            "remaining_kwh": remaining_kwh,
-        }
+                    # Re-key granted vehicles only after the hour, as candidates are ranked once per hour
+                    for seq, old, new in granted:
+                        queue.update(seq, old, new)
+
+        return Schedule(
+            vehicle_ids=ids,
+            vehicle_depots=fleet.depot_ids,
+            kw=kw,
+            price_curve=price_curve,
+            remaining_kwh=remaining_kwh,
+            required_kwh=fleet.required_kwh,
+            explanations=explanations,
+            depot_ids=list(depot_row.keys()),
+            slot_hours=slot_hours,
+        )
@@ -1,36 +1,167 @@
-from datetime import datetime, timedelta
-from typing import List
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.schedule import slots_per_hour
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# (start hour, USD/kWh) bands of the default time-of-use tariff
+DEFAULT_TOU = ((0, 0.12), (6, 0.20), (12, 0.28), (18, 0.32), (22, 0.18))
+
+
+class PriceCurve(tuple):
+    """
+    Immutable price curve (USD/kWh per slot) shared by every consumer of one request.
+
+    A tuple, so code that indexes, slices, iterates or JSON-encodes a list of prices keeps
+    working; ``array`` holds the same prices as a read-only float64 array. ``start`` (UTC),
+    ``slot_minutes`` and ``tariff`` record what the curve was built for.
+    """
+
+    def __new__(cls, prices: Iterable[float] = (), start: Optional[datetime] = None, slot_minutes: int = 60, tariff: str = ""):
+        values = np.array(prices, dtype=float)
+        curve = super().__new__(cls, values.tolist())
+        values.flags.writeable = False
+        curve.array = values
+        curve.start = start
+        curve.slot_minutes = slot_minutes
+        curve.tariff = tariff
+        return curve
 
 
 class PriceService:
     """
     Synthetic time-of-use price curve generator (USD/kWh) for MVP.
-    Pattern (local time):
+    Pattern (UTC):
       00:00–06:00: 0.12 (off-peak)
       06:00–12:00: 0.20
       12:00–18:00: 0.28 (peak)
       18:00–22:00: 0.32 (super-peak)
       22:00–24:00: 0.18
+
+    Tariffs are identified by id: time-of-use tables (24 hourly prices, "tou" is the default one)
+    and day-ahead price files loaded with ``load_day_ahead``. A curve is one NumPy gather over
+    the slot start times: the slot's hour of day for time-of-use tables, the latest published
+    price at or before the slot start for day-ahead files (slots outside the file use the
+    default time-of-use table). Curves start on a slot boundary (``start`` pins it; otherwise the
+    current slot) and are memoized by (tariff, start slot, slots, slot length), so every caller
+    within one slot gets the same PriceCurve object.
     """
 
-    def __init__(self):
-        pass
-
-    def _price_for_hour_of_day(self, hour: int) -> float:
-        if 0 <= hour < 6:
-            return 0.12
-        if 6 <= hour < 12:
-            return 0.20
-        if 12 <= hour < 18:
-            return 0.28
-        if 18 <= hour < 22:
-            return 0.32
-        return 0.18
-
-    def get_prices(self, horizon_hours: int) -> List[float]:
-        now = datetime.utcnow()
-        prices: List[float] = []
-        for t in range(horizon_hours):
-            ts = now + timedelta(hours=t)
-            prices.append(self._price_for_hour_of_day(ts.hour))
-        return prices
+    DEFAULT_TARIFF = "tou"
+
+    def __init__(self, tariff: str = DEFAULT_TARIFF, max_curves: int = 256):
+        self.tariff = tariff
+        self.max_curves = max_curves
+        self._hourly: Dict[str, np.ndarray] = {}
+        # tariff -> (start minute of each published price since the epoch, prices, minute the file ends)
+        self._day_ahead: Dict[str, Tuple[np.ndarray, np.ndarray, int]] = {}
+        self._curves: "OrderedDict[Tuple, PriceCurve]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.add_time_of_use(self.DEFAULT_TARIFF, DEFAULT_TOU)
+
+    def add_time_of_use(self, tariff_id: str, bands: Sequence[Tuple[int, float]]) -> None:
+        """Register (or replace) a time-of-use tariff from (start hour, price) bands, first band at hour 0."""
+        starts = np.array([int(h) for h, _ in bands])
+        if starts.size == 0 or starts[0] != 0 or np.any(np.diff(starts) <= 0) or starts[-1] > 23:
+            raise ValueError("time-of-use bands must start at hour 0 and increase within the day")
+        band_prices = np.array([float(p) for _, p in bands])
+        table = band_prices[np.searchsorted(starts, np.arange(24), side="right") - 1]
+        with self._lock:
+            self._hourly[tariff_id] = table
+            self._day_ahead.pop(tariff_id, None)
+            self._drop_curves(tariff_id)
+
+    def load_day_ahead(self, path: str, tariff_id: str = "day_ahead") -> int:
+        """
+        Register a day-ahead tariff from a CSV or Parquet file with ``timestamp`` and ``price``
+        (USD/kWh) columns; returns the number of prices. Timestamps without a zone are UTC; each
+        price holds until the next timestamp, the last one for the file's typical interval.
+        """
+        df = pd.read_parquet(path) if str(path).endswith((".parquet", ".pq")) else pd.read_csv(path)
+        missing = {"timestamp", "price"} - set(df.columns)
+        if missing:
+            raise ValueError(f"day-ahead file {path} lacks columns: {', '.join(sorted(missing))}")
+        stamps = pd.to_datetime(df["timestamp"], utc=True)
+        minutes = ((stamps - pd.Timestamp(EPOCH)) // pd.Timedelta(minutes=1)).to_numpy(dtype=np.int64)
+        order = np.argsort(minutes, kind="stable")
+        minutes, values = minutes[order], df["price"].to_numpy(dtype=float)[order]
+        if minutes.size == 0:
+            raise ValueError(f"day-ahead file {path} has no prices")
+        step = int(np.median(np.diff(minutes))) if minutes.size > 1 else 60
+        with self._lock:
+            self._day_ahead[tariff_id] = (minutes, values, int(minutes[-1]) + step)
+            self._hourly.pop(tariff_id, None)
+            self._drop_curves(tariff_id)
+        return int(minutes.size)
+
+    def tariffs(self) -> Sequence[str]:
+        with self._lock:
+            return list(self._hourly) + list(self._day_ahead)
+
+    @staticmethod
+    def start_slot(slot_minutes: int = 60, at: Optional[datetime] = None) -> int:
+        """Index (slots since the epoch, UTC) of the slot containing ``at`` (default: now)."""
+        at = at or datetime.now(timezone.utc)
+        if at.tzinfo is None:
+            at = at.replace(tzinfo=timezone.utc)
+        return int((at - EPOCH).total_seconds() // 60) // slot_minutes
+
+    def get_prices(
+        self,
+        horizon_hours: int,
+        slot_minutes: int = 60,
+        start: Optional[datetime] = None,
+        tariff: Optional[str] = None,
+    ) -> PriceCurve:
+        """One price per slot of ``slot_minutes`` (hourly by default) over the horizon, from the slot holding ``start`` (default: now)."""
+        n_slots = horizon_hours * slots_per_hour(slot_minutes)
+        tariff = tariff or self.tariff
+        first = self.start_slot(slot_minutes, start)
+        key = (tariff, first, n_slots, slot_minutes)
+        with self._lock:
+            curve = self._curves.get(key)
+            if curve is not None:
+                self._curves.move_to_end(key)
+                self.hits += 1
+                return curve
+            self.misses += 1
+            slot_start = (first + np.arange(n_slots, dtype=np.int64)) * slot_minutes
+            curve = PriceCurve(
+                self._curve(tariff, slot_start),
+                start=EPOCH + timedelta(minutes=first * slot_minutes),
+                slot_minutes=slot_minutes,
+                tariff=tariff,
+            )
+            self._curves[key] = curve
+            while len(self._curves) > self.max_curves:
+                self._curves.popitem(last=False)
+            return curve
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {"curves": float(len(self._curves)), "hits": float(self.hits), "misses": float(self.misses)}
+
+    def _curve(self, tariff: str, slot_start: np.ndarray) -> np.ndarray:
+        """Prices at ``slot_start`` (minutes since the epoch); call with the lock held."""
+        if tariff in self._hourly:
+            return self._hourly[tariff][(slot_start // 60) % 24]
+        if tariff not in self._day_ahead:
+            raise ValueError(f"unknown tariff '{tariff}'")
+        minutes, values, end = self._day_ahead[tariff]
+        idx = np.searchsorted(minutes, slot_start, side="right") - 1
+        covered = (idx >= 0) & (slot_start < end)
+        fallback = self._hourly[self.DEFAULT_TARIFF][(slot_start // 60) % 24]
+        return np.where(covered, values[np.clip(idx, 0, None)], fallback)
+
+    def _drop_curves(self, tariff: str) -> None:
+        for key in [k for k in self._curves if k[0] == tariff]:
+            del self._curves[key]
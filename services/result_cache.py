@@ -0,0 +1,93 @@
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def scenario_fingerprint(*parts: Any) -> str:
+    """Stable hash of JSON-serializable request inputs (fleet, prices, KG fingerprint, options...)."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def approx_nbytes(value: Any) -> int:
+    """Rough deep size of plain values (dicts, lists, tuples, scalars, strings) for ``ResultCache.put``."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approx_nbytes(k) + approx_nbytes(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(approx_nbytes(v) for v in value)
+    return size
+
+
+class ResultCache:
+    """
+    LRU cache of solved scenarios keyed by ``scenario_fingerprint``.
+
+    Entries expire ``ttl_seconds`` after they were stored; the least recently used ones are evicted
+    once there are more than ``max_entries`` or their summed size exceeds ``max_bytes`` (sizes are
+    given by the caller on ``put``). Hit, miss, eviction and expiry counters are kept for /status.
+    """
+
+    def __init__(self, max_entries: int = 64, ttl_seconds: float = 900.0, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                self._drop(key)
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: str, value: Any, nbytes: int = 0) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if nbytes > self.max_bytes:
+                return  # would evict everything else and still not fit
+            self._entries[key] = (time.monotonic(), nbytes, value)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": float(len(self._entries)),
+                "bytes": float(self._bytes),
+                "hits": float(self.hits),
+                "misses": float(self.misses),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": float(self.evictions),
+                "expired": float(self.expired),
+            }
+
+    def _drop(self, key: str) -> None:
+        _, nbytes, _ = self._entries.pop(key)
+        self._bytes -= nbytes
@@ -0,0 +1,130 @@
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from services.schedule import Schedule, slots_per_hour
+
+
+class RollingHorizonPlanner:
+    """
+    Receding-horizon re-planning on live telemetry.
+
+    Hours count on one absolute axis from the planner's start; departure hours and blackout windows
+    use the same axis. ``replan(now)`` treats the current plan's hours before ``now`` as executed
+    and frozen: each vehicle's need is carried forward by subtracting what the plan delivered since
+    its last known state (the previous window start, or the hour of its latest telemetry delta).
+    Departed vehicles drop out, and only the window [now, now + horizon) is solved, with
+    departures and blackouts shifted to start at ``now``. MILP windows are warm-started from the
+    unexecuted tail of the previous plan. Plans use slots of ``slot_minutes``; the clock still
+    moves in whole hours.
+    """
+
+    def __init__(
+        self, kg, telemetry, prices, optimizer, milp_optimizer, evaluator, horizon_hours: int = 24, slot_minutes: int = 60
+    ):
+        self.kg = kg
+        self.telemetry = telemetry
+        self.prices = prices
+        self.optimizer = optimizer
+        self.milp_optimizer = milp_optimizer
+        self.evaluator = evaluator
+        self.horizon_hours = horizon_hours
+        self.slot_minutes = slot_minutes
+        self.slots_per_hour = slots_per_hour(slot_minutes)
+        self.plan: Optional[Schedule] = None
+        self.kpis: Optional[Dict] = None
+        self.plan_start = 0
+        self.replans = 0
+        # need (kWh) of every vehicle in the current plan as of plan_start
+        self._need: Dict[str, float] = {}
+        # vehicles with telemetry deltas since the last replan -> hour of the latest delta
+        self._updated: Dict[str, int] = {}
+        self._telemetry_version = -1
+        self._state_lock = threading.Lock()
+        self._replan_lock = threading.Lock()
+
+    def apply_delta(
+        self,
+        now_hour: int,
+        updates: Iterable[Dict] = (),
+        arrivals: Iterable[Dict] = (),
+        departures: Iterable[str] = (),
+    ) -> List[str]:
+        """Forward a telemetry delta observed at ``now_hour``; returns the ids touched."""
+        with self._state_lock:
+            touched = self.telemetry.apply_delta(updates, arrivals, departures)
+            for v_id in touched:
+                self._updated[v_id] = now_hour
+        return touched
+
+    def ingest(self, now_hour: int, events: List[Dict]) -> Tuple[int, List[str], List[str]]:
+        """Forward a batch of streamed telemetry events (``TelemetryService.ingest``) observed at ``now_hour``."""
+        with self._state_lock:
+            version, touched, errors = self.telemetry.ingest(events)
+            for v_id in touched:
+                self._updated[v_id] = now_hour
+        return version, touched, errors
+
+    def due(self, now_hour: int) -> bool:
+        """True when the clock has moved past the plan start or telemetry changed since the last replan."""
+        return self.plan is None or now_hour != self.plan_start or self.telemetry.version != self._telemetry_version
+
+    def replan(
+        self, now_hour: int, backend: str = "greedy", objective: str = "cost", kg=None, start: Optional[datetime] = None
+    ) -> Tuple[Schedule, Dict]:
+        """Freeze hours before ``now_hour`` and solve the window [now_hour, now_hour + horizon), priced from ``start`` (default: now)."""
+        with self._replan_lock:
+            with self._state_lock:
+                updated, self._updated = self._updated, {}
+                version = self.telemetry.version
+                fleet = self.telemetry.get_fleet_state()["vehicles"]
+            previous, offset = self.plan, now_hour - self.plan_start
+            per_hour = self.slots_per_hour
+
+            need: Dict[str, float] = {}
+            window_fleet: List[Dict] = []
+            for v in fleet:
+                v_id = str(v["id"])
+                departure = int(v["departure_hour"]) - now_hour
+                if departure <= 0:
+                    continue
+                if v_id in updated or v_id not in self._need:
+                    known, since = float(v["required_kwh"]), updated.get(v_id, now_hour)
+                else:
+                    known, since = self._need[v_id], self.plan_start
+                delivered = self._delivered(previous, v_id, (since - self.plan_start) * per_hour, offset * per_hour)
+                need[v_id] = max(0.0, known - delivered)
+                window_fleet.append({**v, "departure_hour": departure, "required_kwh": need[v_id]})
+
+            kg_index = (kg or self.kg).compiled().shifted(now_hour)
+            price_curve = self.prices.get_prices(self.horizon_hours, self.slot_minutes, start=start)
+            if backend == "milp":
+                frozen = offset * per_hour
+                warm = previous.window(frozen) if previous is not None and 0 <= frozen < previous.horizon else None
+                schedule = self.milp_optimizer.optimize(
+                    self.horizon_hours, objective=objective, kg=kg_index, fleet=window_fleet, price_curve=price_curve,
+                    initial_schedule=warm, incremental=False, slot_minutes=self.slot_minutes,
+                )
+            else:
+                schedule = self.optimizer.optimize(
+                    self.horizon_hours, objective=objective, kg=kg_index, fleet=window_fleet, price_curve=price_curve,
+                    slot_minutes=self.slot_minutes,
+                )
+            schedule.stats["window_start"] = float(now_hour)
+            schedule.stats["frozen_hours"] = float(max(offset, 0)) if previous is not None else 0.0
+            kpis = self.evaluator.compute_kpis(schedule, price_curve)
+
+            self.plan, self.kpis, self.plan_start = schedule, kpis, now_hour
+            self._need = need
+            self._telemetry_version = version
+            self.replans += 1
+            return schedule, kpis
+
+    @staticmethod
+    def _delivered(plan: Optional[Schedule], v_id: str, start: int, end: int) -> float:
+        """Energy (kWh) ``plan`` gave ``v_id`` in its slots [start, end)."""
+        row = plan.vehicle_index.get(v_id) if plan is not None else None
+        start, end = max(start, 0), min(end, plan.horizon if plan is not None else 0)
+        if row is None or end <= start:
+            return 0.0
+        return float(plan.kw[row, start:end].sum()) * plan.slot_hours
@@ -0,0 +1,261 @@
+import copy
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+
+class Schedule(Mapping):
+    """
+    Dense charging plan shared by the optimizers, evaluation, formatting and REST layers.
+
+    Layout:
+      - kw[i, h]: power (kW) granted to vehicle_ids[i] in slot h; a slot lasts ``slot_hours``
+        (1h by default, where kW == kWh per slot), so energy is ``kw * slot_hours``
+      - depot_kw[d, h]: per-depot aggregation of kw, computed once at construction
+      - remaining_kwh[i] / required_kwh[i]: per-vehicle energy gap and demand
+      - chargers[vehicle][h]: concrete charger id per allocation (MILP backend only)
+
+    The legacy dict-of-dicts shape (``schedule["per_vehicle"]`` etc.) is still available through
+    the Mapping interface; those views are built lazily and only for backward compatibility.
+    """
+
+    LEGACY_KEYS = ("per_vehicle", "per_depot", "price_curve", "explanations", "remaining_kwh")
+
+    def __init__(
+        self,
+        vehicle_ids: Sequence[str],
+        vehicle_depots: Sequence[str],
+        kw: np.ndarray,
+        price_curve: Sequence[float],
+        remaining_kwh: Sequence[float],
+        required_kwh: Optional[Sequence[float]] = None,
+        explanations: Optional[List[str]] = None,
+        depot_ids: Optional[Sequence[str]] = None,
+        stats: Optional[Dict[str, float]] = None,
+        chargers: Optional[Dict[str, Dict[int, str]]] = None,
+        slot_hours: float = 1.0,
+    ):
+        self.slot_hours = float(slot_hours)
+        self.vehicle_ids: List[str] = [str(v) for v in vehicle_ids]
+        self.vehicle_index: Dict[str, int] = {v_id: i for i, v_id in enumerate(self.vehicle_ids)}
+
+        # depots keep first-appearance order of the fleet unless given explicitly
+        if depot_ids is None:
+            depot_ids = list(dict.fromkeys(str(d) for d in vehicle_depots))
+        self.depot_ids: List[str] = [str(d) for d in depot_ids]
+        self.depot_index: Dict[str, int] = {d: i for i, d in enumerate(self.depot_ids)}
+        self.vehicle_depot = np.fromiter(
+            (self.depot_index[str(d)] for d in vehicle_depots), dtype=np.int64, count=len(self.vehicle_ids)
+        )
+
+        self.kw = np.asarray(kw, dtype=float).reshape(len(self.vehicle_ids), -1)
+        self.price_curve = price_curve
+        self.remaining_kwh = np.asarray(remaining_kwh, dtype=float)
+        self.required_kwh = (
+            np.asarray(required_kwh, dtype=float)
+            if required_kwh is not None
+            else self.kw.sum(axis=1) * self.slot_hours + self.remaining_kwh
+        )
+        self.explanations: List[str] = list(explanations or [])
+        # solver diagnostics (timings, model size, gap); empty for the greedy backend
+        self.stats: Dict[str, float] = dict(stats or {})
+        self.chargers: Dict[str, Dict[int, str]] = dict(chargers or {})
+
+        self.depot_kw = np.zeros((len(self.depot_ids), self.horizon), dtype=float)
+        np.add.at(self.depot_kw, self.vehicle_depot, self.kw)
+
+        self._views: Dict[str, object] = {}
+
+    @property
+    def horizon(self) -> int:
+        return int(self.kw.shape[1])
+
+    @property
+    def total_kw(self) -> np.ndarray:
+        """Fleet-wide load per hour."""
+        return self.depot_kw.sum(axis=0)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory footprint (arrays plus a flat estimate for the text/dict parts)."""
+        arrays = self.kw.nbytes + self.depot_kw.nbytes + self.remaining_kwh.nbytes + self.required_kwh.nbytes
+        text = sum(len(e) for e in self.explanations) + 64 * len(self.vehicle_ids)
+        return int(arrays + text + 96 * sum(len(hours) for hours in self.chargers.values()))
+
+    def copy(self) -> "Schedule":
+        """
+        Shallow copy for handing out a shared plan (e.g. from the result cache): the arrays are
+        shared, while stats, explanations and charger assignments are the copy's own to edit.
+        """
+        other = copy.copy(self)
+        other.stats = dict(self.stats)
+        other.explanations = list(self.explanations)
+        other.chargers = {v_id: dict(hours) for v_id, hours in self.chargers.items()}
+        other._views = {}
+        return other
+
+    def splice(self, part: "Schedule") -> "Schedule":
+        """
+        Copy of this plan with the rows of ``part``'s vehicles taken from ``part`` (same horizon).
+
+        Used after a depot-scoped re-solve, where ``part`` covers the vehicles of the re-solved
+        depots; stats come from ``part`` and explanations about replaced vehicles are dropped.
+        """
+        rows = np.fromiter((self.vehicle_index[v_id] for v_id in part.vehicle_ids), dtype=np.int64, count=len(part.vehicle_ids))
+        kw = self.kw.copy()
+        kw[rows] = part.kw
+        remaining = self.remaining_kwh.copy()
+        remaining[rows] = part.remaining_kwh
+        required = self.required_kwh.copy()
+        required[rows] = part.required_kwh
+        chargers = {v_id: hours for v_id, hours in self.chargers.items() if v_id not in part.vehicle_index}
+        chargers.update(part.chargers)
+        # explanations start with the vehicle id ("v5 @h3: ...")
+        kept = [e for e in self.explanations if e.split(" ", 1)[0] not in part.vehicle_index]
+        return Schedule(
+            vehicle_ids=self.vehicle_ids,
+            vehicle_depots=[self.depot_ids[d] for d in self.vehicle_depot.tolist()],
+            kw=kw,
+            price_curve=self.price_curve,
+            remaining_kwh=remaining,
+            required_kwh=required,
+            explanations=(part.explanations + kept)[:20],
+            depot_ids=self.depot_ids,
+            stats=part.stats,
+            chargers=chargers,
+            slot_hours=self.slot_hours,
+        )
+
+    def window(self, start: int) -> "Schedule":
+        """Slots [start, horizon) of this plan as a new schedule whose slot 0 is ``start``."""
+        start = min(max(0, int(start)), self.horizon)
+        chargers = {
+            v_id: {h - start: c_id for h, c_id in hours.items() if h >= start} for v_id, hours in self.chargers.items()
+        }
+        return Schedule(
+            vehicle_ids=self.vehicle_ids,
+            vehicle_depots=[self.depot_ids[d] for d in self.vehicle_depot.tolist()],
+            kw=self.kw[:, start:],
+            price_curve=list(self.price_curve)[start:],
+            remaining_kwh=self.remaining_kwh,
+            required_kwh=self.required_kwh,
+            depot_ids=self.depot_ids,
+            stats=self.stats,
+            chargers={v_id: hours for v_id, hours in chargers.items() if hours},
+            slot_hours=self.slot_hours,
+        )
+
+    @classmethod
+    def from_dict(cls, schedule: Dict, horizon: Optional[int] = None) -> "Schedule":
+        """Build a Schedule from the legacy ``per_vehicle``/``per_depot`` dict shape."""
+        per_vehicle: Dict[str, Dict[int, float]] = schedule.get("per_vehicle", {})
+        per_depot: Dict[str, Dict[int, float]] = schedule.get("per_depot", {})
+        remaining: Dict[str, float] = schedule.get("remaining_kwh", {})
+        price_curve = schedule.get("price_curve", [])
+
+        vehicle_ids = list(dict.fromkeys(list(remaining.keys()) + list(per_vehicle.keys())))
+        if horizon is None:
+            max_hour = max((int(h) for alloc in per_vehicle.values() for h in alloc), default=-1)
+            horizon = max(len(price_curve), max_hour + 1)
+
+        # the legacy shape has no vehicle->depot link: vehicles are attributed to a placeholder depot
+        # and the given per-depot loads are restored as-is afterwards
+        kw = np.zeros((len(vehicle_ids), horizon), dtype=float)
+        for i, v_id in enumerate(vehicle_ids):
+            for h, val in per_vehicle.get(v_id, {}).items():
+                if int(h) < horizon:
+                    kw[i, int(h)] = float(val)
+        out = cls(
+            vehicle_ids=vehicle_ids,
+            vehicle_depots=["*"] * len(vehicle_ids),
+            kw=kw,
+            price_curve=price_curve,
+            remaining_kwh=[float(remaining.get(v_id, 0.0)) for v_id in vehicle_ids],
+            explanations=schedule.get("explanations", []),
+        )
+        if per_depot:
+            out.depot_ids = [str(d) for d in per_depot.keys()]
+            out.depot_index = {d: i for i, d in enumerate(out.depot_ids)}
+            out.vehicle_depot = np.zeros(len(vehicle_ids), dtype=np.int64)
+            out.depot_kw = np.zeros((len(out.depot_ids), horizon), dtype=float)
+            for d, alloc in enumerate(per_depot.values()):
+                for h, val in alloc.items():
+                    if int(h) < horizon:
+                        out.depot_kw[d, int(h)] = float(val)
+        return out
+
+    # --- Legacy dict views ---
+    def per_vehicle_dict(self, str_hours: bool = False) -> Dict[str, Dict]:
+        """Vehicles with at least one allocation, mapped to their non-zero hours."""
+        return self._sparse_rows(self.vehicle_ids, self.kw, str_hours, keep_empty=False)
+
+    def per_depot_dict(self, str_hours: bool = False) -> Dict[str, Dict]:
+        """Every depot, mapped to its non-zero hours."""
+        return self._sparse_rows(self.depot_ids, self.depot_kw, str_hours, keep_empty=True)
+
+    def remaining_dict(self) -> Dict[str, float]:
+        return {v_id: float(rem) for v_id, rem in zip(self.vehicle_ids, self.remaining_kwh.tolist())}
+
+    def to_dict(self) -> Dict:
+        """JSON-serializable legacy representation (plus ``chargers`` when known and sub-hourly ``slot_hours``)."""
+        out = {
+            "per_vehicle": self.per_vehicle_dict(),
+            "per_depot": self.per_depot_dict(),
+            "price_curve": [float(p) for p in self.price_curve],
+            "explanations": list(self.explanations),
+            "remaining_kwh": self.remaining_dict(),
+        }
+        if self.chargers:
+            out["chargers"] = {v_id: dict(hours) for v_id, hours in self.chargers.items()}
+        if self.slot_hours != 1.0:
+            out["slot_hours"] = self.slot_hours
+        return out
+
+    @staticmethod
+    def _sparse_rows(ids: List[str], matrix: np.ndarray, str_hours: bool, keep_empty: bool) -> Dict[str, Dict]:
+        rows, cols = np.nonzero(matrix)
+        values = matrix[rows, cols].tolist()
+        out: Dict[str, Dict] = {ids[r]: {} for r in range(len(ids))} if keep_empty else {}
+        # nonzero() walks row-major, so rows come out in fleet order
+        for r, c, val in zip(rows.tolist(), cols.tolist(), values):
+            out.setdefault(ids[r], {})[str(c) if str_hours else c] = val
+        return out
+
+    # --- Mapping interface (backward compatibility) ---
+    def __getitem__(self, key: str):
+        if key not in self.LEGACY_KEYS:
+            raise KeyError(key)
+        if key == "price_curve":
+            return self.price_curve
+        if key == "explanations":
+            return self.explanations
+        if key not in self._views:
+            if key == "per_vehicle":
+                self._views[key] = self.per_vehicle_dict()
+            elif key == "per_depot":
+                self._views[key] = self.per_depot_dict()
+            else:
+                self._views[key] = self.remaining_dict()
+        return self._views[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.LEGACY_KEYS)
+
+    def __len__(self) -> int:
+        return len(self.LEGACY_KEYS)
+
+
+def slots_per_hour(slot_minutes: int) -> int:
+    """Slots in one hour for a slot length that divides the hour; ValueError otherwise."""
+    slot_minutes = int(slot_minutes)
+    if slot_minutes <= 0 or 60 % slot_minutes:
+        raise ValueError(f"slot length must divide 60 minutes, got {slot_minutes}")
+    return 60 // slot_minutes
+
+
+def as_schedule(schedule) -> Schedule:
+    """Accept either a Schedule or a legacy schedule dict."""
+    if isinstance(schedule, Schedule):
+        return schedule
+    return Schedule.from_dict(schedule)
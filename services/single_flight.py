@@ -0,0 +1,38 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent async calls.
+
+    The first ``run`` for a key starts the work; every ``run`` with the same key that arrives while
+    it is in flight awaits the same task and receives the same result (or exception). The shared
+    task is shielded, so a caller that goes away does not cancel it for the others. Keys are
+    forgotten as soon as the work finishes; caching finished results is the ResultCache's job.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._finish(key, t))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter went away
+
+    def stats(self) -> Dict[str, float]:
+        return {"in_flight": float(len(self._inflight)), "leaders": float(self.leaders), "coalesced": float(self.coalesced)}
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import re
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+SNAPSHOT_FORMAT = 1
+MANIFEST = "manifest.json"
+# column files are "{table}.{column}.g{generation}.npy"; files without a generation predate it
+GENERATION_FILE = re.compile(r".+\.g(\d+)\.npy")
+
+
+def file_sha1(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_info(path: str) -> Dict:
+    """Size, mtime and checksum of a source file, as recorded in the manifest."""
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": file_sha1(path)}
+
+
+class SnapshotTable:
+    """
+    One table of a snapshot: ``columns`` are read-only memory-mapped arrays (string columns are
+    fixed-width ``<U`` arrays) and ``categories`` hold the labels of columns stored as int32
+    codes, in first-appearance order.
+    """
+
+    def __init__(self, name: str, rows: int, columns: Dict[str, np.ndarray], categories: Dict[str, List[str]]):
+        self.name = name
+        self.rows = rows
+        self.columns = columns
+        self.categories = categories
+
+    def frame(self) -> pd.DataFrame:
+        """Decoded DataFrame (copies; for small tables such as chargers and site limits)."""
+        data = {}
+        for col, arr in self.columns.items():
+            if col in self.categories:
+                labels = np.asarray(self.categories[col], dtype=object)
+                data[col] = labels[arr] if labels.size else np.empty(0, dtype=object)
+            elif arr.dtype.kind == "U":
+                data[col] = arr.astype(object)
+            else:
+                data[col] = np.asarray(arr)
+        return pd.DataFrame(data)
+
+
+class Snapshot:
+    """
+    Compiled binary snapshot of the fleet and KG sources: one ``.npy`` file per column plus a
+    JSON manifest, loaded with ``np.load(mmap_mode="r")`` so opening a table parses nothing.
+
+    The manifest records per table the row count, column dtypes and file checksums, the
+    category labels of code columns, and the source CSV it was built from (size, mtime, SHA-1).
+    ``is_fresh`` compares the source with that record (the checksum is only recomputed when size
+    or mtime moved); ``verify`` re-hashes the column files. Build one with ``write`` or
+    ``scripts/build_snapshot.py``.
+
+    Every ``write`` is a new generation: its column files get new names, so files that readers
+    have mapped are never rewritten in place.
+    """
+
+    def __init__(self, path: str, manifest: Dict):
+        self.path = path
+        self.manifest = manifest
+
+    @classmethod
+    def open(cls, path: str) -> Optional["Snapshot"]:
+        """The snapshot in directory ``path``; None when there is none or its format is unknown."""
+        try:
+            with open(os.path.join(path, MANIFEST)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("format") != SNAPSHOT_FORMAT:
+            return None
+        return cls(path, manifest)
+
+    @classmethod
+    def write(
+        cls,
+        path: str,
+        tables: Dict[str, pd.DataFrame],
+        sources: Optional[Dict[str, str]] = None,
+        categorical: Iterable[str] = (),
+    ) -> "Snapshot":
+        """
+        Write ``tables`` into directory ``path``. Columns named in ``categorical`` are stored as
+        int32 codes; other string columns as fixed-width unicode. ``sources`` maps table names to
+        the files they came from (for staleness checks).
+
+        Columns go to files of a new generation and the manifest is replaced last and atomically,
+        so readers see either the old or the new snapshot. Generations before the previous one are
+        deleted after the swap; processes that still map them keep their (unlinked) files.
+        """
+        os.makedirs(path, exist_ok=True)
+        previous = cls.open(path)
+        generation = int(previous.manifest.get("generation", 0)) + 1 if previous is not None else 1
+        categorical = set(categorical)
+        entries: Dict[str, Dict] = {}
+        for name, df in tables.items():
+            columns: Dict[str, Dict] = {}
+            categories: Dict[str, List[str]] = {}
+            for col in df.columns:
+                values = df[col]
+                if col in categorical:
+                    codes, labels = pd.factorize(values.astype(str), sort=False)
+                    arr = codes.astype(np.int32)
+                    categories[col] = [str(label) for label in labels]
+                elif pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+                    arr = values.to_numpy()
+                else:
+                    arr = np.array(values.astype(str).tolist(), dtype=str)
+                file_name = f"{name}.{col}.g{generation}.npy"
+                np.save(os.path.join(path, file_name), np.ascontiguousarray(arr), allow_pickle=False)
+                columns[col] = {"file": file_name, "dtype": arr.dtype.str, "sha1": file_sha1(os.path.join(path, file_name))}
+            source = (sources or {}).get(name)
+            entries[name] = {
+                "rows": int(len(df)),
+                "columns": columns,
+                "categories": categories,
+                "source": source_info(source) if source and os.path.exists(source) else None,
+            }
+        manifest = {"format": SNAPSHOT_FORMAT, "generation": generation, "tables": entries}
+        manifest["checksum"] = hashlib.sha1(
+            "".join(c["sha1"] for t in entries.values() for c in t["columns"].values()).encode()
+        ).hexdigest()
+        tmp = os.path.join(path, MANIFEST + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, os.path.join(path, MANIFEST))
+        cls._drop_generations(path, keep=(generation - 1, generation))
+        return cls(path, manifest)
+
+    @staticmethod
+    def _drop_generations(path: str, keep: Iterable[int]) -> None:
+        keep = set(keep)
+        for file_name in os.listdir(path):
+            if not file_name.endswith(".npy"):
+                continue
+            match = GENERATION_FILE.fullmatch(file_name)
+            if (int(match.group(1)) if match else 0) in keep:
+                continue
+            try:
+                os.remove(os.path.join(path, file_name))
+            except OSError:
+                pass  # e.g. still open on a platform that cannot delete open files; next write retries
+
+    @property
+    def checksum(self) -> str:
+        return self.manifest["checksum"]
+
+    def tables(self) -> List[str]:
+        return list(self.manifest["tables"])
+
+    def table(self, name: str) -> SnapshotTable:
+        entry = self.manifest["tables"][name]
+        columns = {
+            col: np.load(os.path.join(self.path, info["file"]), mmap_mode="r", allow_pickle=False)
+            for col, info in entry["columns"].items()
+        }
+        return SnapshotTable(name, entry["rows"], columns, entry["categories"])
+
+    def is_fresh(self, name: str, source_path: Optional[str]) -> bool:
+        """
+        True when table ``name`` exists and still matches ``source_path``; a missing source file
+        leaves the snapshot authoritative.
+        """
+        entry = self.manifest["tables"].get(name)
+        if entry is None:
+            return False
+        if not source_path or not os.path.exists(source_path):
+            return True
+        recorded = entry.get("source")
+        if not recorded:
+            return False
+        st = os.stat(source_path)
+        if st.st_size != recorded["size"]:
+            return False
+        return st.st_mtime_ns == recorded["mtime_ns"] or file_sha1(source_path) == recorded["sha1"]
+
+    def verify(self) -> List[str]:
+        """Column files whose content no longer matches the manifest checksum (or that are missing)."""
+        bad: List[str] = []
+        for entry in self.manifest["tables"].values():
+            for info in entry["columns"].values():
+                file_path = os.path.join(self.path, info["file"])
+                if not os.path.exists(file_path) or file_sha1(file_path) != info["sha1"]:
+                    bad.append(info["file"])
+        return bad
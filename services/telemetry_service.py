@@ -1,36 +1,144 @@
 import os
-from typing import Dict, List
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
 import pandas as pd
 
+from services.fleet_store import FleetRecords, FleetStore, FleetTable
+from services.snapshot import Snapshot
+
 
 class TelemetryService:
     """
     Provides synthetic fleet state from CSV for MVP.
     Expected columns in data/vehicles.csv:
       id,battery_kwh,soc0,min_soc,depot_id,connector,max_kw,departure_hour,required_kwh
+
+    The fleet is loaded from the binary snapshot in ``data/snapshot`` (memory-mapped, see
+    ``services.snapshot``) when it is fresh for the CSV, and from the CSV otherwise. The first
+    delta or streamed event batch (``ingest``) copies it into an in-memory FleetTable that later
+    changes are applied to. Readers get a columnar FleetStore, built once per fleet version; the
+    source is re-loaded (dropping the table) only when the CSV's modification time changes.
+    ``version`` grows by one per applied delta, event batch or reload.
     """
 
-    def __init__(self):
+    FLOAT_COLUMNS = FleetStore.FLOAT_FIELDS
+
+    def __init__(self, snapshot_dir: Optional[str] = None):
         root = os.path.dirname(os.path.dirname(__file__))
         self.vehicles_path = os.path.join(root, "data", "vehicles.csv")
+        self.snapshot_dir = snapshot_dir or os.path.join(root, "data", "snapshot")
+        self.version = 0
+        # "snapshot" or "csv": where the current base fleet was loaded from
+        self.source = ""
+        self._source_mtime = self._mtime()
+        self._base = self._load()
+        self._table: Optional[FleetTable] = None
+        self._store: Optional[FleetStore] = None
+        self._lock = threading.Lock()
+
+    def _mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.vehicles_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self) -> FleetStore:
+        snapshot = Snapshot.open(self.snapshot_dir)
+        if snapshot is not None and snapshot.is_fresh("vehicles", self.vehicles_path):
+            self.source = "snapshot"
+            return FleetStore.from_snapshot(snapshot.table("vehicles"), self.version)
         if not os.path.exists(self.vehicles_path):
             raise FileNotFoundError(f"Missing vehicles dataset at {self.vehicles_path}")
-        self._vehicles_df = pd.read_csv(self.vehicles_path)
-
-    def get_fleet_state(self) -> Dict[str, List[Dict]]:
-        vehicles: List[Dict] = []
-        for _, row in self._vehicles_df.iterrows():
-            vehicles.append(
-                {
-                    "id": row["id"],
-                    "battery_kwh": float(row["battery_kwh"]),
-                    "soc0": float(row["soc0"]),
-                    "min_soc": float(row["min_soc"]),
-                    "depot_id": str(row["depot_id"]),
-                    "connector": str(row["connector"]),
-                    "max_kw": float(row["max_kw"]),
-                    "departure_hour": int(row["departure_hour"]),
-                    "required_kwh": float(row["required_kwh"]),
-                }
-            )
-        return {"vehicles": vehicles}
+        self.source = "csv"
+        return FleetStore.from_frame(pd.read_csv(self.vehicles_path), self.version)
+
+    def _mutable(self) -> FleetTable:
+        if self._table is None:
+            self._table = FleetTable(self._base)
+        return self._table
+
+    def fleet_store(self) -> FleetStore:
+        """Columnar snapshot of the current fleet (shared by callers; do not mutate)."""
+        with self._lock:
+            mtime = self._mtime()
+            if mtime != self._source_mtime:
+                self.version += 1
+                self._base = self._load()
+                self._source_mtime = mtime
+                self._table = None
+                self._store = None
+            if self._store is None:
+                self._store = self._table.snapshot(self.version) if self._table is not None else self._base
+            return self._store
+
+    def get_fleet_state(self) -> Dict[str, FleetRecords]:
+        """Legacy shape: ``{"vehicles": [dict, ...]}``, as a lazy view over ``fleet_store()``."""
+        return {"vehicles": self.fleet_store().records()}
+
+    def apply_delta(
+        self,
+        updates: Iterable[Dict] = (),
+        arrivals: Iterable[Dict] = (),
+        departures: Iterable[str] = (),
+    ) -> List[str]:
+        """
+        Apply live fleet changes; returns the ids touched.
+
+        ``updates`` are partial records keyed by ``id``. A new ``soc`` replaces ``soc0`` and moves
+        ``required_kwh`` by the energy gained since (the charge target stays put) unless
+        ``required_kwh`` is given as well. ``arrivals`` are full records (an existing id is replaced)
+        and ``departures`` are ids to drop. Unknown ids in updates and incomplete arrivals raise
+        ValueError before anything is changed.
+        """
+        updates, arrivals, departures = list(updates), list(arrivals), [str(v) for v in departures]
+        with self._lock:
+            table = self._mutable()
+            unknown = [str(u.get("id")) for u in updates if str(u.get("id")) not in table]
+            if unknown:
+                raise ValueError(f"unknown vehicles: {', '.join(unknown)}")
+            incomplete = [str(a.get("id")) for a in arrivals if any(f not in a for f in FleetStore.FIELDS)]
+            if incomplete:
+                raise ValueError(f"incomplete arrivals: {', '.join(incomplete)}")
+            touched = [table.update(u) for u in updates]
+            for v_id in departures:
+                table.depart(v_id)
+            arriving = {table.arrive(a) for a in arrivals}
+            self._store = None
+            self.version += 1
+        return touched + sorted(arriving) + departures
+
+    def ingest(self, events: Iterable[Dict]) -> Tuple[int, List[str], List[str]]:
+        """
+        Apply a batch of stream events in order, as one fleet version.
+
+        Events are dicts with a ``type``: "update" (the default; "soc" is an alias) carries a partial
+        record like ``apply_delta`` updates, "arrival" a full record and "departure" an ``id``.
+        Events that cannot apply (unknown id, type or field) are skipped, not raised. Returns
+        (version, ids touched in first-touch order, one error message per skipped event).
+        """
+        touched: Dict[str, None] = {}
+        errors: List[str] = []
+        with self._lock:
+            table = self._mutable()
+            for event in events:
+                kind = event.get("type", "update")
+                fields = {k: val for k, val in event.items() if k != "type"}
+                try:
+                    if kind in ("update", "soc"):
+                        v_id = table.update(fields)
+                    elif kind == "arrival":
+                        v_id = table.arrive(fields)
+                    elif kind == "departure":
+                        v_id = str(fields.get("id"))
+                        if not table.depart(v_id):
+                            raise ValueError(f"unknown vehicle {v_id}")
+                    else:
+                        raise ValueError(f"unknown event type '{kind}'")
+                except (TypeError, ValueError) as e:
+                    errors.append(f"{kind} {event.get('id')}: {e}")
+                    continue
+                touched[v_id] = None
+            if touched:
+                self._store = None
+                self.version += 1
+            return self.version, list(touched), errors
@@ -0,0 +1,208 @@
+import json
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class TelemetryStream:
+    """
+    Streaming telemetry ingestion into the in-memory fleet table.
+
+    Events (see ``TelemetryService.ingest``) come from an append-only JSONL feed followed with
+    ``follow(path)`` or from producers calling ``submit``. Both feed one bounded queue: when it
+    is full the file reader stops reading and ``submit`` blocks (up to its timeout), so a slow
+    consumer applies backpressure instead of buffering the feed in memory. One applier thread
+    takes the first waiting event, gathers up to ``batch_size`` for at most ``max_delay_s`` and
+    applies them as one batch, i.e. one fleet version. ``apply`` defaults to
+    ``telemetry.ingest``; callers can route batches elsewhere first (the rolling planner marks the
+    vehicles it touched).
+
+    The reader keeps its byte offset, waits for the newline of a partly written last line and
+    starts over when the path holds another file (rotated; compared by inode and device), when
+    the file shrinks (truncated in place) or disappears; while the path is missing it retries
+    every ``poll_s``. Malformed lines are counted and skipped.
+    """
+
+    def __init__(
+        self,
+        telemetry,
+        batch_size: int = 500,
+        max_delay_s: float = 0.25,
+        queue_size: int = 10000,
+        apply: Optional[Callable[[List[Dict]], Tuple[int, List[str], List[str]]]] = None,
+        poll_s: float = 0.2,
+    ):
+        self.telemetry = telemetry
+        self.batch_size = batch_size
+        self.max_delay_s = max_delay_s
+        self.poll_s = poll_s
+        self.apply = apply or telemetry.ingest
+        self._queue: "queue.Queue[Dict]" = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self.path: Optional[str] = None
+        self.offset = 0
+        self.received = 0
+        self.applied = 0
+        self.rejected = 0
+        self.malformed = 0
+        self.batches = 0
+        self.version = telemetry.version
+        self.last_errors: List[str] = []
+
+    def start(self) -> "TelemetryStream":
+        """Start the applier thread (idempotent)."""
+        with self._lock:
+            if not self._threads:
+                self._spawn(self._apply_loop, "telemetry-apply")
+        return self
+
+    def follow(self, path: str) -> "TelemetryStream":
+        """Tail the JSONL feed at ``path`` from its beginning (the file may not exist yet)."""
+        self.start()
+        with self._lock:
+            self.path = path
+            self._spawn(self._tail_loop, "telemetry-tail")
+        return self
+
+    def submit(self, events: Iterable[Dict], timeout: Optional[float] = None) -> int:
+        """Queue events, blocking while the queue is full; raises queue.Full after ``timeout``."""
+        self.start()
+        queued = 0
+        for event in events:
+            self._put(event, timeout)
+            queued += 1
+        return queued
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued event has been applied; False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "version": float(self.version),
+                "received": float(self.received),
+                "applied": float(self.applied),
+                "rejected": float(self.rejected),
+                "malformed": float(self.malformed),
+                "batches": float(self.batches),
+                "pending": float(self._pending),
+                "offset": float(self.offset),
+            }
+
+    def close(self) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=2 * self.poll_s + self.max_delay_s)
+        self._threads = []
+
+    def _spawn(self, target: Callable[[], None], name: str) -> None:
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _put(self, event: Dict, timeout: Optional[float] = None) -> None:
+        with self._lock:
+            self._pending += 1
+            self.received += 1
+        try:
+            self._queue.put(event, timeout=timeout)
+        except queue.Full:
+            with self._idle:
+                self._pending -= 1
+                self.received -= 1
+                self._idle.notify_all()
+            raise
+
+    def _tail_loop(self) -> None:
+        buffer = b""
+        handle = None
+        try:
+            while not self._stop.is_set():
+                if handle is None:
+                    try:
+                        handle = open(self.path, "rb")
+                    except OSError:
+                        # not there (yet, or between a rotation's rename and create): retry next poll
+                        time.sleep(self.poll_s)
+                        continue
+                    handle.seek(self.offset)
+                chunk = handle.read(1 << 16)
+                if not chunk:
+                    try:
+                        current, at_path = os.fstat(handle.fileno()), os.stat(self.path)
+                        # another file at the path (rotated), or this one truncated in place
+                        restart = (current.st_ino, current.st_dev) != (at_path.st_ino, at_path.st_dev) or (
+                            at_path.st_size < self.offset
+                        )
+                    except OSError:
+                        # moved or deleted: whatever appears at the path next is a new file
+                        restart = True
+                        time.sleep(self.poll_s)
+                    if restart:
+                        handle.close()
+                        handle, buffer, self.offset = None, b"", 0
+                    else:
+                        time.sleep(self.poll_s)
+                    continue
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    self._read_line(line)
+                    self.offset += len(line) + 1
+                    if self._stop.is_set():
+                        return
+        finally:
+            if handle is not None:
+                handle.close()
+
+    def _read_line(self, line: bytes) -> None:
+        if not line.strip():
+            return
+        try:
+            event = json.loads(line)
+            if not isinstance(event, dict):
+                raise ValueError("event is not an object")
+        except ValueError:
+            with self._lock:
+                self.malformed += 1
+            return
+        # block while the queue is full, but keep checking for close()
+        while not self._stop.is_set():
+            try:
+                self._put(event, timeout=self.poll_s)
+                return
+            except queue.Full:
+                continue
+
+    def _apply_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=self.poll_s)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.max_delay_s
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                version, _touched, errors = self.apply(batch)
+            except Exception as e:
+                version, errors = self.version, [f"batch failed: {e}"] * len(batch)
+            with self._idle:
+                self.version = version
+                self.batches += 1
+                self.rejected += len(errors)
+                self.applied += len(batch) - len(errors)
+                self.last_errors = errors[-5:] if errors else self.last_errors
+                self._pending -= len(batch)
+                self._idle.notify_all()
@@ -0,0 +1,94 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+
+class WhatIfService:
+    """
+    Batch what-if evaluation.
+
+    Each variant is a dict of deltas on top of one KG view (all keys optional): ``name``, ``horizon``,
+    ``objective``, ``site_peak_kw`` ({depot: kW}), ``blackouts`` ([(depot, start, end)]) and
+    ``clear_blackouts``. The fleet snapshot, price curves and compiled base index are built once per
+    batch; every variant is a throwaway KGIndex (``KGIndex.with_whatif``) sharing the base charger
+    arrays, so nothing is written to the KG. MILP variants are solved together in shared pool rounds
+    (``OptimizerMILP.batch``); greedy variants run back to back on the shared inputs. Plans and
+    prices use slots of ``slot_minutes``, as ``optimize`` does.
+    """
+
+    def __init__(self, kg, telemetry, prices, optimizer, milp_optimizer, evaluator, slot_minutes: int = 60):
+        self.kg = kg
+        self.telemetry = telemetry
+        self.prices = prices
+        self.optimizer = optimizer
+        self.milp_optimizer = milp_optimizer
+        self.evaluator = evaluator
+        self.slot_minutes = slot_minutes
+
+    def evaluate(
+        self,
+        variants: List[Dict],
+        horizon_hours: int,
+        objective: str,
+        backend: str,
+        kg=None,
+        baseline: bool = True,
+        start: Optional[datetime] = None,
+    ) -> List[Dict]:
+        """
+        Solve every variant; returns one row per variant (a "baseline" row first when ``baseline``)
+        with ``name``, ``horizon``, ``objective`` and either ``kpis`` or ``error``. Prices start at
+        ``start`` (default: now) for every variant.
+        """
+        start = start or datetime.now(timezone.utc)
+        base_index = (kg or self.kg).compiled()
+        fleet = self.telemetry.get_fleet_state()["vehicles"]
+        specs = ([{"name": "baseline"}] if baseline else []) + list(variants)
+
+        rows: List[Dict] = []
+        runs = []
+        for i, spec in enumerate(specs):
+            row = {
+                "name": str(spec.get("name") or f"variant-{i + 1 - int(baseline)}"),
+                "horizon": int(spec.get("horizon") or horizon_hours),
+                "objective": str(spec.get("objective") or objective),
+                "kpis": None,
+                "error": None,
+            }
+            rows.append(row)
+            try:
+                if row["objective"] not in ("cost", "peak"):
+                    raise ValueError(f"unknown objective '{row['objective']}'")
+                if not 1 <= row["horizon"] <= 168:
+                    raise ValueError("horizon must be 1-168h")
+                variant_index = base_index.with_whatif(
+                    spec.get("site_peak_kw"), spec.get("blackouts") or (), bool(spec.get("clear_blackouts"))
+                )
+            except Exception as e:
+                row["error"] = str(e)
+                continue
+            runs.append((row, variant_index))
+
+        if backend == "milp":
+            schedules = self.milp_optimizer.batch(
+                [(row["horizon"], row["objective"], index) for row, index in runs], fleet=fleet,
+                slot_minutes=self.slot_minutes, start=start,
+            )
+        else:
+            curves: Dict[int, List[float]] = {}
+            schedules = []
+            for row, index in runs:
+                if row["horizon"] not in curves:
+                    curves[row["horizon"]] = self.prices.get_prices(row["horizon"], self.slot_minutes, start=start)
+                schedules.append(
+                    self.optimizer.optimize(
+                        row["horizon"], objective=row["objective"], kg=index, fleet=fleet, price_curve=curves[row["horizon"]],
+                        slot_minutes=self.slot_minutes,
+                    )
+                )
+
+        for (row, _), schedule in zip(runs, schedules):
+            if isinstance(schedule, Exception):
+                row["error"] = str(schedule)
+            else:
+                row["kpis"] = self.evaluator.compute_kpis(schedule, schedule.price_curve)
+        return rows
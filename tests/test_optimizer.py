@@ -1,7 +1,18 @@
+import json
+import threading
+
+import numpy as np
+
 from services.telemetry_service import TelemetryService
 from services.price_service import PriceService
 from services.kg_service import KGService
-from services.optimizer_service import OptimizerService
+from services.optimizer_service import OptimizerService, water_fill
+from services.optimizer_milp import OptimizerMILP, assign_chargers
+from services.schedule import Schedule
+from services.evaluation_service import EvaluationService
+from services.instance_generator import generate_instance
+from services.depot_planner import DepotScopedPlanner
+from services.rolling_planner import RollingHorizonPlanner
 
 
 def test_greedy_optimizer_produces_schedule():
@@ -19,3 +30,402 @@ def test_greedy_optimizer_produces_schedule():
     for alloc in schedule["per_vehicle"].values():
         for v in alloc.values():
             assert v >= 0
+
+
+def test_schedule_matrix_matches_legacy_views():
+    telemetry = TelemetryService()
+    prices = PriceService()
+    kg = KGService()
+    opt = OptimizerService(kg=kg, telemetry=telemetry, prices=prices)
+
+    schedule = opt.optimize(horizon_hours=24, objective="peak")
+
+    assert schedule.kw.shape == (len(schedule.vehicle_ids), 24)
+    # depot aggregation equals the sum of its vehicles' rows
+    for depot_id, d in schedule.depot_index.items():
+        rows = schedule.vehicle_depot == d
+        assert (abs(schedule.depot_kw[d] - schedule.kw[rows].sum(axis=0)) < 1e-9).all()
+    for v_id, alloc in schedule["per_vehicle"].items():
+        for h, kw in alloc.items():
+            assert schedule.kw[schedule.vehicle_index[v_id], h] == kw
+    assert set(schedule.to_dict().keys()) == set(Schedule.LEGACY_KEYS)
+
+    # copies handed out from a cache edit their own stats and explanations
+    clone = schedule.copy()
+    clone.stats["window_start"] = 3.0
+    clone.explanations.append("note")
+    assert "window_start" not in schedule.stats and "note" not in schedule.explanations
+    assert clone.kw is schedule.kw and clone.to_dict()["per_vehicle"] == schedule.to_dict()["per_vehicle"]
+
+
+def test_water_fill_levels_the_load_profile():
+    loads = np.array([0.0, 10.0, 4.0, 0.0])
+    caps = np.array([22.0, 22.0, 3.0, 22.0])
+    grants = water_fill(loads, caps, need=14.0)
+    assert abs(grants.sum() - 14.0) < 1e-9
+    # hours 0, 2 and 3 rise to a common level of 6kW; hour 1 is already above it
+    assert np.allclose(grants, [6.0, 0.0, 2.0, 6.0])
+    # not enough headroom: every hour is filled to its cap
+    assert np.allclose(water_fill(loads, caps, need=100.0), caps)
+
+
+def test_peak_objective_respects_budget_and_sessions():
+    telemetry = TelemetryService()
+    prices = PriceService()
+    kg = KGService()
+    kg.set_site_peak_limit_kw("D1", 30)
+    kg.add_blackout("D2", 0, 3)
+    opt = OptimizerService(kg=kg, telemetry=telemetry, prices=prices)
+
+    schedule = opt.optimize(horizon_hours=24, objective="peak")
+    cost_schedule = opt.optimize(horizon_hours=24, objective="cost")
+
+    index = kg.compiled()
+    for depot_id, d in schedule.depot_index.items():
+        assert schedule.depot_kw[d].max() <= index.get_hour_budget_kw(depot_id) + 1e-9
+        sessions = (schedule.kw[schedule.vehicle_depot == d] > 0).sum(axis=0)
+        assert sessions.max() <= index.get_max_concurrent_chargers(depot_id)
+    assert not schedule.depot_kw[schedule.depot_index["D2"], :3].any()
+    assert (schedule.remaining_kwh <= 1e-6).all()
+    assert schedule.total_kw.max() <= cost_schedule.total_kw.max()
+
+
+def test_cost_allocator_matches_reference_allocation():
+    from scripts.bench_cost_allocator import FixedPrices, SyntheticTelemetry, legacy_cost_allocation
+
+    kg = KGService()
+    kg.set_site_peak_limit_kw("D2", 45)
+    kg.add_blackout("D1", 0, 2)
+    curve = PriceService().get_prices(24)
+    base = TelemetryService().get_fleet_state()["vehicles"]
+    for telemetry in (TelemetryService(), SyntheticTelemetry(base, 300)):
+        opt = OptimizerService(kg=kg, telemetry=telemetry, prices=FixedPrices(curve))
+        schedule = opt.optimize(horizon_hours=24, objective="cost")
+        reference = legacy_cost_allocation(kg, telemetry.get_fleet_state()["vehicles"], curve)
+        assert schedule["per_vehicle"] == reference
+
+
+def test_milp_reports_build_and_solve_time_separately():
+    kg = KGService()
+    kg.add_blackout("D1", 0, 2)
+    opt = OptimizerMILP(kg=kg, telemetry=TelemetryService(), prices=PriceService())
+
+    schedule = opt.optimize(horizon_hours=24, objective="cost")
+
+    assert schedule.stats["build_seconds"] > 0 and schedule.stats["solve_seconds"] > 0
+    assert schedule.stats["variables"] > 0
+    assert (schedule.remaining_kwh <= 1e-6).all()
+    assert not schedule.depot_kw[schedule.depot_index["D1"], :2].any()
+    # per-charger assignment keeps every depot-hour within its budget
+    index = kg.compiled()
+    for depot_id, d in schedule.depot_index.items():
+        assert schedule.depot_kw[d].max() <= index.get_hour_budget_kw(depot_id) + 1e-6
+
+
+def test_milp_warm_start_reports_hint_objective():
+    kg = KGService()
+    telemetry = TelemetryService()
+    prices = PriceService()
+    greedy = OptimizerService(kg=kg, telemetry=telemetry, prices=prices).optimize(horizon_hours=24, objective="cost")
+    opt = OptimizerMILP(kg=kg, telemetry=telemetry, prices=prices)
+
+    schedule = opt.optimize(horizon_hours=24, objective="cost", initial_schedule=greedy)
+
+    assert "warm_start_objective" in schedule.stats
+    # the hint is feasible here, so the final incumbent can only be as good or better
+    assert schedule.stats["objective_value"] <= schedule.stats["warm_start_objective"] + 1e-6
+    assert schedule.stats["gap"] >= 0.0
+
+
+def test_assign_chargers_places_grants_on_distinct_chargers():
+    vehicles = {"D1": [{"id": "a", "connector": "ccs", "max_kw": 50}, {"id": "b", "connector": "ccs", "max_kw": 22}]}
+    chargers = {"D1": [{"id": "c1", "connector": "ccs", "max_kw": 22}, {"id": "c2", "connector": "ccs", "max_kw": 50}]}
+    kw = np.array([[40.0, 10.0], [20.0, 0.0]])
+
+    assignment = assign_chargers(kw, {"a": 0, "b": 1}, vehicles, chargers)
+
+    assert assignment == {("a", "c2", 0): 40.0, ("b", "c1", 0): 20.0, ("a", "c1", 1): 10.0}
+
+
+def test_depot_decomposed_milp_matches_monolithic_objective():
+    kg = KGService()
+    kg.add_blackout("D2", 0, 2)
+    opt = OptimizerMILP(kg=kg, telemetry=TelemetryService(), prices=PriceService(), workers=2)
+    try:
+        for objective in ("cost", "peak"):
+            mono = opt.optimize(horizon_hours=24, objective=objective)
+            split = opt.optimize(horizon_hours=24, objective=objective, decompose=True)
+            assert abs(mono.stats["objective_value"] - split.stats["objective_value"]) < 1e-4
+            assert split.stats["depots"] == 2.0
+            assert (split.remaining_kwh <= 1e-6).all()
+    finally:
+        opt.close()
+
+
+def test_pooled_milp_matches_per_charger_objective_with_concrete_chargers():
+    kg = KGService()
+    index = kg.compiled()
+    per_charger = OptimizerMILP(kg=kg, telemetry=TelemetryService(), prices=PriceService())
+    pooled = OptimizerMILP(kg=kg, telemetry=TelemetryService(), prices=PriceService(), pooled=True)
+
+    for objective in ("cost", "peak"):
+        full = per_charger.optimize(horizon_hours=24, objective=objective)
+        pools = pooled.optimize(horizon_hours=24, objective=objective)
+        assert abs(full.stats["objective_value"] - pools.stats["objective_value"]) < 1e-4
+        assert pools.stats["variables"] < full.stats["variables"]
+
+        # every allocation sits on a concrete charger of its depot, one vehicle per charger-hour
+        taken = set()
+        for v_id, hours in pools.chargers.items():
+            depot_id = pools.depot_ids[pools.vehicle_depot[pools.vehicle_index[v_id]]]
+            ids = {str(ch["id"]) for ch in index.chargers[depot_id]}
+            for h, c_id in hours.items():
+                assert c_id in ids and (c_id, h) not in taken
+                taken.add((c_id, h))
+        assert {(v, h) for v, hours in pools.chargers.items() for h in hours} == {
+            (v, h) for v, hours in pools.per_vehicle_dict().items() for h in hours
+        }
+
+
+def test_incremental_milp_patches_live_model_after_whatif_edits():
+    from scripts.bench_cost_allocator import FixedPrices
+
+    kg = KGService()
+    telemetry = TelemetryService()
+    prices = FixedPrices(PriceService().get_prices(24))
+    live = OptimizerMILP(kg=kg, telemetry=telemetry, prices=prices, incremental=True)
+    cold = OptimizerMILP(kg=kg, telemetry=telemetry, prices=prices)
+
+    first = live.optimize(horizon_hours=24, objective="peak")
+    # an unchanged repeat returns the live model's solution instead of re-solving it
+    for objective in ("peak", "cost", "cost"):
+        again = live.optimize(horizon_hours=24, objective=objective)
+        assert abs(again.stats["objective_value"] - cold.optimize(horizon_hours=24, objective=objective).stats["objective_value"]) < 1e-4
+    assert (live.optimize(horizon_hours=24, objective="peak").kw == first.kw).all()
+    # job threads share the live models: concurrent solves of different models each get their own
+    results = {}
+    threads = [
+        threading.Thread(target=lambda o=o: results.setdefault(o, live.optimize(horizon_hours=24, objective=o)))
+        for o in ("cost", "peak")
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results["peak"].kw.tolist() == first.kw.tolist() and "objective_value" in results["cost"].stats
+    edits = [
+        lambda: kg.add_blackout("D2", 3, 6),
+        lambda: kg.set_site_peak_limit_kw("D1", 40),
+        lambda: kg.remove_blackout("D2", 3, 6),
+        lambda: kg.clear_site_peak_override(),
+    ]
+    for n, edit in enumerate(edits, start=1):
+        edit()
+        patched = live.optimize(horizon_hours=24, objective="peak")
+        rebuilt = cold.optimize(horizon_hours=24, objective="peak")
+        assert patched.stats["model_updates"] == float(n)
+        assert patched.stats["variables"] == first.stats["variables"]
+        assert abs(patched.stats["objective_value"] - rebuilt.stats["objective_value"]) < 1e-4
+        if kg.is_blackout("D2", 3):
+            assert not patched.depot_kw[patched.depot_index["D2"], 3:6].any()
+        repeat = live.optimize(horizon_hours=24, objective="peak")
+        assert (repeat.kw == patched.kw).all() and repeat.stats["model_updates"] == float(n)
+
+    # dropping a KG view evicts the live models built on it
+    storm = kg.scenario("storm")
+    live.optimize(horizon_hours=24, objective="cost", kg=storm)
+    assert live.forget(kg.drop_scenario("storm")) == 1 and live.forget(storm) == 0
+    assert live.forget(kg) == 2
+
+
+def test_frontier_sweep_spans_peak_and_cost_optima():
+    from scripts.bench_cost_allocator import FixedPrices
+
+    kg = KGService()
+    prices = FixedPrices(PriceService().get_prices(24))
+    opt = OptimizerMILP(kg=kg, telemetry=TelemetryService(), prices=prices, workers=2)
+    try:
+        points = opt.frontier(horizon_hours=24, points=4)
+        mono_cost = opt.optimize(horizon_hours=24, objective="cost")
+        mono_peak = opt.optimize(horizon_hours=24, objective="peak")
+    finally:
+        opt.close()
+
+    caps = [s.stats["peak_cap_kw"] for s in points]
+    costs = [s.stats["objective_value"] for s in points]
+    assert len(points) == 4 and caps == sorted(caps)
+    assert all(a >= b - 1e-6 for a, b in zip(costs, costs[1:]))
+    for s in points:
+        assert s.depot_kw.max() <= s.stats["peak_cap_kw"] + 1e-6
+        assert (s.remaining_kwh <= 1e-6).all()
+    # the ends of the sweep are the two single-objective optima
+    assert abs(costs[-1] - mono_cost.stats["objective_value"]) < 1e-4
+    assert abs(caps[0] + 0.001 * costs[0] - mono_peak.stats["objective_value"]) < 1e-4
+
+
+def test_milp_batch_matches_single_runs_and_shares_depot_models():
+    from scripts.bench_cost_allocator import FixedPrices
+
+    kg = KGService()
+    base = kg.compiled()
+    prices = FixedPrices(PriceService().get_prices(24))
+    opt = OptimizerMILP(kg=kg, telemetry=TelemetryService(), prices=prices, workers=2)
+    runs = [
+        (24, "cost", base),
+        (24, "cost", base.with_whatif({"D1": 35})),
+        (24, "cost", base.with_whatif(blackouts=[("D2", 18, 20)])),
+        (24, "peak", base.with_whatif({"D1": 35})),
+        (24, "cost", base.with_whatif({"D1": 1})),
+    ]
+    try:
+        batch = opt.batch(runs)
+        singles = [opt.optimize(horizon_hours=h, objective=o, kg=index, decompose=True) for h, o, index in runs[:4]]
+    finally:
+        opt.close()
+
+    for got, want in zip(batch, singles):
+        assert abs(got.stats["objective_value"] - want.stats["objective_value"]) < 1e-4
+    # unchanged depots are solved once for every cost variant that shares them
+    assert batch[0].stats["batch_solved"] < batch[0].stats["batch_subproblems"]
+    assert isinstance(batch[4], Exception) and "D1" in str(batch[4])
+    assert kg.compiled() is base and not kg.blackouts.depots()
+
+
+def test_depot_scoped_resolve_matches_full_run():
+    kg = KGService()
+    telemetry = TelemetryService()
+    fleet = telemetry.get_fleet_state()["vehicles"]
+    price_curve = PriceService().get_prices(24)
+    opt = OptimizerService(kg=kg, telemetry=telemetry, prices=PriceService())
+    evaluator = EvaluationService()
+
+    for objective in ("cost", "peak"):
+        planner = DepotScopedPlanner(evaluator)
+
+        def run(depots):
+            return opt.optimize(24, objective=objective, fleet=fleet, price_curve=price_curve, depots=depots)
+
+        planner.plan(objective, run, kg.compiled(), fleet, price_curve)
+        kg.add_blackout("D2", 1, 5)
+        scoped, kpis = planner.plan(objective, run, kg.compiled(), fleet, price_curve)
+        full = run(None)
+        full_kpis = evaluator.compute_kpis(full, price_curve)
+        kg.clear_blackouts()
+
+        assert scoped.stats["resolved_depots"] == 1.0 and planner.stats()["scoped"] == 1.0
+        assert np.allclose(scoped.kw, full.kw)
+        for name in EvaluationService.KPI_FIELDS:
+            assert abs(kpis[name] - full_kpis[name]) < 1e-9
+        assert kpis["per_depot_peak_kw"] == full_kpis["per_depot_peak_kw"]
+        assert planner.forget(lambda key: key == objective) == 1 and planner.stats()["plans"] == 0.0
+
+
+def test_rolling_horizon_freezes_executed_hours_and_carries_need():
+    from scripts.bench_cost_allocator import FixedPrices
+
+    kg = KGService()
+    telemetry = TelemetryService()
+    prices = FixedPrices(PriceService().get_prices(24))
+    opt = OptimizerService(kg=kg, telemetry=telemetry, prices=prices)
+    planner = RollingHorizonPlanner(kg, telemetry, prices, opt, None, EvaluationService(), horizon_hours=24)
+    fleet = {v["id"]: v for v in telemetry.get_fleet_state()["vehicles"]}
+
+    first, _ = planner.replan(0)
+    planner.apply_delta(1, updates=[{"id": "v1", "required_kwh": 3.0}])
+    kg.add_blackout("D1", 3, 5)
+    second, _ = planner.replan(2)
+
+    assert second.stats["window_start"] == 2.0 and second.horizon == 24
+    for v_id in second.vehicle_ids:
+        if v_id == "v1":
+            expected = 3.0 - first.kw[first.vehicle_index[v_id], 1:2].sum()
+        else:
+            expected = fleet[v_id]["required_kwh"] - first.kw[first.vehicle_index[v_id], :2].sum()
+        row = second.vehicle_index[v_id]
+        assert abs(second.required_kwh[row] - max(expected, 0.0)) < 1e-9
+        # departures are shifted onto the window
+        assert not second.kw[row, fleet[v_id]["departure_hour"] - 2:].any()
+    assert set(second.vehicle_ids) == {v_id for v_id, v in fleet.items() if v["departure_hour"] > 2}
+    # absolute blackout [3, 5) is hours [1, 3) of the window
+    assert not second.depot_kw[second.depot_index["D1"], 1:3].any()
+
+
+def test_sub_hourly_slots_and_windowed_milp():
+    from scripts.bench_cost_allocator import FixedPrices
+
+    kg = KGService()
+    telemetry = TelemetryService()
+    prices = FixedPrices(PriceService().get_prices(24, slot_minutes=15))
+    curve = prices.get_prices(24, slot_minutes=15)
+    evaluator = EvaluationService()
+    fleet = telemetry.get_fleet_state()["vehicles"]
+
+    greedy = OptimizerService(kg=kg, telemetry=telemetry, prices=prices).optimize(24, slot_minutes=15)
+    assert greedy.horizon == 96 and greedy.slot_hours == 0.25
+    # a slot of g kW delivers g / 4 kWh, and nothing is granted after a departure
+    assert np.allclose(greedy.kw.sum(axis=1) * 0.25 + greedy.remaining_kwh, greedy.required_kwh)
+    for v in fleet:
+        assert not greedy.kw[greedy.vehicle_index[v["id"]], v["departure_hour"] * 4:].any()
+    assert abs(evaluator.compute_kpis(greedy, curve)["total_cost"] - float(greedy.total_kw @ curve) * 0.25) < 1e-9
+
+    opt = OptimizerMILP(kg=kg, telemetry=telemetry, prices=prices)
+    for objective in ("cost", "peak"):
+        full = opt.optimize(24, objective=objective, slot_minutes=15)
+        windowed = opt.optimize(24, objective=objective, slot_minutes=15, window_hours=8, overlap_hours=3)
+        full_kpis, windowed_kpis = evaluator.compute_kpis(full, curve), evaluator.compute_kpis(windowed, curve)
+
+        # windows left with nothing to charge are skipped
+        assert 1.0 <= windowed.stats["windows"] <= 5.0 and windowed.horizon == 96
+        assert windowed_kpis["on_time_pct"] == 100.0 and windowed_kpis["energy_shortfall_kwh"] == 0.0
+        # stitched charger assignments cover every committed slot
+        for v_id, slots in windowed.chargers.items():
+            assert set(slots) == set(np.flatnonzero(windowed.kw[windowed.vehicle_index[v_id]] > 1e-9).tolist())
+        if objective == "cost":
+            assert windowed_kpis["total_cost"] <= full_kpis["total_cost"] * 1.01
+        else:
+            assert windowed.depot_kw.max() <= full.depot_kw.max() * 1.25
+
+    # batch what-ifs and rolling re-plans run on the same slot grid and costs as optimize
+    single = opt.optimize(24, objective="cost", slot_minutes=15, decompose=True, incremental=False)
+    (batched,) = opt.batch([(24, "cost", kg)], fleet=fleet, slot_minutes=15)
+    assert batched.horizon == 96 and batched.slot_hours == 0.25
+    assert abs(batched.stats["objective_value"] - single.stats["objective_value"]) < 1e-4
+    planner = RollingHorizonPlanner(
+        kg, telemetry, prices, OptimizerService(kg=kg, telemetry=telemetry, prices=prices), opt, evaluator, slot_minutes=15
+    )
+    first, _ = planner.replan(0)
+    second, _ = planner.replan(2)
+    assert first.horizon == second.horizon == 96
+    for v in fleet:
+        row = first.vehicle_index[v["id"]]
+        left = v["required_kwh"] - first.kw[row, :8].sum() * 0.25
+        if v["departure_hour"] > 2:
+            assert abs(planner._need[v["id"]] - max(0.0, left)) < 1e-6
+    opt.close()
+
+
+def test_instance_generator_is_deterministic_and_bench_suite_flags_regressions():
+    from scripts.bench_suite import compare_results, format_run, run_suite
+
+    mix = {"ccs": 0.7, "type2": 0.3}
+    a, b = generate_instance(120, seed=5, connectors=mix), generate_instance(120, seed=5, connectors=mix)
+    assert a.vehicles.equals(b.vehicles) and a.chargers.equals(b.chargers) and a.blackouts == b.blackouts
+    assert a.summary()["depots"] == 3 and not generate_instance(120, seed=6).vehicles.equals(a.vehicles)
+    # every vehicle finds a charger with its connector at its depot
+    offered = set(zip(a.chargers["depot_id"], a.chargers["connector"]))
+    assert set(zip(a.vehicles["depot_id"], a.vehicles["connector"])) <= offered
+
+    results = run_suite([10, 40], backends=("greedy", "milp"), objectives=("cost",), repeat=1, milp_max_vehicles=10, workers=1, log=None)
+    assert [(r["backend"], r["vehicles"]) for r in results["runs"]] == [("greedy", 10), ("milp", 10), ("greedy", 40)]
+    assert results["runs"][1]["variables"] > 0 and results["runs"][1]["quality"]["total_cost"] <= results["runs"][0]["quality"]["total_cost"] + 1e-6
+    assert compare_results(results, results) == []
+    baseline = json.loads(json.dumps(results))
+    baseline["runs"][2]["quality"]["total_cost"] *= 0.5
+    baseline["runs"][2]["wall_s"] = results["runs"][2]["wall_s"] / 10
+    regressions = compare_results(results, baseline, min_seconds=0.0)
+    assert len(regressions) == 2 and all(r.startswith("greedy cost 40 vehicles") for r in regressions)
+    # infeasible runs carry no timings: flagged against a solved baseline, skipped as the baseline
+    failed = dict(results, runs=[dict(results["runs"][1], status="infeasible", error="MILP did not find a feasible solution")])
+    assert "infeasible" in format_run(failed["runs"][0])
+    assert compare_results(failed, results) == ["milp cost 10 vehicles: infeasible (MILP did not find a feasible solution), solved in the baseline"]
+    assert compare_results(results, failed) == []
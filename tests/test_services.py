@@ -1,4 +1,20 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
 from services.price_service import PriceService
+from services.blackout_calendar import BlackoutCalendar
+from services.kg_service import KGService, KGView
+from services.evaluation_service import EvaluationService
+from services.fleet_store import FleetStore
+from services.job_service import BATCH, INTERACTIVE, JobService
+from services.result_cache import ResultCache, approx_nbytes, scenario_fingerprint
+from services.single_flight import SingleFlight
+from services.snapshot import Snapshot
+from services.telemetry_service import TelemetryService
+from services.telemetry_stream import TelemetryStream
 
 
 def test_price_curve_length_and_bounds():
@@ -7,3 +23,362 @@ def test_price_curve_length_and_bounds():
     assert len(curve) == 24
     for p in curve:
         assert 0.0 < p < 1.0
+
+
+def test_tariff_engine_pins_start_memoizes_and_loads_day_ahead(tmp_path):
+    prices = PriceService()
+    start = datetime(2024, 5, 1, 5, 50, tzinfo=timezone.utc)
+    curve = prices.get_prices(24, 15, start=start)
+    # pinned to the slot boundary; the time-of-use bands by hour of day
+    assert curve.start == datetime(2024, 5, 1, 5, 45, tzinfo=timezone.utc)
+    assert len(curve) == 96 and curve[0] == 0.12 and curve[1] == 0.20 and curve[4 * 13] == 0.32
+    assert not curve.array.flags.writeable and list(curve.array) == list(curve)
+    assert prices.get_prices(24, 15, start=start.replace(minute=59)) is curve
+    assert prices.get_prices(24, start=start) is not curve
+
+    path = tmp_path / "day_ahead.csv"
+    path.write_text("timestamp,price\n2024-05-01T06:00:00Z,0.05\n2024-05-01T07:00:00Z,0.50\n")
+    assert prices.load_day_ahead(str(path)) == 2
+    day_ahead = prices.get_prices(4, start=start, tariff="day_ahead")
+    # slots outside the file fall back to the time-of-use table
+    assert list(day_ahead) == [0.12, 0.05, 0.50, 0.20]
+    assert json.loads(json.dumps(day_ahead)) == list(day_ahead)
+
+
+def test_evaluation_accepts_legacy_schedule_dict():
+    schedule = {
+        "per_vehicle": {"v1": {0: 10.0, 1: 5.0}, "v2": {1: 20.0}},
+        "per_depot": {"D1": {0: 10.0, 1: 25.0}},
+        "remaining_kwh": {"v1": 0.0, "v2": 4.0},
+        "price_curve": [0.1, 0.2],
+    }
+    kpis = EvaluationService().compute_kpis(schedule, price_curve=[0.1, 0.2])
+    assert abs(kpis["total_cost"] - (10.0 * 0.1 + 25.0 * 0.2)) < 1e-9
+    assert kpis["peak_kw"] == 25.0
+    assert kpis["on_time_pct"] == 50.0
+
+
+def test_kpi_batch_matches_single_evaluation():
+    schedule = {
+        "per_vehicle": {"v1": {0: 10.0, 1: 5.0}, "v2": {1: 20.0, 2: 6.0}},
+        "per_depot": {"D1": {0: 10.0, 1: 25.0, 2: 6.0}},
+        "remaining_kwh": {"v1": 0.0, "v2": 4.0},
+    }
+    other = {"per_vehicle": {"v1": {2: 15.0}}, "remaining_kwh": {"v1": 0.0}}
+    curves = [[0.1, 0.2, 0.3], [0.3, 0.2], [0.12] * 4]
+    svc = EvaluationService()
+
+    tensor = svc.compute_kpis_batch([schedule, other], curves)
+
+    assert tensor.shape == (2, 3, len(EvaluationService.KPI_FIELDS))
+    for n, sched in enumerate([schedule, other]):
+        for m, curve in enumerate(curves):
+            single = svc.compute_kpis(sched, price_curve=curve)
+            for k, name in enumerate(EvaluationService.KPI_FIELDS):
+                assert abs(tensor[n, m, k] - single[name]) < 1e-9
+    # a shorter curve only scores the hours it covers
+    assert abs(tensor[0, 1, 0] - (10.0 * 0.3 + 25.0 * 0.2)) < 1e-9
+    assert tensor[0, 1, 1] == 25.0
+    assert svc.compute_kpis(schedule, price_curve=curves[0])["energy_shortfall_kwh"] == 4.0
+
+
+def test_kg_index_is_versioned_and_patched_on_overrides():
+    kg = KGService()
+    base = kg.compiled()
+    assert kg.compiled() is base
+    assert base.get_total_capacity_kw("D1") == 94.0
+    assert base.get_max_concurrent_chargers("D1") == 3
+    assert list(base.connector_groups["D1"]["CCS"]) == [0, 1, 2]
+
+    kg.set_site_peak_limit_kw("D1", 40)
+    patched = kg.compiled()
+    assert patched is not base and patched.version > base.version
+    assert patched.get_site_peak_limit_kw("D1") == 40.0
+    # earlier snapshots stay untouched for caches keyed on their version
+    assert base.get_site_peak_limit_kw("D1") == 60.0
+
+    kg.clear_site_peak_override("D1")
+    assert kg.get_site_peak_limit_kw("D1") == 60.0
+    assert kg.compiled().version > patched.version
+
+    # concurrent edits and reads never lose a version bump; lookups go through the index
+    before = kg.compiled().version
+    workers = [threading.Thread(target=kg.set_site_peak_limit_kw, args=(f"X{i}", 10 + i)) for i in range(8)]
+    # blackout edits apply and bump under one lock: every window lands and every index is whole
+    workers += [threading.Thread(target=kg.add_blackout, args=("D1", 2 * h, 2 * h + 1)) for h in range(8)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    assert kg.compiled().version == before + 16 and kg.compiled().get_site_peak_limit_kw("X7") == 17.0
+    assert kg.available_mask("D1", 16).tolist() == [False, True] * 8
+    kg.add_blackout("D2", 2, 4)
+    assert kg.is_blackout("D2", 3) and list(kg.available_mask("D2", 5)) == [True, True, False, False, True]
+    kg.clear_blackouts()
+    kg.clear_site_peak_override()
+
+
+def test_blackout_calendar_merges_and_answers_masks():
+    cal = BlackoutCalendar()
+    cal.add("D1", 18, 20)
+    cal.add("D1", 19, 22)
+    cal.add("D1", 2, 4)
+    assert cal.windows("D1") == [(2, 4), (18, 22)]
+    assert cal.is_blackout("D1", 21) and not cal.is_blackout("D1", 22)
+    assert not cal.is_blackout("D2", 19)
+
+    cal.remove("D1", 19, 20)
+    assert cal.windows("D1") == [(2, 4), (18, 19), (20, 22)]
+    avail = cal.available_hours("D1", 24)
+    assert 18 not in avail and 19 in avail and len(avail) == 24 - 5
+
+    other = BlackoutCalendar()
+    other.add("D1", 0, 3)
+    assert cal.intersection(other).windows("D1") == [(2, 3)]
+    assert cal.union(other).windows("D1")[0] == (0, 4)
+    cal.intersect("D1", [(0, 19)])
+    assert cal.windows("D1") == [(2, 4), (18, 19)]
+
+
+def test_job_service_runs_interactive_before_batch_and_cancels():
+    jobs = JobService(max_workers=1)
+    gate = threading.Event()
+    order = []
+    try:
+        blocker = jobs.submit(gate.wait, 5, kind="blocker")
+        batch = jobs.submit(order.append, "batch", priority=BATCH)
+        dropped = jobs.submit(order.append, "dropped", priority=BATCH)
+        interactive = jobs.submit(order.append, "interactive", priority=INTERACTIVE)
+        assert jobs.cancel(dropped.id)
+        gate.set()
+        batch.future.result(timeout=5)
+        interactive.future.result(timeout=5)
+
+        assert order == ["interactive", "batch"]
+        assert blocker.status == "done" and dropped.status == "cancelled"
+        assert not jobs.cancel(batch.id)
+        failing = jobs.submit(int, "x")
+        try:
+            failing.future.result(timeout=5)
+        except ValueError:
+            pass
+        assert failing.status == "failed" and failing.error
+        assert jobs.stats()["done"] == 3
+    finally:
+        jobs.shutdown()
+
+
+def test_result_cache_lru_ttl_and_memory_cap():
+    cache = ResultCache(max_entries=2, ttl_seconds=60, max_bytes=100)
+    cache.put("a", 1, nbytes=40)
+    cache.put("b", 2, nbytes=40)
+    assert cache.get("a") == 1  # a is now most recently used
+    cache.put("c", 3, nbytes=40)  # over the byte cap: evicts b
+    assert cache.get("b") is None and cache.get("c") == 3
+    cache.put("huge", 4, nbytes=1000)  # larger than the whole cache: not stored
+    assert cache.get("huge") is None
+    kpis = {"total_cost": 1.0, "peak_kw": 2.0}
+    assert approx_nbytes((kpis, kpis)) > 2 * approx_nbytes(kpis) > approx_nbytes({})
+
+    cache.ttl_seconds = -1.0
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["expired"]) == (2.0, 3.0, 1.0, 1.0)
+
+    assert scenario_fingerprint(24, "cost", [0.1, 0.2]) == scenario_fingerprint(24, "cost", [0.1, 0.2])
+    assert scenario_fingerprint(24, "cost", [0.1, 0.2]) != scenario_fingerprint(24, "peak", [0.1, 0.2])
+
+
+def test_kg_fingerprint_tracks_content_not_version():
+    kg = KGService()
+    base = kg.compiled().fingerprint()
+    kg.add_blackout("D1", 2, 4)
+    assert kg.compiled().fingerprint() != base
+    kg.remove_blackout("D1", 2, 4)
+    assert kg.compiled().version == 2 and kg.compiled().fingerprint() == base
+
+
+def test_kg_scenarios_copy_on_write_over_base():
+    kg = KGService()
+    kg.add_blackout("D1", 0, 2)
+    storm = kg.scenario("storm")
+    assert kg.scenario("storm") is storm and kg.scenario() is kg
+    assert storm.compiled() is kg.compiled()  # no edits yet: shares the base index
+
+    storm.set_site_peak_limit_kw("D1", 15)
+    assert storm.get_site_peak_limit_kw("D1") == 15 and kg.get_site_peak_limit_kw("D1") != 15
+    kg.add_blackout("D2", 5, 6)  # blackouts not written by the scenario still read through
+    assert storm.is_blackout("D1", 1) and storm.is_blackout("D2", 5)
+
+    storm.clear_blackouts("D2")  # first write copies them; the base keeps its own
+    assert not storm.is_blackout("D2", 5) and kg.is_blackout("D2", 5)
+    assert storm.compiled().fingerprint() != kg.compiled().fingerprint()
+    assert kg.drop_scenario("storm") and kg.scenario_names() == ["default"]
+
+    class ReadOnlyView(KGView):
+        def compiled(self):
+            return kg.compiled()
+
+    try:
+        ReadOnlyView()  # lacks the write hooks: refused up front, not mid-solve
+        assert False, "incomplete KGView was created"
+    except TypeError:
+        pass
+
+
+def test_telemetry_delta_updates_soc_arrivals_and_departures():
+    telemetry = TelemetryService()
+    before = {v["id"]: v for v in telemetry.get_fleet_state()["vehicles"]}
+    v1 = before["v1"]
+    arrival = dict(before["v2"], id="v100", departure_hour=20)
+
+    touched = telemetry.apply_delta(updates=[{"id": "v1", "soc": v1["soc0"] + 0.1}], arrivals=[arrival], departures=["v3"])
+    after = {v["id"]: v for v in telemetry.get_fleet_state()["vehicles"]}
+
+    assert touched == ["v1", "v100", "v3"] and telemetry.version == 1
+    assert abs(after["v1"]["required_kwh"] - (v1["required_kwh"] - 0.1 * v1["battery_kwh"])) < 1e-9
+    assert "v3" not in after and after["v100"]["departure_hour"] == 20
+    try:
+        telemetry.apply_delta(updates=[{"id": "nope", "soc": 0.5}])
+        assert False, "unknown vehicle accepted"
+    except ValueError:
+        assert telemetry.version == 1
+
+
+def test_fleet_store_is_cached_columnar_and_matches_records():
+    telemetry = TelemetryService()
+    store = telemetry.fleet_store()
+    assert telemetry.fleet_store() is store
+    vehicles = telemetry.get_fleet_state()["vehicles"]
+    assert vehicles is store.records() and vehicles[0] is vehicles[0]
+    assert not store.required_kwh.flags.writeable
+
+    rebuilt = FleetStore.from_records([dict(v) for v in vehicles])
+    assert rebuilt.fingerprint() == store.fingerprint() and rebuilt.records() == vehicles
+    assert list(store.required_kwh) == [v["required_kwh"] for v in vehicles]
+    for depot_id, rows in store.depot_rows().items():
+        assert [store.ids[r] for r in rows] == [v["id"] for v in vehicles if v["depot_id"] == depot_id]
+    d2 = store.select(["D2"])
+    assert set(d2.depots) == {"D2"} and d2.records() == [v for v in vehicles if v["depot_id"] == "D2"]
+
+    telemetry.apply_delta(departures=[vehicles[0]["id"]])
+    assert telemetry.fleet_store() is not store and len(telemetry.fleet_store()) == len(store) - 1
+    assert telemetry.get_fleet_state()["vehicles"] != vehicles
+
+
+def test_binary_snapshot_loads_mapped_and_detects_staleness(tmp_path):
+    telemetry, kg = TelemetryService(), KGService()
+    sources = {"vehicles": telemetry.vehicles_path, "chargers": kg.chargers_path}
+    tables = {"vehicles": telemetry.fleet_store().to_frame(), "chargers": kg._chargers_df}
+    snapshot = Snapshot.write(str(tmp_path / "snap"), tables, sources=sources, categorical=("depot_id", "connector"))
+    assert snapshot.verify() == [] and snapshot.is_fresh("vehicles", telemetry.vehicles_path)
+
+    mapped = TelemetryService(snapshot_dir=snapshot.path)
+    assert mapped.source == "snapshot" and telemetry.source == "csv"
+    assert mapped.fleet_store().fingerprint() == telemetry.fleet_store().fingerprint()
+    assert mapped.get_fleet_state()["vehicles"] == telemetry.get_fleet_state()["vehicles"]
+    assert KGService(snapshot_dir=snapshot.path).compiled().fingerprint() == kg.compiled().fingerprint()
+
+    edited = tmp_path / "vehicles.csv"
+    edited.write_text(open(telemetry.vehicles_path).read().replace("v1,60,", "v1,70,"))
+    assert not snapshot.is_fresh("vehicles", str(edited))
+
+    # rebuilding while a reader maps the columns: new generation files, the old mapping stays valid
+    held = snapshot.table("vehicles").columns["soc0"]
+    before = held.tolist()
+    tables["vehicles"] = tables["vehicles"].assign(soc0=0.5)
+    rebuilt = [Snapshot.write(snapshot.path, tables, sources=sources) for _ in range(2)][-1]
+    assert held.tolist() == before and (Snapshot.open(snapshot.path).table("vehicles").columns["soc0"] == 0.5).all()
+    assert rebuilt.manifest["generation"] == 3 and not (tmp_path / "snap" / "vehicles.soc0.g1.npy").exists()
+    assert (tmp_path / "snap" / "vehicles.soc0.g2.npy").exists()
+
+    with open(tmp_path / "snap" / "vehicles.soc0.g3.npy", "r+b") as f:
+        f.seek(-1, 2)
+        f.write(b"\x01")
+    assert rebuilt.verify() == ["vehicles.soc0.g3.npy"]
+
+
+def test_telemetry_stream_tails_jsonl_feed_in_batches(tmp_path):
+    telemetry = TelemetryService()
+    before = {v["id"]: v for v in telemetry.get_fleet_state()["vehicles"]}
+    feed = tmp_path / "events.jsonl"
+    events = [
+        {"type": "update", "id": "v1", "soc": before["v1"]["soc0"] + 0.1},
+        {"type": "departure", "id": "v3"},
+        {"type": "update", "id": "nope", "soc": 0.5},
+        dict(before["v2"], type="arrival", id="v100"),
+    ]
+    feed.write_text("".join(json.dumps(e) + "\n" for e in events) + "not json\n" + '{"type": "departure", "id": "v4"')
+    stream = TelemetryStream(telemetry, batch_size=2, max_delay_s=0.01, poll_s=0.01).follow(str(feed))
+    try:
+        deadline = time.monotonic() + 5
+        while stream.stats()["malformed"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert stream.flush(timeout=5)
+        after = {v["id"]: v for v in telemetry.get_fleet_state()["vehicles"]}
+        assert abs(after["v1"]["required_kwh"] - (before["v1"]["required_kwh"] - 0.1 * before["v1"]["battery_kwh"])) < 1e-9
+        assert "v3" not in after and "v100" in after and "v4" in after  # the partial last line waits
+        stats = stream.stats()
+        assert stats["applied"] == 3 and stats["rejected"] == 1 and stats["batches"] >= 2
+        assert stats["version"] == telemetry.version >= 2
+
+        with open(feed, "a") as f:
+            f.write("}\n")
+        stream.submit([{"type": "departure", "id": "v5"}])
+        deadline = time.monotonic() + 5
+        while stream.stats()["received"] < 6 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert stream.flush(timeout=5)
+        after = {v["id"] for v in telemetry.get_fleet_state()["vehicles"]}
+        assert not {"v4", "v5"} & after and telemetry.version > stats["version"]
+
+        # rotated away: the reader survives the missing path and reads the new file from the start
+        feed.unlink()
+        time.sleep(0.05)
+        feed.write_text(json.dumps({"type": "departure", "id": "v6"}) + "\n")
+        deadline = time.monotonic() + 5
+        while stream.stats()["received"] < 7 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert stream.flush(timeout=5)
+        assert "v6" not in {v["id"] for v in telemetry.get_fleet_state()["vehicles"]}
+
+        # rotated by rename, the new file already longer than the old offset: read from its start
+        rotated = tmp_path / "events.jsonl.new"
+        rotated.write_text("".join(json.dumps({"type": "departure", "id": v}) + "\n" for v in ("v7", "v8", "v9", "v100")))
+        rotated.replace(feed)
+        deadline = time.monotonic() + 5
+        while stream.stats()["received"] < 11 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert stream.flush(timeout=5)
+        assert not {"v7", "v8", "v9", "v100"} & {v["id"] for v in telemetry.get_fleet_state()["vehicles"]}
+    finally:
+        stream.close()
+
+
+def test_single_flight_shares_one_run_between_identical_callers():
+    flight = SingleFlight()
+    calls = []
+
+    async def solve(tag):
+        calls.append(tag)
+        await asyncio.sleep(0.01)
+        if tag == "bad":
+            raise ValueError("infeasible")
+        return {"tag": tag}
+
+    async def main():
+        results = await asyncio.gather(
+            *[flight.run("scenario-a", lambda: solve("a")) for _ in range(4)],
+            flight.run("scenario-b", lambda: solve("b")),
+            *[flight.run("scenario-c", lambda: solve("bad")) for _ in range(2)],
+            return_exceptions=True,
+        )
+        again = await flight.run("scenario-a", lambda: solve("a"))
+        return results, again
+
+    results, again = asyncio.run(main())
+    assert results[0] is results[3] and results[4] == {"tag": "b"}
+    assert all(isinstance(r, ValueError) for r in results[5:])
+    # a finished key is forgotten, so the next call runs again
+    assert again == {"tag": "a"} and calls == ["a", "b", "bad", "a"]
+    assert flight.stats() == {"in_flight": 0.0, "leaders": 4.0, "coalesced": 4.0}